@@ -0,0 +1,23 @@
+/*
+ * Id of this page load, sent with every callback request (see
+ * cancellation.py): a newer request only cancels the stale callbacks of the
+ * same tab, not those of the other tabs of the browser.
+ */
+(function () {
+    const HEADER = 'X-App-View-Page';
+    const UPDATE_PATH = '_dash-update-component';
+    const page = window.crypto && window.crypto.randomUUID
+        ? window.crypto.randomUUID().replace(/-/g, '')
+        : Math.random().toString(16).slice(2) + Date.now().toString(16);
+    const fetch = window.fetch;
+
+    window.fetch = function (input, init) {
+        const url = typeof input === 'string' ? input : (input && input.url) || String(input);
+        if (url.indexOf(UPDATE_PATH) === -1) {
+            return fetch.call(this, input, init);
+        }
+        const headers = new Headers((init && init.headers) || {});
+        headers.set(HEADER, page);
+        return fetch.call(this, input, Object.assign({}, init, {headers}));
+    };
+})();
@@ -0,0 +1,261 @@
+/*
+ * Clientside figures of the events dashboard. The per-event data is sent once
+ * by update_event_data (dashboard_events.get_client_data), a change of
+ * updateno or osversion is then filtered and re-binned in the browser.
+ */
+(function () {
+    const TYPED_ARRAYS = {
+        f4: Float32Array, f8: Float64Array, i1: Int8Array, u1: Uint8Array,
+        i2: Int16Array, u2: Uint16Array, i4: Int32Array, u4: Uint32Array,
+    };
+    const ALERTS = [
+        [1, 'Red Alert', '#FF0000'],
+        [2, 'Orange Alert', '#FFA500'],
+        [3, 'Green Alert', '#008000'],
+        [null, 'Quick Notification', '#0000FF'],
+    ];
+    const decoded = new WeakMap();
+
+    // Same switch to WebGL as figures.scatter()
+    function scatterType(data, points) {
+        return data.styles.webgl_min && points >= data.styles.webgl_min ? 'scattergl' : 'scatter';
+    }
+
+    function decode(column) {
+        if (Array.isArray(column)) {
+            return column;
+        }
+        const bytes = Uint8Array.from(atob(column.bdata), (c) => c.charCodeAt(0));
+        return new TYPED_ARRAYS[column.dtype](bytes.buffer);
+    }
+
+    // The columns are decoded once per event
+    function columns(data) {
+        if (!decoded.has(data)) {
+            const result = {};
+            Object.entries(data.columns).forEach(([name, column]) => {
+                result[name] = decode(column);
+            });
+            result.length = result.updateno.length;
+            decoded.set(data, result);
+        }
+        return decoded.get(data);
+    }
+
+    // Same interpolation as pandas' Series.quantile
+    function quantile(values, q) {
+        const sorted = Float64Array.from(values).sort();
+        if (!sorted.length) {
+            return NaN;
+        }
+        const position = (sorted.length - 1) * q;
+        const low = Math.floor(position);
+        const high = Math.ceil(position);
+        return sorted[low] + (sorted[high] - sorted[low]) * (position - low);
+    }
+
+    function rows(cols, keep) {
+        const result = [];
+        for (let i = 0; i < cols.length; i++) {
+            if (keep(i)) {
+                result.push(i);
+            }
+        }
+        return result;
+    }
+
+    function pick(column, indices) {
+        return indices.map((i) => column[i]);
+    }
+
+    // Spread arguments would overflow the stack on large events
+    function max(values) {
+        return values.reduce((a, b) => (b > a ? b : a), -Infinity);
+    }
+
+    function min(values) {
+        return values.reduce((a, b) => (b < a ? b : a), Infinity);
+    }
+
+    // Layout tagged like i18n.tag_figure() so that it follows language changes.
+    // The zoom and pan of the user are kept while the event does not change.
+    function layout(data, labels, attributes) {
+        return Object.assign({template: data.styles.template, meta: {i18n: labels}, uirevision: data.eventid}, attributes);
+    }
+
+    const events = {
+        osversionOptions: function (updateno, data) {
+            if (!data || updateno === null || updateno === undefined) {
+                return [[], null];
+            }
+            return [[{label: 'All', value: 'all'}, {label: 'Android', value: 'android'}, {label: 'iOS', value: 'ios'}], 'all'];
+        },
+
+        delayAndAlerts: function (data, updateno, osversion, language, translations) {
+            if (!data || updateno === null || updateno === undefined) {
+                return [{}, {}];
+            }
+            const trans = translations[language];
+            const cols = columns(data);
+            const valid = new Set(data.valid_updatenos);
+            const osCode = osversion && osversion !== 'all' ? data.osversions.indexOf(osversion.toLowerCase()) : null;
+            const selected = rows(cols, (i) => osCode === null || cols.osversion[i] === osCode);
+
+            // Histogram of the delays by updateno, up to the 95th percentile
+            let filtered = selected.filter((i) => (updateno === 'all' ? valid.has(cols.updateno[i]) : cols.updateno[i] === updateno));
+            filtered = filtered.filter((i) => !Number.isNaN(cols.delay[i]));
+            const p95 = quantile(pick(cols.delay, filtered), 0.95);
+            filtered = filtered.filter((i) => cols.delay[i] <= p95);
+
+            const delays = pick(cols.delay, filtered);
+            const binWidth = 0.5;
+            const nbins = delays.length ? Math.ceil((max(delays) - min(delays)) / binWidth + 1) : 0;
+            const groups = new Map();
+            filtered.forEach((i) => {
+                const key = cols.updateno[i];
+                if (!groups.has(key)) {
+                    groups.set(key, []);
+                }
+                groups.get(key).push(cols.delay[i]);
+            });
+            const delayTraces = Array.from(groups.entries()).map(([key, x], index) => ({
+                type: 'histogram', x: x, name: String(key), legendgroup: String(key), offsetgroup: String(key),
+                alignmentgroup: 'True', bingroup: 'x', nbinsx: nbins, orientation: 'v', showlegend: true,
+                marker: {color: data.styles.colors[index % data.styles.colors.length], opacity: 0.5},
+                hovertemplate: `${trans.update}=${key}<br>${trans.delay}=%{x}<br>count=%{y}<extra></extra>`,
+            }));
+            const figDelay = {
+                data: delayTraces,
+                layout: layout(data, {
+                    'layout.title.text': 'delay_distribution_title',
+                    'layout.xaxis.title.text': 'delay',
+                    'layout.yaxis.title.text': 'number_of_users',
+                    'layout.legend.title.text': 'update',
+                }, {
+                    title: {text: trans.delay_distribution_title},
+                    xaxis: {title: {text: trans.delay}, range: [-1, 120]},
+                    yaxis: {title: {text: trans.number_of_users}},
+                    legend: {title: {text: trans.update}, tracegroupgap: 0},
+                    barmode: 'overlay',
+                }),
+            };
+
+            // Notification types of the valid updatenos
+            const alerts = selected.filter((i) => valid.has(cols.updateno[i]));
+            const alertTraces = [];
+            ALERTS.forEach(([code, name, color]) => {
+                const known = ALERTS.map((alert) => alert[0]).filter((value) => value !== null);
+                const x = alerts.filter((i) => (code === null ? !known.includes(cols.alert[i]) : cols.alert[i] === code)).map((i) => cols.updateno[i]);
+                if (x.length) {
+                    alertTraces.push({
+                        type: 'histogram', x: x, name: name, legendgroup: name, offsetgroup: name,
+                        alignmentgroup: 'True', bingroup: 'x', orientation: 'v', showlegend: true,
+                        marker: {color: color},
+                        hovertemplate: `alert_category=${name}<br>updateno=%{x}<br>count=%{y}<extra></extra>`,
+                    });
+                }
+            });
+            const figAlert = {
+                data: alertTraces,
+                layout: layout(data, {
+                    'layout.title.text': 'alert_types_title',
+                    'layout.xaxis.title.text': 'update_number',
+                    'layout.yaxis.title.text': 'number_of_users',
+                }, {
+                    title: {text: trans.alert_types_title},
+                    xaxis: {title: {text: trans.update_number}, type: 'linear', tickmode: 'linear', dtick: 1},
+                    yaxis: {title: {text: trans.number_of_users}},
+                    legend: {title: {text: 'alert_category'}, tracegroupgap: 0},
+                    barmode: 'stack',
+                    bargap: 0.2,
+                }),
+            };
+            return [figDelay, figAlert];
+        },
+
+        swavearrival: function (data, updateno, language, translations, previousMap) {
+            if (!data || updateno === null || updateno === undefined) {
+                return [{}, {}];
+            }
+            const trans = translations[language];
+            const cols = columns(data);
+            const epicenter = data.epicenter;
+
+            const [mapLow, mapHigh] = data.swave_ranges.map;
+            const [low, high] = data.swave_ranges.counted;
+            const located = rows(cols, (i) => cols.updateno[i] === updateno &&
+                cols.swavearrival[i] >= mapLow && cols.swavearrival[i] <= mapHigh &&
+                !Number.isNaN(cols.lat[i]) && !Number.isNaN(cols.lon[i]));
+            const swave = pick(cols.swavearrival, located);
+
+            const figMap = {
+                data: [{
+                    type: 'scattermapbox', mode: 'markers', name: `Updateno ${updateno}`,
+                    lat: pick(cols.lat, located), lon: pick(cols.lon, located), text: swave,
+                    marker: {
+                        size: 6, color: swave, colorscale: data.styles.colorscale, symbol: 'circle',
+                        colorbar: {title: {text: 'swavearrival (s)'}, x: 0.5, y: -0.1, orientation: 'h', thickness: 15},
+                    },
+                }, {
+                    type: 'scattermapbox', mode: 'markers', name: 'Epicenter',
+                    lat: [epicenter.lat], lon: [epicenter.lon], text: 'Mag: ' + epicenter.magnitude,
+                    marker: {size: 20, color: 'black', symbol: 'circle'},
+                }],
+                layout: layout(data, {'layout.title.text': 'swave_map_title'}, {
+                    mapbox: {center: {lat: epicenter.lat, lon: epicenter.lon}, zoom: 5, style: 'carto-positron'},
+                    margin: {l: 0, r: 0, t: 0, b: 0},
+                    title: {text: trans.swave_map_title},
+                }),
+            };
+            // Another updateno of the same event only replaces the traces, the
+            // layout and the mapbox view already in the browser are reused
+            if (previousMap && previousMap.layout && previousMap.layout.uirevision === data.eventid) {
+                figMap.layout = previousMap.layout;
+            }
+
+            // Epicentral distance vs swavearrival
+            const points = located.filter((i) => cols.swavearrival[i] >= low && cols.swavearrival[i] <= high);
+            const distances = pick(cols.epi_distance, points);
+            const arrivals = pick(cols.swavearrival, points);
+            // One pass over the points for the colours and the counts, the
+            // sign of the arrival is stored with the enriched notifications
+            const signs = pick(cols.swave_sign, points);
+            const lineColors = new Array(arrivals.length);
+            let before = 0;
+            for (let i = 0; i < arrivals.length; i++) {
+                lineColors[i] = signs[i] < 0 ? 'red' : 'green';
+                before += signs[i] >= 0 ? 1 : 0;
+            }
+            const after = arrivals.length - before;
+            const percentageBefore = points.length ? Math.round((before / points.length) * 100) : 0;
+            const percentageAfter = points.length ? Math.round((after / points.length) * 100) : 0;
+            const format = (key, percentage) => trans[key].replace('{percentage}', percentage);
+
+            const figGraph = {
+                data: [{
+                    type: scatterType(data, points.length), mode: 'markers', name: `Updateno ${updateno}`, x: distances, y: arrivals,
+                    marker: {size: 6, color: 'white', line: {width: 1, color: lineColors}},
+                }],
+                layout: layout(data, {
+                    'layout.title.text': 'swave_distance_title',
+                    'layout.xaxis.title.text': 'epicentral_distance',
+                    'layout.yaxis.title.text': 'swave_arrival_time',
+                    'layout.annotations.0.text': ['swave_before', {percentage: String(percentageBefore)}],
+                    'layout.annotations.1.text': ['swave_after', {percentage: String(percentageAfter)}],
+                }, {
+                    shapes: distances.length ? [{type: 'line', x0: 0, y0: 0, x1: max(distances), y1: 0, line: {color: 'black', width: 2}}] : [],
+                    annotations: [
+                        {xref: 'paper', yref: 'paper', x: 0.5, y: 1.1, showarrow: false, text: format('swave_before', percentageBefore), font: {color: 'green'}},
+                        {xref: 'paper', yref: 'paper', x: 0.5, y: 1.05, showarrow: false, text: format('swave_after', percentageAfter), font: {color: 'red'}},
+                    ],
+                    xaxis: {title: {text: trans.epicentral_distance}, range: [0, 120]},
+                    yaxis: {title: {text: trans.swave_arrival_time}, range: [-30, 60]},
+                    title: {text: trans.swave_distance_title},
+                }),
+            };
+            return [figMap, figGraph];
+        },
+    };
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {events: events});
+})();
@@ -0,0 +1,80 @@
+/*
+ * Clientside relabelling of the dashboards when the language changes, see
+ * i18n.py. Nothing is requested from the server.
+ */
+(function () {
+    function translate(translations, language, label) {
+        const [key, params] = Array.isArray(label) ? label : [label, {}];
+        const template = (translations[language] || {})[key];
+        if (template === undefined) {
+            return undefined;
+        }
+        return template.replace(/\{(\w+)\}/g, (match, name) => (name in params ? params[name] : match));
+    }
+
+    // Copy of `node` with `value` at `keys`, everything else is shared
+    function setPath(node, keys, value) {
+        const copy = Array.isArray(node) ? node.slice() : Object.assign({}, node);
+        const [key, ...rest] = keys;
+        copy[key] = rest.length ? setPath(copy[key] || {}, rest, value) : value;
+        return copy;
+    }
+
+    // Returns the relabelled children, or undefined when nothing changed
+    function relabel(translations, language, children) {
+        if (Array.isArray(children)) {
+            let changed = false;
+            const result = children.map((child) => {
+                const relabelled = relabel(translations, language, child);
+                changed = changed || relabelled !== undefined;
+                return relabelled === undefined ? child : relabelled;
+            });
+            return changed ? result : undefined;
+        }
+        if (!children || typeof children !== 'object' || !children.props) {
+            return undefined;
+        }
+        const props = children.props;
+        if (props['data-i18n']) {
+            const params = JSON.parse(props['data-params'] || '{}');
+            const text = translate(translations, language, [props['data-i18n'], params]);
+            if (text === undefined) {
+                return undefined;
+            }
+            return Object.assign({}, children, {props: Object.assign({}, props, {children: text})});
+        }
+        const relabelled = relabel(translations, language, props.children);
+        if (relabelled === undefined) {
+            return undefined;
+        }
+        return Object.assign({}, children, {props: Object.assign({}, props, {children: relabelled})});
+    }
+
+    const i18n = {
+        texts: function (language, translations, keys) {
+            return keys.map((key) => translate(translations, language, key));
+        },
+
+        figure: function (language, translations, figure) {
+            const labels = figure && figure.layout && figure.layout.meta && figure.layout.meta.i18n;
+            if (!labels) {
+                return window.dash_clientside.no_update;
+            }
+            let result = figure;
+            Object.entries(labels).forEach(([attribute, label]) => {
+                const text = translate(translations, language, label);
+                if (text !== undefined) {
+                    result = setPath(result, attribute.split('.'), text);
+                }
+            });
+            return result;
+        },
+
+        tree: function (language, translations, children) {
+            const relabelled = relabel(translations, language, children);
+            return relabelled === undefined ? window.dash_clientside.no_update : relabelled;
+        },
+    };
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {i18n: i18n});
+})();
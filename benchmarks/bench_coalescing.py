@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Concurrent identical callbacks with and without single-flight coalescing
+(result_cache.py).
+
+--clients threads, or forked processes with --processes, run the same
+callback on a cold cache at the same moment, as sessions that open the same
+event together. The runner reports the time until all of them have their
+response and, for threads, the computations saved.
+
+    python benchmarks/bench_coalescing.py --scale 100000 --clients 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import run_benchmarks  # noqa: E402
+import synthetic_data  # noqa: E402
+
+CALLBACKS = ['update_event_data', 'update_dashboard_1', 'update_resume_cards', 'update_dashboard',
+             'update_delay_time', 'update_users_time']
+
+
+def saved():
+    import metrics
+    return sum(metrics.coalesced.series.values())
+
+
+def concurrent(func, args, clients, processes):
+    barrier = (multiprocessing.get_context('fork') if processes else threading).Barrier(clients)
+
+    def client():
+        barrier.wait()
+        func(*args)
+
+    if processes:
+        workers = [multiprocessing.get_context('fork').Process(target=client) for _ in range(clients)]
+    else:
+        workers = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def run(scale, out_dir, clients, processes, names):
+    scale_dir, eventid = synthetic_data.build(out_dir, scale)
+    os.environ['APP_VIEW_CACHE_PATH'] = path.join(out_dir, 'result_cache.db')
+    os.environ['APP_VIEW_CONFIG_DIR'] = scale_dir
+    import result_cache
+    callbacks = run_benchmarks.load_dashboards()
+    ctx = run_benchmarks.scale_context(scale_dir, eventid)
+    cache = result_cache.get_cache()
+
+    results = []
+    print(f"{'callback':<24} {'clients':>8} {'one ms':>9} {'plain ms':>9} {'coalesced ms':>13} {'saved':>6}")
+    for name in names:
+        func, args = callbacks[name], run_benchmarks.SCENARIOS[name](ctx)
+        cache.clear()
+        start = time.perf_counter()
+        func(*args)
+        one = time.perf_counter() - start
+        timings = {}
+        for coalesce in (False, True):
+            cache.coalesce = coalesce
+            cache.clear()
+            before = saved()
+            timings[coalesce] = concurrent(func, args, clients, processes), saved() - before
+        (plain, _), (coalesced, count) = timings[False], timings[True]
+        results.append({'callback': name, 'clients': clients, 'processes': processes, 'one_s': one,
+                        'plain_s': plain, 'coalesced_s': coalesced, 'saved': None if processes else count})
+        print(f"{name:<24} {clients:>8} {one * 1000:>9.1f} {plain * 1000:>9.1f} {coalesced * 1000:>13.1f} "
+              f"{'-' if processes else count:>6}", flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the single-flight coalescing of the result cache")
+    parser.add_argument('--scale', type=int, default=100_000)
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--processes', action='store_true', help="run the clients in forked processes")
+    parser.add_argument('--only', nargs='*', default=CALLBACKS, help="callbacks to run")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    results = run(args.scale, args.out, args.clients, args.processes, args.only)
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Size and encode time of every dashboard figure, before and after
+figures.compact_figure(), with the json and the orjson engines.
+
+    python benchmarks/bench_figures.py --scale 100000
+"""
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+import warnings
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import run_benchmarks  # noqa: E402
+import synthetic_data  # noqa: E402
+
+
+def encode(figure, engine, repeat):
+    from plotly.io.json import to_json_plotly
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = to_json_plotly(figure, engine=engine)
+        times.append(time.perf_counter() - start)
+    return len(payload.encode('utf-8')), min(times)
+
+
+def figures_of(output):
+    values = output if isinstance(output, (tuple, list)) else [output]
+    return [(i, v) for i, v in enumerate(values) if hasattr(v, 'to_plotly_json') or (isinstance(v, dict) and 'data' in v)]
+
+
+def run(scales, out_dir, repeat):
+    import figures
+    import result_cache
+    try:
+        import orjson  # noqa: F401
+        engines = ['json', 'orjson']
+    except ImportError:
+        engines = ['json']
+
+    scale_dirs = {scale: synthetic_data.build(out_dir, scale) for scale in scales}
+    os.environ['APP_VIEW_CACHE_PATH'] = path.join(out_dir, 'result_cache.db')
+    os.environ['APP_VIEW_CONFIG_DIR'] = scale_dirs[scales[0]][0]
+    callbacks = run_benchmarks.load_dashboards()
+
+    header = f"{'scale':>9} {'figure':<36} {'engine':<7} {'raw KiB':>9} {'raw ms':>8} {'compact KiB':>12} {'compact ms':>11}"
+    print(header)
+    for scale in scales:
+        scale_dir, eventid = scale_dirs[scale]
+        os.environ['APP_VIEW_CONFIG_DIR'] = scale_dir
+        ctx = run_benchmarks.scale_context(scale_dir, eventid)
+        for name, make_args in run_benchmarks.SCENARIOS.items():
+            func = callbacks.get(name.split('[')[0])
+            if func is None:
+                continue
+            # Raw figures: no compaction and no cached result
+            figures.ENABLED = False
+            result_cache.get_cache().clear()
+            output = func(*make_args(ctx))
+            for index, figure in figures_of(output):
+                raw = figure.to_plotly_json() if hasattr(figure, 'to_plotly_json') else figure
+                compact = copy.deepcopy(raw)
+                start = time.perf_counter()
+                compact = figures.compact_figure(compact)
+                compact_time = time.perf_counter() - start
+                for engine in engines:
+                    raw_size, raw_time = encode(raw, engine, repeat)
+                    compact_size, encode_time = encode(compact, engine, repeat)
+                    print(f"{scale:>9} {name + '#' + str(index):<36} {engine:<7} {raw_size / 1024:>9.1f} "
+                          f"{raw_time * 1000:>8.1f} {compact_size / 1024:>12.1f} "
+                          f"{(encode_time + compact_time) * 1000:>11.1f}", flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the figure serialization")
+    parser.add_argument('--scale', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    run(args.scale, args.out, args.repeat)
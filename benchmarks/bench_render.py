@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Render payload of the large scatter views: the intensity vs distance graph,
+the silent users timeline and the S-wave arrival graph (drawn in the browser
+from the event-data store). For each view the runner reports the number of
+points, the trace type the browser will draw (SVG or WebGL) and the size of
+the response.
+
+    python benchmarks/bench_render.py --scale 100000 1000000
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import warnings
+from os import path
+
+import numpy as np
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import run_benchmarks  # noqa: E402
+import synthetic_data  # noqa: E402
+
+# View name, callback, index of the output and trace name
+VIEWS = [
+    ('intensity_distance', 'update_dashboard_1', 1, 'Reported Intensity'),
+    ('users_timeline', 'update_users_time', 0, None),
+    ('swave_distance', 'update_event_data', None, None),
+]
+
+
+# Length of a data array, plain or typed array
+def length(values):
+    if isinstance(values, dict) and 'bdata' in values:
+        return len(base64.b64decode(values['bdata'])) // np.dtype(values['dtype']).itemsize
+    return len(values) if values is not None else 0
+
+
+def render_summary(output, index, trace_name):
+    import figures
+    from plotly.io.json import to_json_plotly
+    payload = len(to_json_plotly(output).encode('utf-8'))
+    if index is None:
+        # The S-wave graph draws at most one point per notification of the event
+        points = length(output['columns']['swavearrival']) if output else 0
+        kind = 'scattergl' if figures.WEBGL_MIN and points >= figures.WEBGL_MIN else 'scatter'
+        return points, kind, payload
+    figure = output[index]
+    figure = figure.to_plotly_json() if hasattr(figure, 'to_plotly_json') else figure
+    traces = [trace for trace in figure.get('data', []) if trace_name is None or trace.get('name') == trace_name]
+    if not traces:
+        return 0, '-', payload
+    return length(traces[0].get('x')), traces[0].get('type', 'scatter'), payload
+
+
+def run(scales, out_dir):
+    scale_dirs = {scale: synthetic_data.build(out_dir, scale) for scale in scales}
+    os.environ['APP_VIEW_CACHE_PATH'] = path.join(out_dir, 'result_cache.db')
+    os.environ['APP_VIEW_CONFIG_DIR'] = scale_dirs[scales[0]][0]
+    import result_cache
+    callbacks = run_benchmarks.load_dashboards()
+
+    results = []
+    print(f"{'scale':>10} {'view':<22} {'points':>9} {'trace':<10} {'payload':>12}")
+    for scale in scales:
+        scale_dir, eventid = scale_dirs[scale]
+        os.environ['APP_VIEW_CONFIG_DIR'] = scale_dir
+        ctx = run_benchmarks.scale_context(scale_dir, eventid)
+        for view, name, index, trace_name in VIEWS:
+            result_cache.get_cache().clear()
+            output = callbacks[name](*run_benchmarks.SCENARIOS[name](ctx))
+            points, kind, payload = render_summary(output, index, trace_name)
+            results.append({'scale': scale, 'view': view, 'points': points, 'trace': kind, 'payload_bytes': payload})
+            print(f"{scale:>10} {view:<22} {points:>9} {kind:<10} {payload / 1024:>8.1f} KiB", flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the render payload of the scatter views")
+    parser.add_argument('--scale', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    results = run(args.scale, args.out)
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
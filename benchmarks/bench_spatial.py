@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Bounding-box and radius queries with and without the R-tree indexes
+(spatial.py).
+
+Boxes of the map views of silentnotif at several zoom levels and radiuses
+around the epicenter in eventnotif are queried on a copy of a synthetic
+dashboard DB, first with a range condition over the whole table, then
+through the R-trees. The load of all the rows, as the dashboards did before,
+is the reference.
+
+    python benchmarks/bench_spatial.py --scale 100000 1000000
+"""
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import db  # noqa: E402
+import spatial  # noqa: E402
+import synthetic_data  # noqa: E402
+from metrics import read_sql  # noqa: E402
+
+ZOOMS = [6, 8, 10, 12]
+RADIUSES = [20, 120, 500]
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = len(func())
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), rows
+
+
+def queries(db_path):
+    conn = db.connect(db_path)
+    lat, lon = conn.execute("SELECT AVG(userLat), AVG(userLon) FROM silentnotif").fetchone()
+    epicenter = conn.execute("SELECT latitude, longitude FROM eventinfo ORDER BY updatetime DESC LIMIT 1").fetchone()
+    conn.close()
+    cases = [('silentnotif: all rows', lambda conn: read_sql("SELECT userid, userLat, userLon FROM silentnotif",
+                                                             conn, 'bench'))]
+    for zoom in ZOOMS:
+        box = spatial.view_box(lat, lon, zoom)
+        cases.append((f'silentnotif: view at zoom {zoom}',
+                      lambda conn, box=box: spatial.box_query(conn, 'silentnotif', ['userid'], box)))
+    cases.append(('eventnotif: all rows', lambda conn: read_sql(
+        "SELECT updateno, alertsite, userlat, userlon, userlatpoi, userlonpoi FROM eventnotif", conn, 'bench')))
+    for radius in RADIUSES:
+        cases.append((f'eventnotif: {radius} km around the epicenter',
+                      lambda conn, radius=radius: spatial.radius_query(conn, 'eventnotif', ['updateno'],
+                                                                       epicenter[0], epicenter[1], radius)))
+    return cases
+
+
+def run(scales, out_dir, repeat):
+    results = []
+    print(f"{'scale':>8} {'query':<40} {'rows':>8} {'scan ms':>9} {'R-tree ms':>10}")
+    for scale in scales:
+        scale_dir, _ = synthetic_data.build(out_dir, scale)
+        with open(path.join(scale_dir, 'dashboard_events.json')) as config_file:
+            source = json.load(config_file)['database_path']
+        work_dir = tempfile.mkdtemp(prefix='app-view-spatial-')
+        db_path = path.join(work_dir, 'spatial.db')
+        shutil.copyfile(source, db_path)
+        spatial.uninstall(db_path)
+
+        timings = {}
+        for indexed in (False, True):
+            if indexed:
+                spatial.install(db_path)
+            conn = db.connect(db_path)
+            for name, func in queries(db_path):
+                timings.setdefault(name, {})[indexed] = timed(lambda: func(conn), repeat)
+            conn.close()
+        for name, by_mode in timings.items():
+            (scan, rows), (indexed, _) = by_mode[False], by_mode[True]
+            results.append({'scale': scale, 'query': name, 'rows': rows, 'scan_s': scan, 'rtree_s': indexed})
+            print(f"{scale:>8} {name:<40} {rows:>8} {scan * 1000:>9.1f} {indexed * 1000:>10.1f}", flush=True)
+        shutil.rmtree(work_dir)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the R-tree bounding-box and radius queries")
+    parser.add_argument('--scale', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+    results = run(args.scale, args.out, args.repeat)
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Latency of the dashboard queries with the connection of db.py against the
+default read-write connection, both opened once per query as the callbacks
+do. "cold" is the first query after the database was evicted from the OS page
+cache, "warm" the median of the following ones.
+
+    python benchmarks/bench_sqlite.py --scale 100000 1000000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import synthetic_data  # noqa: E402
+
+# Name, config of the database and query ({eventid} is replaced)
+QUERIES = [
+    ('users.fcmTokens', 'dashboard_users.json', "SELECT UserID, timestamp, TokenSource FROM fcmTokens"),
+    ('silent.delay', 'dashboard_silent.json', "SELECT senttime, delay FROM silentnotif"),
+    ('silent.users_by_day', 'dashboard_silent.json',
+     "SELECT senttime / 86400000, COUNT(DISTINCT userid) FROM silentnotif GROUP BY 1"),
+    ('events.eventnotif', 'dashboard_events.json', "SELECT * FROM eventnotif WHERE eventid='{eventid}'"),
+]
+
+
+def connectors():
+    import db
+    return {
+        'default': sqlite3.connect,
+        'readonly': db.connect,
+        'immutable': lambda db_path: db.connect(db_path, immutable=True),
+    }
+
+
+# Drop the pages of the database from the OS page cache
+def evict(db_path):
+    for candidate in (db_path, db_path + '-wal'):
+        if not path.exists(candidate) or not hasattr(os, 'posix_fadvise'):
+            continue
+        fd = os.open(candidate, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def query_once(connect, db_path, query):
+    start = time.perf_counter()
+    conn = connect(db_path)
+    try:
+        conn.execute(query).fetchall()
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def run(scales, out_dir, repeat):
+    results = []
+    print(f"{'scale':>10} {'query':<22} {'connection':<10} {'cold ms':>10} {'warm ms':>10}")
+    for scale in scales:
+        scale_dir, eventid = synthetic_data.build(out_dir, scale)
+        for name, config_name, query in QUERIES:
+            with open(path.join(scale_dir, config_name)) as config_file:
+                db_path = json.load(config_file)['database_path']
+            query = query.format(eventid=eventid)
+            for kind, connect in connectors().items():
+                evict(db_path)
+                cold = query_once(connect, db_path, query)
+                warm = statistics.median(query_once(connect, db_path, query) for _ in range(repeat))
+                results.append({'scale': scale, 'query': name, 'connection': kind, 'cold_s': cold, 'warm_s': warm})
+                print(f"{scale:>10} {name:<22} {kind:<10} {cold * 1000:>10.1f} {warm * 1000:>10.1f}", flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite connections of the dashboards")
+    parser.add_argument('--scale', type=int, nargs='+', default=[100_000])
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+    results = run(args.scale, args.out, args.repeat)
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Cold start of the application, measured in fresh interpreters.
+
+Each run imports main.py, fetches the page layout and the callback map as the
+browser does on load, then asks for the content of one tab (the first paint).
+--repo runs the same measure on another checkout, to compare two versions:
+
+    python benchmarks/bench_startup.py --scale 100000 --repo /path/to/other/checkout
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import synthetic_data  # noqa: E402
+
+TABS = ['tab-1', 'tab-2', 'tab-3', 'tab-4']
+
+# Executed in the child interpreter, prints the timings as JSON
+CHILD = r"""
+import json, sys, time, warnings
+warnings.simplefilter('ignore')
+sys.path.insert(0, sys.argv[1])
+timings = {}
+start = time.perf_counter()
+import main
+timings['import'] = time.perf_counter() - start
+
+client = main.app.server.test_client()
+start = time.perf_counter()
+client.get('/_dash-layout')
+client.get('/_dash-dependencies')
+timings['layout'] = time.perf_counter() - start
+
+body = {
+    'output': 'tabs-content.children',
+    'outputs': {'id': 'tabs-content', 'property': 'children'},
+    'inputs': [{'id': 'tabs-example', 'property': 'value', 'value': sys.argv[2]},
+               {'id': 'stored-eventid', 'property': 'data', 'value': None}],
+    'changedPropIds': ['tabs-example.value'],
+    'state': [],
+}
+start = time.perf_counter()
+response = client.post('/_dash-update-component', json=body)
+assert response.status_code == 200, response.status_code
+timings['first_paint'] = time.perf_counter() - start
+timings['total'] = timings['import'] + timings['layout'] + timings['first_paint']
+print(json.dumps(timings))
+"""
+
+
+def measure(repo, tab, config_dir, cache_dir):
+    env = dict(os.environ)
+    env['APP_VIEW_CONFIG_DIR'] = config_dir
+    # A new result cache for every run, nothing computed before is reused
+    cache_path = tempfile.mktemp(suffix='.db', dir=cache_dir)
+    env['APP_VIEW_CACHE_PATH'] = cache_path
+    env.pop('APP_VIEW_METRICS_DIR', None)
+    output = subprocess.run([sys.executable, '-c', CHILD, repo, tab], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    for suffix in ('', '-wal', '-shm'):
+        if path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(repos, scale, out_dir, repeat):
+    scale_dir, _ = synthetic_data.build(out_dir, scale)
+    cache_dir = tempfile.mkdtemp(prefix='app-view-startup-')
+    results = []
+
+    print(f"{'repo':<40} {'tab':<6} {'import ms':>10} {'layout ms':>10} {'paint ms':>10} {'total ms':>10}")
+    for repo in repos:
+        # Warm the OS file cache and the bytecode before measuring
+        measure(repo, TABS[0], scale_dir, cache_dir)
+        for tab in TABS:
+            runs = [measure(repo, tab, scale_dir, cache_dir) for _ in range(repeat)]
+            row = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+            row.update(repo=repo, tab=tab, scale=scale)
+            results.append(row)
+            print(f"{repo[-40:]:<40} {tab:<6} {row['import'] * 1000:>10.0f} {row['layout'] * 1000:>10.0f} "
+                  f"{row['first_paint'] * 1000:>10.0f} {row['total'] * 1000:>10.0f}", flush=True)
+    os.rmdir(cache_dir)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of the dashboards")
+    parser.add_argument('--scale', type=int, default=100_000)
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--repo', nargs='*', default=[], help="other checkouts to measure as well")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+    repos = [path.dirname(path.dirname(path.abspath(__file__)))] + [path.abspath(repo) for repo in args.repo]
+    results = run(repos, args.scale, args.out, args.repeat)
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
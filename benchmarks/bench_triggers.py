@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Write overhead of the summary triggers (summaries.py) on the ingestion side.
+
+The rows of a synthetic dashboard DB are inserted again into empty copies of
+its tables, with and without the triggers, in transactions of --batch rows
+as the ingestion does. The runner reports the insert rate and the overhead.
+
+    python benchmarks/bench_triggers.py --scale 100000 --batch 1 100 10000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import summaries  # noqa: E402
+import synthetic_data  # noqa: E402
+
+TABLES = ['silentnotif', 'eventnotif', 'intensityreports']
+
+
+def load_rows(db_path, table, limit):
+    with sqlite3.connect(db_path) as conn:
+        schema = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        rows = conn.execute(f"SELECT * FROM {table} LIMIT {limit}").fetchall()
+    return schema, columns, rows
+
+
+def insert(work_dir, table, schema, columns, rows, batch, triggers):
+    db_path = path.join(work_dir, f"{table}-{batch}-{int(triggers)}.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(schema)
+    conn.commit()
+    if triggers:
+        summaries.install(db_path)
+
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    start = time.perf_counter()
+    for offset in range(0, len(rows), batch):
+        conn.executemany(sql, rows[offset:offset + batch])
+        conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    for suffix in ('', '-wal', '-shm'):
+        if path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    return elapsed
+
+
+def run(scale, out_dir, batches, limit, repeat):
+    scale_dir, _ = synthetic_data.build(out_dir, scale)
+    with open(path.join(scale_dir, 'dashboard_events.json')) as config_file:
+        db_path = json.load(config_file)['database_path']
+    work_dir = tempfile.mkdtemp(prefix='app-view-triggers-')
+    results = []
+
+    print(f"{'table':<18} {'batch':>7} {'rows':>8} {'plain rows/s':>13} {'triggers rows/s':>16} {'overhead':>9}")
+    for table in TABLES:
+        schema, columns, rows = load_rows(db_path, table, limit)
+        for batch in batches:
+            plain = statistics.median(insert(work_dir, table, schema, columns, rows, batch, False) for _ in range(repeat))
+            triggered = statistics.median(insert(work_dir, table, schema, columns, rows, batch, True) for _ in range(repeat))
+            overhead = triggered / plain - 1
+            results.append({'table': table, 'batch': batch, 'rows': len(rows), 'plain_s': plain,
+                            'triggers_s': triggered, 'overhead': overhead})
+            print(f"{table:<18} {batch:>7} {len(rows):>8} {len(rows) / plain:>13.0f} {len(rows) / triggered:>16.0f} "
+                  f"{overhead * 100:>8.1f}%", flush=True)
+    os.rmdir(work_dir)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the write overhead of the summary triggers")
+    parser.add_argument('--scale', type=int, default=100_000)
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 100, 10_000],
+                        help="rows per transaction")
+    parser.add_argument('--rows', type=int, default=20_000, help="rows inserted per table")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+    results = run(args.scale, args.out, args.batch, args.rows, args.repeat)
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Benchmark of every registered dashboard callback on synthetic databases.
+
+Each callback is called directly (no HTTP) with the result cache cleared, so
+the numbers are the cost of a cold computation. A scenario named
+callback[cached] measures the same callback on a warm cache instead. For
+every callback and scale the runner reports the median wall time, the peak
+Python memory (tracemalloc) and the size of the JSON payload Dash would send
+to the browser.
+
+    python benchmarks/run_benchmarks.py --scale 10000 100000 --json results.json
+
+The resample_* scenarios zoom on the last month of a time series. The
+synthetic series have fewer points than APP_VIEW_DOWNSAMPLE_POINTS, so by
+default they only measure the check; APP_VIEW_DOWNSAMPLE_POINTS=200 makes
+them send the resampled traces.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import synthetic_data  # noqa: E402
+
+
+# Arguments of each callback, built from the context of one scale
+SCENARIOS = {
+    'update_dashboard': lambda ctx: (1, 'en', None),
+    'refresh_data': lambda ctx: (1,),
+    'update_map': lambda ctx: ('All', ctx['latest_senttime'], None, 'en', None),
+    'update_distribution': lambda ctx: ('All', ctx['latest_senttime'], 'en', None),
+    'update_delay_time': lambda ctx: (ctx['start_date'], ctx['end_date'], None, 'en'),
+    'update_delay_time[all]': lambda ctx: (ctx['start_date'], ctx['end_date'], 1, 'en'),
+    'update_users_time': lambda ctx: ('All', 'en', None),
+    'update_dropdown_1': lambda ctx: (ctx['eventid'],),
+    'update_dropdown_2': lambda ctx: (ctx['eventid'],),
+    'update_dashboard_1': lambda ctx: (ctx['eventid'], 'en'),
+    'update_event_data': lambda ctx: (ctx['eventid'],),
+    'update_resume_cards': lambda ctx: (ctx['eventid'], 'en'),
+    'update_eventid_and_dropdown': lambda ctx: (None, ctx['eventid']),
+    'update_report_trends': lambda ctx: (0, 'en'),
+    'update_report_coverage': lambda ctx: ('all', 'en'),
+    'update_report_coverage[cached]': lambda ctx: ('all', 'en'),
+    # Zoom on the last month of a time series (downsample.py)
+    'resample_user_counts_fig': lambda ctx: (ctx['zoom'], 'en'),
+    'resample_user_growth_fig': lambda ctx: (ctx['zoom'], 'en'),
+    'resample_apns_user_counts_fig': lambda ctx: (ctx['zoom'], 'en'),
+    'resample_apns_user_growth_fig': lambda ctx: (ctx['zoom'], 'en'),
+    'resample_delay_time_graph': lambda ctx: (ctx['zoom'], ctx['start_date'], ctx['end_date'], 1, 'en'),
+    'resample_users_time_graph': lambda ctx: (ctx['zoom'], 'All', 'en'),
+}
+
+
+def payload_size(output):
+    from plotly.io.json import to_json_plotly
+    try:
+        return len(to_json_plotly(output).encode('utf-8'))
+    except (TypeError, ValueError):
+        return None
+
+
+def measure(func, args, repeat, clear_cache):
+    times = []
+    output = None
+    for _ in range(repeat):
+        clear_cache()
+        start = time.perf_counter()
+        output = func(*args)
+        times.append(time.perf_counter() - start)
+
+    clear_cache()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak, payload_size(output)
+
+
+def load_dashboards():
+    import dashboard_users
+    import dashboard_silent
+    import dashboard_events
+    import dashboard_report
+    from recorder import record
+    return record(dashboard_users, dashboard_silent, dashboard_events, dashboard_report)
+
+
+def scale_context(scale_dir, eventid):
+    import sqlite3
+    from contextlib import closing
+    import pandas as pd
+    with open(path.join(scale_dir, 'dashboard_silent.json')) as config_file:
+        db_path = json.load(config_file)['database_path']
+    with closing(sqlite3.connect(db_path)) as conn:
+        latest = conn.execute("SELECT MAX(senttime) FROM silentnotif").fetchone()[0]
+    latest_time = pd.to_datetime(latest, unit='ms')
+    zoom_start = latest_time - pd.DateOffset(months=1)
+    return {
+        'eventid': eventid,
+        'latest_senttime': float(latest),
+        'start_date': (latest_time - pd.DateOffset(months=3)).isoformat(),
+        'end_date': latest_time.isoformat(),
+        # relayoutData of a zoom, in the format of plotly.js
+        'zoom': {'xaxis.range[0]': zoom_start.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+                 'xaxis.range[1]': latest_time.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]},
+    }
+
+
+def run(scales, out_dir, repeat, only=None, snapshots=False):
+    # Point the dashboards and the result cache to the synthetic data before
+    # importing them (dashboard_silent reads its DB at import time)
+    scale_dirs = {scale: synthetic_data.build(out_dir, scale) for scale in scales}
+    os.environ['APP_VIEW_CACHE_PATH'] = path.join(out_dir, 'result_cache.db')
+    os.environ['APP_VIEW_CONFIG_DIR'] = scale_dirs[scales[0]][0]
+
+    import result_cache
+    callbacks = load_dashboards()
+    missing = {name for name in callbacks} - {name.split('[')[0] for name in SCENARIOS}
+    for name in sorted(missing):
+        print(f"warning: no benchmark scenario for callback {name}", file=sys.stderr)
+
+    results = []
+    for scale in scales:
+        scale_dir, eventid = scale_dirs[scale]
+        os.environ['APP_VIEW_CONFIG_DIR'] = scale_dir
+        if snapshots:
+            import snapshots as snapshot_writer
+            snapshot_writer.write_all()
+        ctx = scale_context(scale_dir, eventid)
+        for name, make_args in SCENARIOS.items():
+            func = callbacks.get(name.split('[')[0])
+            if func is None or (only and not any(o in name for o in only)):
+                continue
+            args, clear_cache = make_args(ctx), result_cache.get_cache().clear
+            if name.endswith('[cached]'):
+                clear_cache()
+                func(*args)
+                clear_cache = lambda: None  # noqa: E731
+            wall, peak, size = measure(func, args, repeat, clear_cache)
+            results.append({'scale': scale, 'callback': name, 'wall_s': wall,
+                            'peak_mem_bytes': peak, 'payload_bytes': size})
+            print(f"{scale:>10} {name:<32} {wall * 1000:>10.1f} ms {peak / 2**20:>9.1f} MiB "
+                  f"{(size or 0) / 1024:>10.1f} KiB", flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard callbacks")
+    parser.add_argument('--scale', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='*', help="run only the callbacks containing these names")
+    parser.add_argument('--snapshots', action='store_true', help="write Arrow snapshots before each scale")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    print(f"{'scale':>10} {'callback':<32} {'wall':>13} {'peak mem':>13} {'payload':>14}")
+    results = run(args.scale, args.out, args.repeat, args.only, args.snapshots)
+    if args.json:
+        with open(args.json, 'w') as out_file:
+            json.dump(results, out_file, indent=2)
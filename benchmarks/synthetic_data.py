@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Synthetic token and dashboard databases for the benchmarks.
+
+The scale is the number of rows of the large tables (fcmTokens, silentnotif
+and eventnotif); the other tables are derived from it. Users are located in
+Central America, delays follow a log-normal distribution and one event
+concentrates a third of the notifications, like a real felt earthquake.
+
+    python benchmarks/synthetic_data.py --scale 100000 --out /tmp/app-view-bench
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from os import path
+
+import numpy as np
+
+CHUNK = 500_000
+DAY = 86400
+
+# Central America bounding box
+LAT_RANGE = (8.0, 18.0)
+LON_RANGE = (-92.0, -77.0)
+
+
+def _user_ids(rng, prefix, n_users, size):
+    ids = rng.integers(0, max(n_users, 1), size)
+    return np.char.add(f"{prefix}:APA91b", np.char.zfill(ids.astype(str), 40))
+
+
+def _insert(conn, table, columns, n_rows, make_chunk):
+    placeholders = ', '.join('?' * len(columns))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    for start in range(0, n_rows, CHUNK):
+        size = min(CHUNK, n_rows - start)
+        chunk = make_chunk(start, size)
+        conn.executemany(sql, zip(*[c.tolist() for c in chunk]))
+    conn.commit()
+
+
+def create_tokens_db(db_path, scale, seed=0):
+    rng = np.random.default_rng(seed)
+    now = int(time.time())
+    history = 2 * 365 * DAY
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE fcmTokens (UserID TEXT, Token TEXT, timestamp INTEGER, TokenSource TEXT)")
+    conn.execute("CREATE TABLE apnsTokens (UserID TEXT, Token TEXT, timestamp INTEGER)")
+
+    # Registrations grow over time: more tokens recently
+    def fcm_chunk(start, size):
+        users = _user_ids(rng, 'fcm', scale // 3, size)
+        timestamps = now - (history * rng.power(3.0, size)[::-1]).astype(np.int64)
+        sources = np.where(rng.random(size) < 0.8, 'android', 'ios')
+        return users, users, timestamps, sources
+
+    def apns_chunk(start, size):
+        users = _user_ids(rng, 'apns', scale // 12, size)
+        timestamps = now - (history * rng.power(3.0, size)[::-1]).astype(np.int64)
+        return users, users, timestamps
+
+    _insert(conn, 'fcmTokens', ['UserID', 'Token', 'timestamp', 'TokenSource'], scale, fcm_chunk)
+    _insert(conn, 'apnsTokens', ['UserID', 'Token', 'timestamp'], scale // 4, apns_chunk)
+    conn.close()
+
+
+def create_dashboard_db(db_path, scale, seed=0):
+    rng = np.random.default_rng(seed)
+    now = int(time.time())
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE silentnotif (notifid TEXT, senttime INTEGER, osversion TEXT, userid TEXT,
+                    userLat REAL, userLon REAL, delay REAL)""")
+    conn.execute("""CREATE TABLE eventinfo (eventid TEXT, updatetime INTEGER, magnitude REAL, origintime TEXT,
+                    depth REAL, description TEXT, latitude REAL, longitude REAL)""")
+    conn.execute("""CREATE TABLE eventnotif (eventid TEXT, updateno INTEGER, osversion TEXT, userid TEXT,
+                    delay REAL, alert INTEGER, swavearrival REAL, alertsite INTEGER,
+                    userlat REAL, userlon REAL, userlatpoi REAL, userlonpoi REAL)""")
+    conn.execute("""CREATE TABLE intensityreports (eventid TEXT, userid TEXT, intensity INTEGER,
+                    lat REAL, lon REAL, reporttime INTEGER)""")
+
+    # Silent notifications: one campaign a day, each received by many users
+    n_campaigns = max(10, min(730, scale // 1000))
+    campaign_times = (now - DAY * np.arange(n_campaigns)) * 1000
+
+    def silent_chunk(start, size):
+        campaign = rng.integers(0, n_campaigns, size)
+        senttime = campaign_times[campaign]
+        notifid = np.char.add('silent-', campaign.astype(str))
+        osversion = np.where(rng.random(size) < 0.75, 'android', 'ios')
+        userid = _user_ids(rng, 'fcm', scale // 3, size)
+        lat = rng.uniform(*LAT_RANGE, size).round(6)
+        lon = rng.uniform(*LON_RANGE, size).round(6)
+        delay = rng.lognormal(1.0, 0.9, size)
+        return notifid, senttime, osversion, userid, lat, lon, delay
+
+    _insert(conn, 'silentnotif', ['notifid', 'senttime', 'osversion', 'userid', 'userLat', 'userLon', 'delay'],
+            scale, silent_chunk)
+
+    # Events with a few location updates each
+    n_events = max(5, scale // 20000)
+    event_lat = rng.uniform(*LAT_RANGE, n_events)
+    event_lon = rng.uniform(*LON_RANGE, n_events)
+    event_time = now - rng.integers(0, 365 * DAY, n_events)
+    event_time[0] = now - 3600  # the largest event is the most recent one
+    eventids = np.char.add('attac2024', np.char.zfill(np.arange(n_events).astype(str), 4))
+    rows = []
+    for i in range(n_events):
+        for update in range(3):
+            rows.append((str(eventids[i]), int(event_time[i] + 10 * update), float(rng.uniform(4.0, 7.0)),
+                         time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(int(event_time[i]))),
+                         float(rng.uniform(5, 120)), f"Synthetic event {i}",
+                         float(event_lat[i] + rng.normal(0, 0.05)), float(event_lon[i] + rng.normal(0, 0.05))))
+    conn.executemany("INSERT INTO eventinfo VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    # A third of the notifications belong to the first event
+    def event_indexes(size):
+        return np.where(rng.random(size) < 1 / 3, 0, rng.integers(0, n_events, size))
+
+    def eventnotif_chunk(start, size):
+        event = event_indexes(size)
+        updateno = rng.choice(np.arange(5), size, p=[0.4, 0.25, 0.15, 0.12, 0.08])
+        osversion = np.where(rng.random(size) < 0.75, 'android', 'ios')
+        userid = _user_ids(rng, 'fcm', scale // 3, size)
+        delay = rng.lognormal(1.2, 0.8, size)
+        alert = rng.choice(np.arange(5), size, p=[0.1, 0.15, 0.2, 0.25, 0.3])
+        distance = rng.gamma(2.0, 40.0, size)
+        angle = rng.uniform(0, 2 * np.pi, size)
+        userlat = event_lat[event] + distance / 111.0 * np.sin(angle)
+        userlon = event_lon[event] + distance / 111.0 * np.cos(angle)
+        swavearrival = distance / 3.5 - delay - 5 + rng.normal(0, 3, size)
+        alertsite = (rng.random(size) < 0.6).astype(int)
+        poi_lat = np.where(alertsite == 1, np.nan, userlat + rng.normal(0, 0.01, size))
+        poi_lon = np.where(alertsite == 1, np.nan, userlon + rng.normal(0, 0.01, size))
+        return (eventids[event], updateno, osversion, userid, delay, alert, swavearrival, alertsite,
+                userlat.round(6), userlon.round(6), poi_lat.round(6), poi_lon.round(6))
+
+    _insert(conn, 'eventnotif', ['eventid', 'updateno', 'osversion', 'userid', 'delay', 'alert', 'swavearrival',
+                                 'alertsite', 'userlat', 'userlon', 'userlatpoi', 'userlonpoi'],
+            scale, eventnotif_chunk)
+
+    def intensity_chunk(start, size):
+        event = event_indexes(size)
+        distance = rng.gamma(2.0, 40.0, size)
+        angle = rng.uniform(0, 2 * np.pi, size)
+        intensity = np.clip(np.round(7 - 2.2 * np.log10(distance + 1) + rng.normal(0, 1, size)), 0, 12).astype(int)
+        return (eventids[event], _user_ids(rng, 'fcm', scale // 3, size), intensity,
+                (event_lat[event] + distance / 111.0 * np.sin(angle)).round(6),
+                (event_lon[event] + distance / 111.0 * np.cos(angle)).round(6),
+                event_time[event] + rng.integers(60, 3600, size))
+
+    _insert(conn, 'intensityreports', ['eventid', 'userid', 'intensity', 'lat', 'lon', 'reporttime'],
+            max(scale // 10, 100), intensity_chunk)
+    conn.close()
+    return str(eventids[0])
+
+
+# Create (or reuse) the databases of one scale and the JSON configs that point
+# the dashboards to them. Returns the config directory and the busiest eventid.
+def build(out_dir, scale, seed=0):
+    scale_dir = path.join(out_dir, f"scale-{scale}")
+    os.makedirs(scale_dir, exist_ok=True)
+    tokens_db = path.join(scale_dir, 'tokens.db')
+    dashboard_db = path.join(scale_dir, 'dashboard.db')
+    if not path.exists(tokens_db):
+        create_tokens_db(tokens_db + '.tmp', scale, seed)
+        os.replace(tokens_db + '.tmp', tokens_db)
+    if not path.exists(dashboard_db):
+        create_dashboard_db(dashboard_db + '.tmp', scale, seed)
+        os.replace(dashboard_db + '.tmp', dashboard_db)
+
+    for name, db_path in [('dashboard_users.json', tokens_db),
+                          ('dashboard_silent.json', dashboard_db),
+                          ('dashboard_events.json', dashboard_db)]:
+        with open(path.join(scale_dir, name), 'w') as config_file:
+            config_file.write(f'{{"database_path": "{db_path}"}}\n')
+
+    with sqlite3.connect(dashboard_db) as conn:
+        eventid = conn.execute("SELECT eventid FROM eventnotif GROUP BY eventid "
+                               "ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    return scale_dir, eventid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic dashboard databases")
+    parser.add_argument('--scale', type=int, nargs='+', default=[10_000])
+    parser.add_argument('--out', default=path.join(tempfile.gettempdir(), 'app-view-bench'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for scale in args.scale:
+        start = time.time()
+        scale_dir, eventid = build(args.out, scale, args.seed)
+        print(f"scale {scale}: {scale_dir} (busiest event {eventid}, {time.time() - start:.1f}s)")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Cancellation of the callbacks made stale by a newer input.
+
+Typing an eventid or flipping through the dropdowns sends one request per
+change, and the browser only keeps the response of the last one.
+assets/cancellation.js gives every page load an id, sent in the
+X-App-View-Page header of the callback requests, and install() records per
+page and set of outputs the last _dash-update-component request. Two tabs
+of the same browser are two pages and do not cancel each other; a request
+without the header is never cancelled.
+
+The record is kept in memory, so that check() sees at once a newer request
+reaching the same worker, and written to the result cache database in
+batches by a background thread, every FLUSH_DELAY seconds at most, for the
+other workers: a newer request may well reach another worker than the one
+running the stale callback. The request thread never waits on the database.
+A record only replaces an older one, and the records of the pages idle for
+a day are purged.
+
+A long callback calls check() between its stages (query, aggregate,
+render): once a newer request of the same page for the same outputs has
+arrived, check() raises Cancelled, the callback stops and the worker is
+free. Cancelled is a PreventUpdate, so Dash answers 204 to the abandoned
+request. Outside a request, in the warmer or the benchmarks, check() does
+nothing. /metrics counts the cancelled callbacks in
+dashboard_callback_cancelled_total.
+"""
+import contextvars
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dash.exceptions import PreventUpdate
+
+from result_cache import default_cache_path
+
+HEADER = 'X-App-View-Page'
+UPDATE_PATH = '_dash-update-component'
+# APP_VIEW_CANCEL_STALE=0 lets every callback run to the end
+ENABLED = os.environ.get('APP_VIEW_CANCEL_STALE', '1') not in ('', '0')
+FLUSH_DELAY = float(os.environ.get('APP_VIEW_CANCEL_FLUSH', '0.05'))  # seconds
+IDLE = 86400       # seconds after which the record of a page is purged
+PURGE_EVERY = 500  # purge the idle pages every N requests
+
+# (page, outputs, request, started) of the callback running in this context
+_current = contextvars.ContextVar('app_view_request', default=None)
+_local = threading.local()
+# Last request per (page, outputs) of this process, and the records not yet
+# written to the database
+_state = {'pid': None, 'latest': {}, 'pending': {}, 'flushing': False, 'count': 0}
+_lock = threading.Lock()
+
+
+class Cancelled(PreventUpdate):
+    # Tied to one request: the calls waiting on the same computation (see
+    # result_cache.single_flight) compute it again instead of failing too
+    shared = False
+
+
+# One connection per thread and per process, like the result cache
+def _connect():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(default_cache_path(), timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS page_requests (page TEXT NOT NULL, outputs TEXT NOT NULL, "
+                 "request TEXT NOT NULL, started REAL NOT NULL, PRIMARY KEY (page, outputs)) WITHOUT ROWID")
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+# State of this process, reset in a forked worker
+def _process_state():
+    if _state['pid'] != os.getpid():
+        _state.update(pid=os.getpid(), latest={}, pending={}, flushing=False, count=0)
+    return _state
+
+
+# Write the pending records in one transaction. A record written late by
+# this worker does not replace a newer one of another worker.
+def _flush():
+    with _lock:
+        state = _process_state()
+        pending, state['pending'], state['flushing'] = state['pending'], {}, False
+        purge = state['count'] >= PURGE_EVERY
+        if purge:
+            state['count'] = 0
+            idle = time.time() - IDLE
+            state['latest'] = {key: value for key, value in state['latest'].items() if value[1] >= idle}
+    if not pending and not purge:
+        return
+    try:
+        conn = _connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO page_requests (page, outputs, request, started) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT (page, outputs) DO UPDATE SET request = excluded.request, "
+                             "started = excluded.started WHERE excluded.started > page_requests.started",
+                             [(*key, request, started) for key, (request, started) in pending.items()])
+            if purge:
+                conn.execute("DELETE FROM page_requests WHERE started < ?", (time.time() - IDLE,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    except sqlite3.Error:
+        pass
+
+
+# Make `request` the latest one of the page for these outputs. The database
+# is written later by _flush() on another thread.
+def begin(page, outputs, request, started):
+    with _lock:
+        state = _process_state()
+        state['latest'][(page, outputs)] = state['pending'][(page, outputs)] = (request, started)
+        state['count'] += 1
+        if state['flushing']:
+            return
+        state['flushing'] = True
+    timer = threading.Timer(FLUSH_DELAY, _flush)
+    timer.daemon = True
+    timer.start()
+
+
+def stale(page, outputs, request, started):
+    latest = _process_state()['latest'].get((page, outputs))
+    if latest is not None and latest[0] != request and latest[1] > started:
+        return True
+    row = _connect().execute("SELECT request, started FROM page_requests WHERE page = ? AND outputs = ?",
+                             (page, outputs)).fetchone()
+    return row is not None and row[0] != request and row[1] > started
+
+
+# Raise Cancelled when a newer request replaced the one being answered
+def check():
+    current = _current.get()
+    if current is None:
+        return
+    try:
+        abandoned = stale(*current)
+    except sqlite3.Error:
+        return
+    if abandoned:
+        raise Cancelled()
+
+
+def install(app):
+    from flask import g, request
+
+    server = app.server
+
+    @server.before_request
+    def register_request():
+        if not ENABLED or request.method != 'POST' or not request.path.endswith(UPDATE_PATH):
+            return None
+        page = request.headers.get(HEADER, '')
+        if not page or len(page) > 64:
+            return None
+        outputs = str((request.get_json(silent=True) or {}).get('output', ''))
+        current = (page, outputs, uuid.uuid4().hex, time.time())
+        begin(*current)
+        g.cancellation = current
+        _current.set(current)
+        return None
+
+    @server.teardown_request
+    def unregister_request(error=None):
+        if g.pop('cancellation', None) is not None:
+            _current.set(None)
+
+    return app
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Configuration of the dashboards.
+
+Each dashboard reads its settings from its own JSON file (dashboard_users.json,
+dashboard_silent.json, dashboard_events.json) in APP_VIEW_CONFIG_DIR, this
+folder by default. main.py can use one combined file instead, main.json in the
+same folder or the file given by APP_VIEW_CONFIG, with a section per dashboard:
+
+    {
+        "users": {"database_path": "/Path/to/SQLiteDB/tokens.db"},
+        "silent": {"database_path": "/Path/To/SQLiteDB/dashboard.db"},
+        "events": {"database_path": "/Path/To/SQLiteDB/dashboard.db"}
+    }
+
+A dashboard missing from the combined file reads its own file. The parsed
+files are cached and parsed again only when their modification time or size
+changes, so the callbacks can ask for the configuration on every call.
+"""
+import json
+import os
+from os import path
+
+# Own file of each dashboard
+DASHBOARD_FILES = {
+    'users': 'dashboard_users.json',
+    'silent': 'dashboard_silent.json',
+    'events': 'dashboard_events.json',
+}
+
+COMBINED_FILE = 'main.json'
+
+# Parsed files by path, with the (mtime, size) they were read at
+_cache = {}
+
+
+def config_dir():
+    # APP_VIEW_CONFIG_DIR points to another folder, e.g. for the benchmarks
+    return os.environ.get('APP_VIEW_CONFIG_DIR', path.dirname(path.abspath(__file__)))
+
+
+def combined_path():
+    return os.environ.get('APP_VIEW_CONFIG') or path.join(config_dir(), COMBINED_FILE)
+
+
+# Content of a JSON file, None when it does not exist
+def load(config_path):
+    try:
+        st = os.stat(config_path)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _cache.get(config_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(config_path) as config_file:
+        config = json.load(config_file)
+    _cache[config_path] = (stamp, config)
+    return config
+
+
+# Settings of one dashboard: 'users', 'silent' or 'events'
+def get(dashboard):
+    combined = load(combined_path())
+    if combined is not None and dashboard in combined:
+        return combined[dashboard]
+    own_path = path.join(config_dir(), DASHBOARD_FILES[dashboard])
+    config = load(own_path)
+    if config is None:
+        raise FileNotFoundError(f"No configuration for the {dashboard} dashboard: "
+                                f"{own_path} and {combined_path()} are missing")
+    return config
+
+
+def database_path(dashboard):
+    return get(dashboard)['database_path']
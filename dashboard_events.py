@@ -15,26 +15,42 @@ GNU Affero General Public License for more details.
 
 Author: Billy Burgoa Rosso (billyburgoa@gmail.com)
 """
-import json
-import sqlite3
 import pandas as pd
 import math
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html
-from dash.dependencies import Input, Output
-import plotly.express as px
+from dash import dcc, html, ClientsideFunction
+from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 import numpy as np
-from os import path
+from result_cache import memoize, file_version
+from snapshots import encode_ids, read_snapshot
+from metrics import read_sql
+import figures
+from figures import compact_outputs, encode_array, scatter
+import cancellation
+import config
+import db
+import enrichment
+import i18n
+import parallel
+import replica
+import summaries
 
-# Read the JSON file and load the database path
+# Database path of the dashboard, see config.py
 def load_db_path():
-    script_dir = path.dirname(path.abspath(__file__))
-    config_path = path.join(script_dir, 'dashboard_events.json')
-    with open(config_path) as config_file:
-        config = json.load(config_file)
-    return config['database_path']
+    return config.database_path('events')
+
+# Read-only connection to the dashboard DB, see db.py, or to its local
+# replica (replica.py). "immutable": true in the config marks the database as
+# a frozen copy, which a replica always is.
+def connect_db(db_path):
+    queried = replica.resolve(db_path)
+    return db.connect(queried, immutable=queried != db_path or config.get('events').get('immutable', False))
+
+# Data version of the dashboard DB, used to key the shared result cache
+def data_version():
+    return file_version(replica.resolve(load_db_path()))
 
 # Define the provided functions
 def distanceEpiToPoint(epiLat, epiLon, lat, lon):
@@ -103,59 +119,59 @@ def ipe_allen2012_hyp_sigma(epiDistance, depth):
         
     return sigma
 
+# Distances from the hypocenter to arrays of points, in km
+def hypo_distances(epiLat, epiLon, depth, lat, lon):
+    distance = enrichment.epicentral_distances(epiLat, epiLon, lat, lon)
+    return np.sqrt(distance * distance + depth * depth)
+
+# EMS-98 class and colour of each intensity, -1 for invalid values
+INTENSITY_CLASSES = {
+    -1: ("--", "#FFFFFF"),
+    0: ("I. Not Felt", "#D3D3D3"),
+    1: ("II. Very Weak", "#BFCCFF"),
+    2: ("III. Weak", "#9999FF"),
+    3: ("IV. Light", "#80FFFF"),
+    4: ("V. Moderate", "#7DF894"),
+    5: ("VI. Strong", "#FFFF00"),
+    6: ("VII. Very Strong", "#FFC800"),
+    7: ("VIII. Severe", "#FF9100"),
+    8: ("IX. Violent", "#FF0000"),
+    9: ("X. Extreme", "#C80000"),
+    10: ("XI. Extreme", "#800000"),
+    11: ("XII. Extreme", "#000000"),
+    12: ("XII. Extreme", "#000000"),
+}
+
 def intToColorDescription(intVal):
-    if intVal > 12 or intVal < 0:
+    # No intensity report yet (NaN) is shown as an invalid value
+    if pd.isna(intVal) or intVal > 12 or intVal < 0:
         intVal = -1
-    colorDict = {
-        -1: "--",           # Invalid
-        0: "I. Not Felt",   # #D3D3D3
-        1: "II. Very Weak", # #BFCCFF
-        2: "III. Weak",     # #9999FF
-        3: "IV. Light",     # #80FFFF
-        4: "V. Moderate",   # #7DF894
-        5: "VI. Strong",    # #FFFF00
-        6: "VII. Very Strong",# #FFC800
-        7: "VIII. Severe",  # #FF9100
-        8: "IX. Violent",   # #FF0000
-        9: "X. Extreme",    # #C80000
-        10: "XI. Extreme",  # #800000
-        11: "XII. Extreme", # #000000
-        12: "XII. Extreme"  # #000000
-    }
-    
-    color = {
-        -1: "#FFFFFF",
-        0: "#D3D3D3",
-        1: "#BFCCFF",
-        2: "#9999FF",
-        3: "#80FFFF",
-        4: "#7DF894",
-        5: "#FFFF00",
-        6: "#FFC800",
-        7: "#FF9100",
-        8: "#FF0000",
-        9: "#C80000",
-        10: "#800000",
-        11: "#000000",
-        12: "#000000"
-    }
+    description, color = INTENSITY_CLASSES[intVal]
+    return f"{description};{color}"
 
-    return f"{colorDict[intVal]};{color[intVal]}"
+# Keys of INTENSITY_CLASSES for a Series of intensities
+def intensity_codes(intensities):
+    return intensities.where((intensities >= 0) & (intensities <= 12), -1).astype(int)
 
 # Helper function to fetch data and process for resume cards
+@memoize('events.resume_data', version=data_version)
 def get_resume_data(eventid):
     db_path = load_db_path()  # Load the database path from JSON file
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
 
     # Fetching data
-    query_eventinfo = f"SELECT magnitude, origintime, depth, description FROM eventinfo WHERE eventid='{eventid}' ORDER BY updatetime DESC LIMIT 1"
-    df_eventinfo = pd.read_sql(query_eventinfo, conn)
+    query_eventinfo = "SELECT magnitude, origintime, depth, description FROM eventinfo WHERE eventid = ? ORDER BY updatetime DESC LIMIT 1"
+    df_eventinfo = read_sql(query_eventinfo, conn, 'events.resume.eventinfo', params=(eventid,))
 
-    query_intensity = f"SELECT intensity FROM intensityreports WHERE eventid='{eventid}'"
-    df_intensity = pd.read_sql(query_intensity, conn)
+    query_intensity = "SELECT intensity FROM intensityreports WHERE eventid = ?"
+    df_intensity = read_sql(query_intensity, conn, 'events.resume.intensityreports', params=(eventid,))
+    cancellation.check()
 
-    query_eventnotif = f"SELECT userid, osversion FROM eventnotif WHERE eventid='{eventid}'"
-    df_eventnotif = pd.read_sql(query_eventnotif, conn)
+    df_eventnotif = read_snapshot(db_path, 'eventnotif', ['userid', 'osversion'], {'eventid': eventid}, codes=True)
+    if df_eventnotif is None:
+        query_eventnotif = "SELECT userid, osversion FROM eventnotif WHERE eventid = ?"
+        df_eventnotif = read_sql(query_eventnotif, conn, 'events.resume.eventnotif', params=(eventid,))
+    encode_ids(df_eventnotif)
     
     conn.close()
 
@@ -178,29 +194,215 @@ def get_resume_data(eventid):
 
     return magnitude, origintime, depth, description, max_intensity, total_users, android_users, ios_users, intensity_report_users
 
-# Function to get data for dashboards
+# Function to get data for dashboards. The notifications are not needed
+# here: the browser draws their figures from get_client_data()
+@memoize('events.data', version=data_version)
 def get_data(eventid):
     db_path = load_db_path()  # Load the database path from JSON file
-    conn = sqlite3.connect(db_path)
+    conn = connect_db(db_path)
     
     # Get reported intensity data
-    query_intensity = f"SELECT * FROM intensityreports WHERE eventid='{eventid}'"
-    df_intensity = pd.read_sql(query_intensity, conn)
-    
-    # Get event notification data containing swavearrival
-    query_eventnotif = f"SELECT * FROM eventnotif WHERE eventid='{eventid}'"
-    df_eventnotif = pd.read_sql(query_eventnotif, conn)
+    query_intensity = "SELECT * FROM intensityreports WHERE eventid = ?"
+    df_intensity = read_sql(query_intensity, conn, 'events.intensityreports', params=(eventid,))
+    cancellation.check()
     
     # Get epicenter data
-    query_eventinfo = f"SELECT * FROM eventinfo WHERE eventid='{eventid}' ORDER BY updatetime DESC LIMIT 1"
-    df_eventinfo = pd.read_sql(query_eventinfo, conn)
+    query_eventinfo = "SELECT * FROM eventinfo WHERE eventid = ? ORDER BY updatetime DESC LIMIT 1"
+    df_eventinfo = read_sql(query_eventinfo, conn, 'events.eventinfo', params=(eventid,))
     
     conn.close()
-    return df_intensity, df_eventnotif, df_eventinfo
+    return df_intensity, df_eventinfo
+
+# Number of notifications of every updateno, from the trigger-maintained
+# summary when it is installed (summaries.py)
+@memoize('events.updateno_counts', version=data_version)
+def get_updateno_counts(eventid):
+    conn = connect_db(load_db_path())
+    if summaries.installed(conn, 'eventnotif'):
+        query = ("SELECT NULLIF(updateno, '') AS updateno, SUM(rows) AS count FROM eventnotif_summary "
+                 "WHERE eventid = ? GROUP BY 1")
+    else:
+        query = "SELECT updateno, COUNT(*) AS count FROM eventnotif WHERE eventid = ? GROUP BY updateno"
+    df_counts = read_sql(query, conn, 'events.updateno_counts', params=(eventid,))
+    conn.close()
+    return df_counts.dropna().astype({'updateno': int}).set_index('updateno')['count']
+
+# Updatenos with at least 1/3 of the notifications of updateno 0
+@memoize('events.valid_updatenos', version=data_version)
+def get_valid_updatenos(eventid):
+    counts = get_updateno_counts(eventid)
+    total_updateno_0 = counts.get(0, 0)
+    return sorted(int(updateno) for updateno, count in counts.items() if count >= total_updateno_0 / 3)
+
+# Signature of the notifications of every updateno, telling the enriched
+# rows computed from other notifications (enrichment.py)
+@memoize('events.updateno_signatures', version=data_version)
+def get_updateno_signatures(eventid):
+    conn = connect_db(load_db_path())
+    df_signatures = read_sql(enrichment.signature_query(), conn, 'events.updateno_signatures', params=(eventid,))
+    conn.close()
+    return df_signatures.dropna().astype({'updateno': int}).set_index('updateno')['signature']
+
+# Notifications of some updatenos of an event, to be enriched (enrichment.py).
+# Only a snapshot of the current DB is used: the enriched rows are stored
+# with the signatures of the DB.
+def load_notifications(eventid, updatenos):
+    db_path = load_db_path()
+    df_eventnotif = read_snapshot(db_path, 'eventnotif', enrichment.SOURCE_COLUMNS, {'eventid': eventid},
+                                  max_age=0)
+    if df_eventnotif is not None:
+        return df_eventnotif[df_eventnotif['updateno'].isin(updatenos)]
+    conn = connect_db(db_path)
+    query = (f"SELECT {', '.join(enrichment.SOURCE_COLUMNS)} FROM eventnotif "
+             f"WHERE eventid = ? AND updateno IN ({', '.join('?' * len(updatenos))})")
+    df_eventnotif = read_sql(query, conn, 'events.eventnotif', params=(eventid, *updatenos))
+    conn.close()
+    return df_eventnotif
 
+# Compact per-event notification data for the clientside callbacks of
+# assets/events.js: the delay, alert and S-wave figures are filtered by
+# updateno/osversion in the browser, the server only answers eventid changes.
+# The locations and distances come from the enriched notifications, which
+# are only computed again for changed updatenos or a new location of the event.
+@memoize('events.client_data', version=data_version)
+def get_client_data(eventid):
+    import plotly.colors
+    import plotly.express as px
+    import plotly.io as pio
+
+    conn = connect_db(load_db_path())
+    df_eventinfo = read_sql("SELECT latitude, longitude, depth, magnitude FROM eventinfo WHERE eventid = ? "
+                            "ORDER BY updatetime DESC LIMIT 1", conn, 'events.eventinfo', params=(eventid,))
+    conn.close()
+    counts = get_updateno_counts(eventid)
+    if df_eventinfo.empty or counts.empty:
+        return None
+    cancellation.check()
+
+    event = df_eventinfo.iloc[0]
+    epicenter = (float(event['latitude']), float(event['longitude']), event['depth'])
+    signatures = get_updateno_signatures(eventid)
+    df_eventnotif = enrichment.enriched_notifications(load_db_path(), eventid, epicenter, signatures,
+                                                      lambda updatenos: load_notifications(eventid, updatenos))
+    cancellation.check()
+
+    osversions = df_eventnotif['osversion'].fillna('').str.lower()
+    categories = sorted(osversions.unique())
+
+    return {
+        'eventid': str(eventid),
+        'epicenter': {'lat': epicenter[0], 'lon': epicenter[1], 'magnitude': str(event['magnitude'])},
+        'valid_updatenos': get_valid_updatenos(eventid),
+        'osversions': categories,
+        'columns': {
+            'updateno': encode_array(df_eventnotif['updateno'].to_numpy()),
+            'osversion': encode_array(osversions.map({os: code for code, os in enumerate(categories)}).to_numpy()),
+            'delay': encode_array(df_eventnotif['delay'].to_numpy(dtype=float), 3),
+            'alert': encode_array(df_eventnotif['alert'].fillna(0).to_numpy(dtype=int)),
+            'swavearrival': encode_array(df_eventnotif['swavearrival'].to_numpy(dtype=float), 3),
+            'lat': encode_array(df_eventnotif['lat'].to_numpy(dtype=float), 5),
+            'lon': encode_array(df_eventnotif['lon'].to_numpy(dtype=float), 5),
+            'epi_distance': encode_array(df_eventnotif['epi_distance'].to_numpy(dtype=float), 3),
+            # Unknown arrivals are never drawn, they are filtered out by swavearrival
+            'swave_sign': encode_array(df_eventnotif['swave_sign'].fillna(0).to_numpy(dtype=int)),
+        },
+        'styles': {
+            'template': pio.templates['plotly_white'].to_plotly_json(),
+            'colors': list(px.colors.qualitative.Dark24),
+            'colorscale': plotly.colors.get_colorscale('BrBG'),
+            'webgl_min': figures.WEBGL_MIN,
+        },
+        'swave_ranges': {'map': enrichment.SWAVE_MAP_RANGE, 'counted': enrichment.SWAVE_RANGE},
+    }
+
+# Translation dictionary
+translations = {
+    'en': {
+        'header_title': "Earthquake Visualization",
+        'eventid_placeholder': "Enter eventid",
+        'updateno_placeholder': "Select Updateno (Intensity/Swavearrival)",
+        'osversion_placeholder': "Select OS Version (Intensity/Swavearrival)",
+        'event': "Event",
+        'max_intensity': "Maximum Reported Intensity",
+        'notified_users': "Notified Users",
+        'event_description': "Magnitude: {magnitude}, Depth: {depth} KM.",
+        'event_details': "{description}\nDate and Time: {origintime} (UTC)",
+        'intensity_report': "{count} user reports",
+        'total_users': "{count} Users",
+        'intensity_map_title': "Intensity Map",
+        'intensity_distance_title': "Reported Intensities (EMS-98) vs Distance",
+        'delay_distribution_title': "Delay Distribution",
+        'delay': "Delay [s]",
+        'update': "Update",
+        'number_of_users': "Number of Users",
+        'alert_types_title': "Notification Types by Update",
+        'update_number': "Update Number",
+        'swave_map_title': "Swavearrival Map",
+        'swave_before': "{percentage}% arrived before S-wave",
+        'swave_after': "{percentage}% arrived with or after S-wave",
+        'epicentral_distance': "Epicentral Distance (km)",
+        'swave_arrival_time': "S-wave Arrival Time (s)",
+        'swave_distance_title': "Epicentral Distance vs S-wave Arrival Time",
+        '--': '--',
+        'I. Not Felt': 'I. Not Felt',
+        'II. Very Weak': 'II. Very Weak',
+        'III. Weak': 'III. Weak',
+        'IV. Light': 'IV. Light',
+        'V. Moderate': 'V. Moderate',
+        'VI. Strong': 'VI. Strong',
+        'VII. Very Strong': 'VII. Very Strong',
+        'VIII. Severe': 'VIII. Severe',
+        'IX. Violent': 'IX. Violent',
+        'X. Extreme': 'X. Extreme',
+        'XI. Extreme': 'XI. Extreme',
+        'XII. Extreme': 'XII. Extreme',
+    },
+    'es': {
+        'header_title': "Visualización de Sismos",
+        'eventid_placeholder': "Ingrese el eventid",
+        'updateno_placeholder': "Seleccione Updateno (Intensidad/Swavearrival)",
+        'osversion_placeholder': "Seleccione OS Version (Intensidad/Swavearrival)",
+        'event': "Evento",
+        'max_intensity': "Máxima Intensidad Reportada",
+        'notified_users': "Usuarios Notificados",
+        'event_description': "Magnitud: {magnitude}, Prof.: {depth} KM.",
+        'event_details': "{description}\nFecha y Hora del sismo: {origintime} (UTC)",
+        'intensity_report': "{count} reportes de Usuarios",
+        'total_users': "{count} Usuarios",
+        'intensity_map_title': "Mapa de Intensidades",
+        'intensity_distance_title': "Intensidades Reportadas (EMS-98) vs Distancia",
+        'delay_distribution_title': "Distribución de los Retrasos",
+        'delay': "Retraso [s]",
+        'update': "Actualización",
+        'number_of_users': "Número de Usuarios",
+        'alert_types_title': "Tipos de Notificaciones por Actualización",
+        'update_number': "Número de Actualización",
+        'swave_map_title': "Mapa de Swavearrival",
+        'swave_before': "{percentage}% llegó antes de la onda S",
+        'swave_after': "{percentage}% llegó con o después de la onda S",
+        'epicentral_distance': "Distancia Epicentral (km)",
+        'swave_arrival_time': "Tiempo de llegada de la onda S (s)",
+        'swave_distance_title': "Distancia Epicentral vs Tiempo de llegada de la onda S",
+        '--': '--',
+        'I. Not Felt': 'I. No Sentido',
+        'II. Very Weak': 'II. Muy Débil',
+        'III. Weak': 'III. Débil',
+        'IV. Light': 'IV. Leve',
+        'V. Moderate': 'V. Moderada',
+        'VI. Strong': 'VI. Fuerte',
+        'VII. Very Strong': 'VII. Muy Fuerte',
+        'VIII. Severe': 'VIII. Severo',
+        'IX. Violent': 'IX. Violento',
+        'X. Extreme': 'X. Extremo',
+        'XI. Extreme': 'XI. Extremo',
+        'XII. Extreme': 'XII. Extremo',
+    }
+}
 
 # Layout of the dashboard
 layout = dbc.Container([
+    i18n.store('events-translations', translations),
+    dcc.Store(id='event-data'),
     dbc.Row([
         dbc.Col([
             html.H1(id="header-title", className="text-center mb-4"),
@@ -295,6 +497,22 @@ layout = dbc.Container([
 ], fluid=True)
 
 def register_callbacks(app):
+    # The texts, the cards and the figures are relabelled in the browser when
+    # the language changes
+    i18n.register(
+        app, 'language-dropdown', 'events-translations',
+        texts=[('header-title', 'children', 'header_title'),
+               ('input-eventid', 'placeholder', 'eventid_placeholder'),
+               ('dropdown-updateno-1', 'placeholder', 'updateno_placeholder'),
+               ('dropdown-osversion-1', 'placeholder', 'osversion_placeholder'),
+               ('event-card-header', 'children', 'event'),
+               ('max-intensity-card-header', 'children', 'max_intensity'),
+               ('notified-users-card-header', 'children', 'notified_users')],
+        figures=['map-intensities', 'graph-intensity', 'graph-delay', 'graph-alert',
+                 'map-swavearrival', 'graph-swavearrival'],
+        trees=['event-description', 'event-details', 'max-intensity', 'intensity-report', 'total-users']
+    )
+
     # Callback to update the dropdown of `updateno` and `osversion` for the first dashboard
     @app.callback(
         [Output('dropdown-updateno-1', 'options'),
@@ -303,16 +521,11 @@ def register_callbacks(app):
     )
     def update_dropdown_1(eventid):
         if eventid:
-            _, df_eventnotif, _ = get_data(eventid)
-            if df_eventnotif.empty:
+            # Updatenos that have at least 1/3 of the lines of updateno = 0
+            valid_updatenos = get_valid_updatenos(eventid)
+            if not valid_updatenos:
                 return [], None
     
-            # Count lines for updateno = 0
-            total_updateno_0 = df_eventnotif[df_eventnotif['updateno'] == 0].shape[0]
-            
-            # Filter updatenos that meet the condition of having at least 1/3 of the lines of updateno = 0
-            valid_updatenos = df_eventnotif.groupby('updateno').filter(lambda x: x.shape[0] >= total_updateno_0 / 3)['updateno'].unique()
-    
             # Create options for the dropdown, including the "all" option
             updateno_options = [{'label': 'All', 'value': 'all'}] + [{'label': f'Updateno {updateno}', 'value': updateno} for updateno in sorted(valid_updatenos)]
             
@@ -320,23 +533,6 @@ def register_callbacks(app):
         
         return [], None
     
-    @app.callback(
-        [Output('dropdown-osversion-1', 'options'),
-         Output('dropdown-osversion-1', 'value')],
-        [Input('dropdown-updateno-1', 'value'),
-         Input('input-eventid', 'value')]
-    )
-    def update_osversion_1(updateno, eventid):
-        if eventid and updateno is not None:
-            _, df_eventnotif, _ = get_data(eventid)
-            if df_eventnotif.empty:
-                return [], None
-            
-            osversion_options = [{'label': 'All', 'value': 'all'}, {'label': 'Android', 'value': 'android'}, {'label': 'iOS', 'value': 'ios'}]
-            return osversion_options, 'all'
-        
-        return [], None
-    
     # Callback to update the dropdown of `updateno` for the second dashboard
     @app.callback(
         [Output('dropdown-updateno-2', 'options'),
@@ -345,16 +541,11 @@ def register_callbacks(app):
     )
     def update_dropdown_2(eventid):
         if eventid:
-            _, df_eventnotif, _ = get_data(eventid)
-            if df_eventnotif.empty:
+            # Updatenos that have at least 1/3 of the lines of updateno = 0
+            valid_updatenos = get_valid_updatenos(eventid)
+            if not valid_updatenos:
                 return [], None
     
-            # Count lines for updateno = 0
-            total_updateno_0 = df_eventnotif[df_eventnotif['updateno'] == 0].shape[0]
-            
-            # Filter updatenos that meet the condition of having at least 1/3 of the lines of updateno = 0
-            valid_updatenos = df_eventnotif.groupby('updateno').filter(lambda x: x.shape[0] >= total_updateno_0 / 3)['updateno'].unique()
-    
             # Create options for the dropdown
             updateno_options = [{'label': f'Updateno {updateno}', 'value': updateno} for updateno in sorted(valid_updatenos)]
             
@@ -362,22 +553,24 @@ def register_callbacks(app):
         
         return [], None
     
-    # Callback to update the first dashboard for intensities, swavearrival, and the delay and alert histogram
+    # Callback to update the first dashboard for the intensities, the delay and
+    # alert histograms are drawn in the browser from the event data
     @app.callback(
         [Output('map-intensities', 'figure'),
-         Output('graph-intensity', 'figure'),
-         Output('graph-delay', 'figure'),
-         Output('graph-alert', 'figure')],
-        [Input('input-eventid', 'value'),
-         Input('dropdown-updateno-1', 'value'),
-         Input('dropdown-osversion-1', 'value'),
-         Input('language-dropdown', 'value')]
+         Output('graph-intensity', 'figure')],
+        [Input('input-eventid', 'value')],
+        [State('language-dropdown', 'value')]
     )
-    def update_dashboard_1(eventid, updateno, osversion, language):
+    @memoize('events.dashboard_1', version=data_version)
+    @compact_outputs
+    def update_dashboard_1(eventid, language):
+        import plotly.express as px
+
         if eventid:
-            df_intensity, df_eventnotif, df_eventinfo = get_data(eventid)
+            df_intensity, df_eventinfo = get_data(eventid)
             if df_eventinfo.empty:
-                return {}, {}, {}, {}
+                return {}, {}
+            cancellation.check()
             
             magnitude = df_eventinfo.iloc[0]['magnitude']
             depth = df_eventinfo.iloc[0]['depth']
@@ -391,357 +584,168 @@ def register_callbacks(app):
                 percentil_95 = df_intensity['intensity'].quantile(0.95)
                 df_intensity_filtered = df_intensity[df_intensity['intensity'] <= percentil_95]
                 
-                # Translate intensity labels based on selected language
-                if language == 'es':
-                    intensity_map = {
-                        'I. Not Felt': 'I. No Sentido',
-                        'II. Very Weak': 'II. Muy Débil',
-                        'III. Weak': 'III. Débil',
-                        'IV. Light': 'IV. Leve',
-                        'V. Moderate': 'V. Moderada',
-                        'VI. Strong': 'VI. Fuerte',
-                        'VII. Very Strong': 'VII. Muy Fuerte',
-                        'VIII. Severe': 'VIII. Severo',
-                        'IX. Violent': 'IX. Violento',
-                        'X. Extreme': 'X. Extremo',
-                        'XI. Extreme': 'XI. Extremo',
-                        'XII. Extreme': 'XII. Extremo',
-                    }
-                else:
-                    intensity_map = {
-                        'I. Not Felt': 'I. Not Felt',
-                        'II. Very Weak': 'II. Very Weak',
-                        'III. Weak': 'III. Weak',
-                        'IV. Light': 'IV. Light',
-                        'V. Moderate': 'V. Moderate',
-                        'VI. Strong': 'VI. Strong',
-                        'VII. Very Strong': 'VII. Very Strong',
-                        'VIII. Severe': 'VIII. Severe',
-                        'IX. Violent': 'IX. Violent',
-                        'X. Extreme': 'X. Extreme',
-                        'XI. Extreme': 'XI. Extreme',
-                        'XII. Extreme': 'XII. Extreme',
-                    }
+                # Intensity labels in the selected language
+                intensity_map = {label: translations[language][label] for label in translations['en'] if '. ' in label}
     
                 # Map the intensity values for the legend
-                df_intensity_filtered['EMS-98'] = df_intensity_filtered['intensity'].apply(
-                    lambda x: intensity_map[intToColorDescription(x).split(";")[0]]
-                )
-                df_intensity_filtered['color'] = df_intensity_filtered['intensity'].apply(
-                    lambda x: intToColorDescription(x).split(";")[1]
-                )
+                codes = intensity_codes(df_intensity_filtered['intensity'])
+                df_intensity_filtered['EMS-98'] = codes.map({code: translations[language][label] for code, (label, _) in INTENSITY_CLASSES.items()})
+                df_intensity_filtered['color'] = codes.map({code: color for code, (_, color) in INTENSITY_CLASSES.items()})
     
                 # Intensity map
-                fig_map_intensities = px.scatter_mapbox(
-                    df_intensity_filtered, lat="lat", lon="lon", color="EMS-98",
-                    color_discrete_map={intensity_map[intToColorDescription(k).split(";")[0]]: intToColorDescription(k).split(";")[1] for k in range(13)},
-                    size_max=15, zoom=5, mapbox_style="carto-positron"
-                )
+                def build_map_intensities():
+                    fig_map_intensities = px.scatter_mapbox(
+                        df_intensity_filtered, lat="lat", lon="lon", color="EMS-98",
+                        color_discrete_map={intensity_map[intToColorDescription(k).split(";")[0]]: intToColorDescription(k).split(";")[1] for k in range(13)},
+                        size_max=15, zoom=5, mapbox_style="carto-positron"
+                    )
                 
-                # Add a black circle for the epicenter
-                epiMap = go.Scattermapbox(
-                    lat=[epiLat],
-                    lon=[epiLon],
-                    mode='markers',
-                    marker=go.scattermapbox.Marker(
-                        size=20,
-                        color='black',
-                        symbol='circle'
-                    ),
-                    text="Mag: " + str(magnitude),
-                    name="Epicenter"
-                )
+                    # Add a black circle for the epicenter
+                    epiMap = go.Scattermapbox(
+                        lat=[epiLat],
+                        lon=[epiLon],
+                        mode='markers',
+                        marker=go.scattermapbox.Marker(
+                            size=20,
+                            color='black',
+                            symbol='circle'
+                        ),
+                        text="Mag: " + str(magnitude),
+                        name="Epicenter"
+                    )
                 
-                fig_map_intensities.add_trace(epiMap)
+                    fig_map_intensities.add_trace(epiMap)
                 
-                fig_map_intensities.update_layout(
-                    mapbox=dict(
-                        center=dict(lat=epiLat, lon=epiLon),
-                        zoom=5
-                    ),
-                    title="Mapa de Intensidades" if language == 'es' else "Intensity Map"
-                )
-    
+                    fig_map_intensities.update_layout(
+                        mapbox=dict(
+                            center=dict(lat=epiLat, lon=epiLon),
+                            zoom=5
+                        ),
+                        title=translations[language]['intensity_map_title']
+                    )
+                    labels = {'layout.title.text': 'intensity_map_title'}
+                    english = {translations[language][label]: label for label in intensity_map}
+                    for index, trace in enumerate(fig_map_intensities.data):
+                        if trace.name in english:
+                            labels[f'data.{index}.name'] = english[trace.name]
+                    i18n.tag_figure(fig_map_intensities, labels)
+                    return fig_map_intensities
+
                 # Intensity vs Hypocentral Distance Graph
-                distances = []
-                reported_intensities = []
-                colors = []
-    
-                for index, row in df_intensity_filtered.iterrows():
-                    if pd.notnull(row['lat']) and pd.notnull(row['lon']):
-                        epi_distance = distanceEpiToPoint(epiLat, epiLon, row['lat'], row['lon'])
-                        hypo_distance = distanceHypoToPoint(epiLat, epiLon, depth, row['lat'], row['lon'])
-                        
-                        distances.append(hypo_distance)
-                        reported_intensities.append(row['intensity'])
-                        colors.append(row['color'])
-                
-                # Generate theoretical distances for Allen
-                allenDist = [x for x in range(0, 500, 10)]
-                allen_intensities = [ipe_allen2012_hyp(d, magnitude, depth) for d in allenDist]
-                sigma_allen = [ipe_allen2012_hyp_sigma(d, depth) for d in allenDist]
-    
-                fig_intensity = go.Figure()
-    
-                # Central line (Theoretical Intensity)
-                fig_intensity.add_trace(go.Scatter(
-                    x=allenDist,
-                    y=allen_intensities,
-                    mode='lines',
-                    name="Allen's IPE 2012 (MMI)",
-                    line=dict(color='black')
-                ))
-    
-                # Band of +σ and -σ
-                fig_intensity.add_trace(go.Scatter(
-                    x=allenDist,
-                    y=[i + s for i, s in zip(allen_intensities, sigma_allen)],
-                    mode='lines',
-                    name='+σ (SD) (MMI)',
-                    line=dict(color='gray', dash='dash')
-                ))
-    
-                fig_intensity.add_trace(go.Scatter(
-                    x=allenDist,
-                    y=[i - s for i, s in zip(allen_intensities, sigma_allen)],
-                    mode='lines',
-                    name='-σ (SD) (MMI)',
-                    line=dict(color='gray', dash='dash')
-                ))
-    
-                # Reported intensity points with colors
-                fig_intensity.add_trace(go.Scatter(
-                    x=distances,
-                    y=reported_intensities,
-                    mode='markers',
-                    name='Reported Intensity',
-                    marker=dict(size=8, color=colors)
-                ))
-    
-                fig_intensity.update_layout(
-                    xaxis=dict(title='Hypocentral Distance [km]', type='log'),
-                    yaxis=dict(title='Intensity'),
-                    title="Reported Intensities (EMS-98) vs Distance" if language == 'en' else "Intensidades Reportadas (EMS-98) vs Distancia",
-                    template="plotly_white"
-                )
+                def build_intensity():
+                    located = df_intensity_filtered.dropna(subset=['lat', 'lon'])
+                    distances = hypo_distances(epiLat, epiLon, depth, located['lat'].to_numpy(dtype=float), located['lon'].to_numpy(dtype=float))
+                    reported_intensities = located['intensity'].to_numpy()
+                    colors = located['color'].to_numpy()
+    
+                    # Generate theoretical distances for Allen
+                    allenDist = [x for x in range(0, 500, 10)]
+                    allen_intensities = [ipe_allen2012_hyp(d, magnitude, depth) for d in allenDist]
+                    sigma_allen = [ipe_allen2012_hyp_sigma(d, depth) for d in allenDist]
+    
+                    fig_intensity = go.Figure()
+    
+                    # Central line (Theoretical Intensity)
+                    fig_intensity.add_trace(go.Scatter(
+                        x=allenDist,
+                        y=allen_intensities,
+                        mode='lines',
+                        name="Allen's IPE 2012 (MMI)",
+                        line=dict(color='black')
+                    ))
+    
+                    # Band of +σ and -σ
+                    fig_intensity.add_trace(go.Scatter(
+                        x=allenDist,
+                        y=[i + s for i, s in zip(allen_intensities, sigma_allen)],
+                        mode='lines',
+                        name='+σ (SD) (MMI)',
+                        line=dict(color='gray', dash='dash')
+                    ))
+    
+                    fig_intensity.add_trace(go.Scatter(
+                        x=allenDist,
+                        y=[i - s for i, s in zip(allen_intensities, sigma_allen)],
+                        mode='lines',
+                        name='-σ (SD) (MMI)',
+                        line=dict(color='gray', dash='dash')
+                    ))
+    
+                    # Reported intensity points with colors
+                    fig_intensity.add_trace(scatter(
+                        len(distances),
+                        x=distances,
+                        y=reported_intensities,
+                        mode='markers',
+                        name='Reported Intensity',
+                        marker=dict(size=8, color=colors)
+                    ))
+    
+                    fig_intensity.update_layout(
+                        xaxis=dict(title='Hypocentral Distance [km]', type='log'),
+                        yaxis=dict(title='Intensity'),
+                        title=translations[language]['intensity_distance_title'],
+                        template="plotly_white"
+                    )
+                    i18n.tag_figure(fig_intensity, {'layout.title.text': 'intensity_distance_title'})
+                    return fig_intensity
+
+                # Both figures are independent, see parallel.py
+                fig_map_intensities, fig_intensity = parallel.build({
+                    'events.map_intensities': build_map_intensities,
+                    'events.intensity_distance': build_intensity,
+                })
             else:
                 fig_map_intensities = {}
                 fig_intensity = {}
             
-            # --- Delay and Alert Graphs ---
-            
-            if df_eventnotif.empty or updateno is None:
-                return fig_map_intensities, fig_intensity, {}, {}
-    
-            # Filter valid updatenos
-            total_updateno_0 = df_eventnotif[df_eventnotif['updateno'] == 0].shape[0]
-            valid_updatenos = df_eventnotif.groupby('updateno').filter(lambda x: x.shape[0] >= total_updateno_0 / 3)['updateno'].unique()
-            
-            # Filter by osversion
-            if osversion and osversion != 'all':
-                df_eventnotif = df_eventnotif[df_eventnotif['osversion'].str.lower() == osversion.lower()]
-    
-            if updateno != 'all':
-                df_filtered = df_eventnotif[df_eventnotif['updateno'] == updateno]
-            else:
-                df_filtered = df_eventnotif[df_eventnotif['updateno'].isin(valid_updatenos)]
-    
-            # Histogram of delays by updateno
-            percentil_95 = df_filtered['delay'].quantile(0.95)
-            df_filtered = df_filtered[df_filtered['delay'] <= percentil_95]
-    
-            bin_width = 0.5  # Bin width in seconds
-            bins = np.arange(df_filtered['delay'].min(), df_filtered['delay'].max() + bin_width, bin_width)
-    
-            fig_delay = px.histogram(df_filtered, x="delay", nbins=len(bins), title="Delay Distribution" if language == 'en' else "Distribución de los Retrasos",
-                                     color="updateno", barmode="overlay", histnorm=None,
-                                     labels={"delay": "Delay [s]" if language == 'en' else "Retraso [s]", "updateno": "Update" if language == 'en' else "Actualización"},
-                                     color_discrete_sequence=px.colors.qualitative.Dark24)
-            fig_delay.update_layout(xaxis_title="Delay [s]" if language == 'en' else "Retraso [s]", yaxis_title="Number of Users" if language == 'en' else "Número de Usuarios", template="plotly_white")
-            fig_delay.update_xaxes(range=[-1, 120])  # Set X range from -1 to 120 seconds
-    
-            # Graph of categorized alerts
-            df_eventnotif['alert_category'] = df_eventnotif['alert'].apply(lambda x: 'Red Alert' if x == 1 else ('Orange Alert' if x == 2 else ('Green Alert' if x == 3 else 'Quick Notification')))
-            fig_alert = px.histogram(df_eventnotif[df_eventnotif['updateno'].isin(valid_updatenos)], x="updateno", color="alert_category", barmode="stack",
-                                     category_orders={"alert_category": ["Red Alert", "Orange Alert", "Green Alert", "Quick Notification"]},
-                                     color_discrete_map={"Red Alert": "#FF0000", "Orange Alert": "#FFA500", "Green Alert": "#008000", "Quick Notification": "#0000FF"},
-                                     title="Notification Types by Update" if language == 'en' else "Tipos de Notificaciones por Actualización")
-            fig_alert.update_layout(xaxis_title="Update Number" if language == 'en' else "Número de Actualización", yaxis_title="Number of Users" if language == 'en' else "Número de Usuarios", template="plotly_white", bargap=0.2)
-            fig_alert.update_xaxes(type='linear', tickmode='linear', dtick=1)  # Ensure X values are integers
-    
-            return fig_map_intensities, fig_intensity, fig_delay, fig_alert
+            return fig_map_intensities, fig_intensity
         
-        return {}, {}, {}, {}
+        return {}, {}
     
-    # Callback to update the second dashboard for swavearrival
+    # Per-event data of the clientside callbacks
     @app.callback(
-        [Output('map-swavearrival', 'figure'),
-         Output('graph-swavearrival', 'figure')],
-        [Input('input-eventid', 'value'),
-         Input('dropdown-updateno-2', 'value'),
-         Input('language-dropdown', 'value')]
+        Output('event-data', 'data'),
+        [Input('input-eventid', 'value')]
     )
-    def update_dashboard_2(eventid, updateno, language):
+    def update_event_data(eventid):
         if eventid:
-            _, df_eventnotif, df_eventinfo = get_data(eventid)
-            
-            if df_eventinfo.empty or df_eventnotif.empty or updateno is None:
-                return {}, {}
-    
-            magnitude = df_eventinfo.iloc[0]['magnitude']
-            depth = df_eventinfo.iloc[0]['depth']
-            epiLat = df_eventinfo.iloc[0]['latitude']
-            epiLon = df_eventinfo.iloc[0]['longitude']
-            
-            # Filter by the selected updateno
-            df_eventnotif = df_eventnotif[df_eventnotif['updateno'] == updateno]
-            
-            # Map of swavearrival
-            df_eventnotif = df_eventnotif[(df_eventnotif['swavearrival'] >= -50) & (df_eventnotif['swavearrival'] <= 50)]
-            
-            df_eventnotif['lat'] = df_eventnotif.apply(lambda row: row['userlat'] if row['alertsite'] == 1 else row['userlatpoi'], axis=1)
-            df_eventnotif['lon'] = df_eventnotif.apply(lambda row: row['userlon'] if row['alertsite'] == 1 else row['userlonpoi'], axis=1)
-            df_eventnotif = df_eventnotif.dropna(subset=['lat', 'lon'])
-    
-            fig_map_swavearrival = go.Figure(go.Scattermapbox(
-                lat=df_eventnotif['lat'],
-                lon=df_eventnotif['lon'],
-                mode='markers',
-                marker=go.scattermapbox.Marker(
-                    size=6,
-                    color=df_eventnotif['swavearrival'],
-                    colorscale='BrBG',
-                    colorbar=dict(
-                        title='swavearrival (s)',
-                        x=0.5,
-                        y=-0.1,
-                        orientation='h',
-                        thickness=15
-                    ),
-                    symbol='circle'
-                ),
-                text=df_eventnotif['swavearrival'],
-                name=f'Updateno {updateno}'
-            ))
-    
-            fig_map_swavearrival.add_trace(go.Scattermapbox(
-                lat=[epiLat],
-                lon=[epiLon],
-                mode='markers',
-                marker=go.scattermapbox.Marker(
-                    size=20,
-                    color='black',
-                    symbol='circle'
-                ),
-                text="Mag: " + str(magnitude),
-                name="Epicenter"
-            ))
-    
-            fig_map_swavearrival.update_layout(
-                mapbox=dict(
-                    center=dict(lat=epiLat, lon=epiLon),
-                    zoom=5,
-                    style="carto-positron"
-                ),
-                margin=dict(l=0, r=0, t=0, b=0),
-                title="Mapa de Swavearrival" if language == 'es' else "Swavearrival Map"
-            )
-    
-            # Epicentral Distance vs Swavearrival Graph
-            df_eventnotif = df_eventnotif[(df_eventnotif['swavearrival'] >= -30) & (df_eventnotif['swavearrival'] <= 120)]
-            
-            df_eventnotif['lat'] = df_eventnotif.apply(lambda row: row['userlat'] if row['alertsite'] == 1 else row['userlatpoi'], axis=1)
-            df_eventnotif['lon'] = df_eventnotif.apply(lambda row: row['userlon'] if row['alertsite'] == 1 else row['userlonpoi'], axis=1)
-            df_eventnotif = df_eventnotif.dropna(subset=['lat', 'lon'])
-    
-            df_eventnotif['epi_distance'] = df_eventnotif.apply(lambda row: distanceEpiToPoint(epiLat, epiLon, row['lat'], row['lon']), axis=1)
-            
-            total = len(df_eventnotif)
-            before_swave = len(df_eventnotif[df_eventnotif['swavearrival'] >= 0])
-            after_swave = len(df_eventnotif[df_eventnotif['swavearrival'] < 0])
-    
-            try:
-                percentage_before = (before_swave / total) * 100
-            except:
-                # potential division by zero
-                percentage_before = 0
-            try:
-                percentage_after = (after_swave / total) * 100
-            except:
-                # potential division by zero
-                percentage_after = 0
-    
-            fig_swavearrival = go.Figure()
-    
-            fig_swavearrival.add_trace(go.Scatter(
-                x=df_eventnotif['epi_distance'],
-                y=df_eventnotif['swavearrival'],
-                mode='markers',
-                marker=dict(
-                    size=6,
-                    color='white',
-                    line=dict(width=1, color=['red' if val < 0 else 'green' for val in df_eventnotif['swavearrival']])
-                ),
-                name=f'Updateno {updateno}'
-            ))
-    
-            fig_swavearrival.add_shape(
-                go.layout.Shape(
-                    type="line",
-                    x0=0, y0=0, x1=max(df_eventnotif['epi_distance']), y1=0,
-                    line=dict(color="black", width=2)
-                )
-            )
-    
-            fig_swavearrival.add_annotation(
-                xref="paper", yref="paper",
-                x=0.5, y=1.1,
-                showarrow=False,
-                text=f"{percentage_before:.0f}% arrived before S-wave" if language == 'en' else f"{percentage_before:.0f}% llegó antes de la onda S",
-                font=dict(color="green")
-            )
-            fig_swavearrival.add_annotation(
-                xref="paper", yref="paper",
-                x=0.5, y=1.05,
-                showarrow=False,
-                text=f"{percentage_after:.0f}% arrived with or after S-wave" if language == 'en' else f"{percentage_after:.0f}% llegó con o después de la onda S",
-                font=dict(color="red")
-            )
-    
-            fig_swavearrival.update_layout(
-                xaxis=dict(title='Epicentral Distance (km)' if language == 'en' else 'Distancia Epicentral (km)', range=[0, 120]),
-                yaxis=dict(title='S-wave Arrival Time (s)' if language == 'en' else 'Tiempo de llegada de la onda S (s)', range=[-30, 60]),
-                title="Epicentral Distance vs S-wave Arrival Time" if language == 'en' else "Distancia Epicentral vs Tiempo de llegada de la onda S",
-                template="plotly_white"
-            )
-    
-            return fig_map_swavearrival, fig_swavearrival
-        
-        return {}, {}
-    
-    # Callback to update the header title based on selected language
-    @app.callback(
-        Output('header-title', 'children'),
-        Input('language-dropdown', 'value')
+            return get_client_data(eventid)
+        return None
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='events', function_name='osversionOptions'),
+        [Output('dropdown-osversion-1', 'options'),
+         Output('dropdown-osversion-1', 'value')],
+        [Input('dropdown-updateno-1', 'value'),
+         Input('event-data', 'data')]
     )
-    def update_header(language):
-        if language == 'es':
-            return "Visualización de Sismos"
-        return "Earthquake Visualization"
-    
-    # Callback to update placeholder texts based on selected language
-    @app.callback(
-        [Output('input-eventid', 'placeholder'),
-         Output('dropdown-updateno-1', 'placeholder'),
-         Output('dropdown-osversion-1', 'placeholder')],
-        Input('language-dropdown', 'value')
+
+    # Delay and alert histograms, filtered by updateno and osversion
+    app.clientside_callback(
+        ClientsideFunction(namespace='events', function_name='delayAndAlerts'),
+        [Output('graph-delay', 'figure'),
+         Output('graph-alert', 'figure')],
+        [Input('event-data', 'data'),
+         Input('dropdown-updateno-1', 'value'),
+         Input('dropdown-osversion-1', 'value')],
+        [State('language-dropdown', 'value'),
+         State('events-translations', 'data')]
     )
-    def update_placeholders(language):
-        if language == 'es':
-            return ['Ingrese el eventid', "Seleccione Updateno (Intensidad/Swavearrival)", "Seleccione OS Version (Intensidad/Swavearrival)"]
-        return ['Enter eventid', "Select Updateno (Intensity/Swavearrival)", "Select OS Version (Intensity/Swavearrival)"]
-    
-    # Callback to populate the cards based on eventid and language
+
+    # Second dashboard, swavearrival map and distance graph of an updateno
+    app.clientside_callback(
+        ClientsideFunction(namespace='events', function_name='swavearrival'),
+        [Output('map-swavearrival', 'figure'),
+         Output('graph-swavearrival', 'figure')],
+        [Input('event-data', 'data'),
+         Input('dropdown-updateno-2', 'value')],
+        [State('language-dropdown', 'value'),
+         State('events-translations', 'data'),
+         State('map-swavearrival', 'figure')]
+    )
+
+    # Callback to populate the cards based on eventid, the labels follow the language in the browser
     @app.callback(
         [Output('event-description', 'children'),
          Output('event-details', 'children'),
@@ -749,44 +753,20 @@ def register_callbacks(app):
          Output('intensity-report', 'children'),
          Output('total-users', 'children'),
          Output('users-report', 'children'),
-         Output('max-intensity-card', 'style'),
-         Output('event-card-header', 'children'),
-         Output('max-intensity-card-header', 'children'),
-         Output('notified-users-card-header', 'children')],
-        [Input('input-eventid', 'value'),
-         Input('language-dropdown', 'value')]
+         Output('max-intensity-card', 'style')],
+        [Input('input-eventid', 'value')],
+        [State('language-dropdown', 'value')]
     )
     def update_resume_cards(eventid, language):
         if eventid:
             magnitude, origintime, depth, description, max_intensity, total_users, android_users, ios_users, intensity_users = get_resume_data(eventid)
             
-            # Translations
-            if language == 'es':
-                magnitud_label = "Magnitud"
-                evento_label = "Evento"
-                prof_label = "Prof."
-                fecha_hora_label = "Fecha y Hora del sismo"
-                max_intensidad_label = "Máxima Intensidad Reportada"
-                usuarios_notificados_label = "Usuarios Notificados"
-                usuarios_label = "Usuarios"
-                reportes_usuarios_label = "reportes de Usuarios"
-                max_intensity_text = f"{intToColorDescription(max_intensity).split(';')[0].replace('Light', 'Leve').replace('Moderate', 'Moderada').replace('Strong', 'Fuerte')}"
-            else:
-                magnitud_label = "Magnitude"
-                evento_label = "Event"
-                prof_label = "Depth"
-                fecha_hora_label = "Date and Time"
-                max_intensidad_label = "Maximum Reported Intensity"
-                usuarios_notificados_label = "Notified Users"
-                usuarios_label = "Users"
-                reportes_usuarios_label = "user reports"
-                max_intensity_text = f"{intToColorDescription(max_intensity).split(';')[0]}"
-            
             # Card content
-            event_description = f"{magnitud_label}: {magnitude}, {prof_label}: {depth} KM."
-            event_details = f"{description}\n{fecha_hora_label}: {origintime} (UTC)"
-            intensity_report = f"{intensity_users} {reportes_usuarios_label}"
-            total_users_text = f"{total_users} {usuarios_label}"
+            event_description = i18n.text(translations, language, 'event_description', magnitude=magnitude, depth=depth)
+            event_details = i18n.text(translations, language, 'event_details', description=description, origintime=origintime)
+            max_intensity_text = i18n.text(translations, language, intToColorDescription(max_intensity).split(';')[0])
+            intensity_report = i18n.text(translations, language, 'intensity_report', count=intensity_users)
+            total_users_text = i18n.text(translations, language, 'total_users', count=total_users)
             users_report = f"{android_users} Android, {ios_users} iOS"
             
             # Get background color based on intensity
@@ -794,10 +774,9 @@ def register_callbacks(app):
             card_style = {"background-color": background_color, "text-align": "center"}
             
             return (event_description, event_details, max_intensity_text, intensity_report, 
-                    total_users_text, users_report, card_style, 
-                    evento_label, max_intensidad_label, usuarios_notificados_label)
+                    total_users_text, users_report, card_style)
         
-        return [""] * 6 + [{"background-color": "#FFFFFF", "text-align": "center"}] + [""] * 3
+        return [""] * 6 + [{"background-color": "#FFFFFF", "text-align": "center"}]
     
     @app.callback(
         [Output('input-eventid', 'value'),
@@ -807,9 +786,9 @@ def register_callbacks(app):
     )
     def update_eventid_and_dropdown(eventid_from_store, selected_eventid):
         db_path = load_db_path()
-        conn = sqlite3.connect(db_path)
+        conn = connect_db(db_path)
         query = "SELECT eventid, origintime FROM eventinfo ORDER BY origintime DESC"
-        df_eventinfo = pd.read_sql(query, conn)
+        df_eventinfo = read_sql(query, conn, 'events.catalogue')
         conn.close()
 
         options = [{'label': f"{row['eventid']} ({row['origintime']})", 'value': row['eventid']} for _, row in df_eventinfo.iterrows()]
@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Delivery report across all the events: delays, notification types and
+alerts received before the S-wave, per event and updateno, as a sortable
+table and trend charts. The statistics of every event are computed in one
+grouped pass over the eventnotif table of the events dashboard DB.
+"""
+import dash_bootstrap_components as dbc
+from dash import dash_table, dcc, html
+from dash.dependencies import Input, Output, State
+import plotly.graph_objs as go
+from result_cache import memoize
+from snapshots import read_snapshot
+from metrics import read_sql
+from figures import compact_outputs
+from dashboard_events import load_db_path, connect_db, data_version
+import cancellation
+import enrichment
+import i18n
+import user_coverage
+
+# Notification types, as in the alert histogram of the events dashboard
+ALERT_TYPES = [('red', 1, '#FF0000'), ('orange', 2, '#FFA500'), ('green', 3, '#008000'), ('quick', None, '#0000FF')]
+
+# Columns of eventnotif read for the statistics: the location decides which
+# S-wave arrivals are counted (enrichment.swave_counted)
+EVENTNOTIF_COLUMNS = ['eventid', 'updateno', 'delay', 'alert', 'swavearrival',
+                      'alertsite', 'userlat', 'userlon', 'userlatpoi', 'userlonpoi']
+
+# Columns of the table
+COLUMNS = ['eventid', 'origintime', 'magnitude', 'updateno', 'notifications', 'delay_median', 'delay_p95',
+           'red', 'orange', 'green', 'quick', 'before_s']
+
+# Columns of the coverage table, per notification and platform
+COVERAGE_COLUMNS = ['kind', 'name', 'time', 'platform', 'registered', 'reached', 'coverage']
+
+translations = {
+    'en': {
+        'report_title': "Delivery Report of All Events",
+        'updateno_label': "Trends of update number",
+        'col_eventid': "Event",
+        'col_origintime': "Origin Time (UTC)",
+        'col_magnitude': "Magnitude",
+        'col_updateno': "Update",
+        'col_notifications': "Notifications",
+        'col_delay_median': "Median Delay [s]",
+        'col_delay_p95': "95th Percentile Delay [s]",
+        'col_red': "Red Alert [%]",
+        'col_orange': "Orange Alert [%]",
+        'col_green': "Green Alert [%]",
+        'col_quick': "Quick Notification [%]",
+        'col_before_s': "Before S-wave [%]",
+        'delay_trend_title': "Notification Delay by Event",
+        'alert_trend_title': "Notification Types by Event",
+        'swave_trend_title': "Alerts Received Before the S-wave by Event",
+        'origin_time': "Origin Time (UTC)",
+        'delay': "Delay [s]",
+        'share': "Share of Notifications [%]",
+        'median': "Median",
+        'p95': "95th Percentile",
+        'coverage_label': "Coverage of the registered users by",
+        'coverage_title': "Registered Users Reached per Day",
+        'day': "Day (UTC)",
+        'coverage': "Registered Users Reached [%]",
+        'col_kind': "Type",
+        'col_name': "Notification",
+        'col_time': "Time (UTC)",
+        'col_platform': "Platform",
+        'col_registered': "Registered Users",
+        'col_reached': "Users Reached",
+        'col_coverage': "Coverage [%]",
+    },
+    'es': {
+        'report_title': "Reporte de Entrega de Todos los Eventos",
+        'updateno_label': "Tendencias del número de actualización",
+        'col_eventid': "Evento",
+        'col_origintime': "Hora de Origen (UTC)",
+        'col_magnitude': "Magnitud",
+        'col_updateno': "Actualización",
+        'col_notifications': "Notificaciones",
+        'col_delay_median': "Retraso Mediano [s]",
+        'col_delay_p95': "Retraso Percentil 95 [s]",
+        'col_red': "Alerta Roja [%]",
+        'col_orange': "Alerta Naranja [%]",
+        'col_green': "Alerta Verde [%]",
+        'col_quick': "Notificación Rápida [%]",
+        'col_before_s': "Antes de la Onda S [%]",
+        'delay_trend_title': "Retraso de las Notificaciones por Evento",
+        'alert_trend_title': "Tipos de Notificación por Evento",
+        'swave_trend_title': "Alertas Recibidas Antes de la Onda S por Evento",
+        'origin_time': "Hora de Origen (UTC)",
+        'delay': "Retraso [s]",
+        'share': "Porcentaje de Notificaciones [%]",
+        'median': "Mediana",
+        'p95': "Percentil 95",
+        'coverage_label': "Cobertura de los usuarios registrados por",
+        'coverage_title': "Usuarios Registrados Alcanzados por Día",
+        'day': "Día (UTC)",
+        'coverage': "Usuarios Registrados Alcanzados [%]",
+        'col_kind': "Tipo",
+        'col_name': "Notificación",
+        'col_time': "Hora (UTC)",
+        'col_platform': "Plataforma",
+        'col_registered': "Usuarios Registrados",
+        'col_reached': "Usuarios Alcanzados",
+        'col_coverage': "Cobertura [%]",
+    }
+}
+
+
+# Statistics of every (eventid, updateno) of `df_eventnotif`, with the last
+# location of the event from `df_eventinfo`
+def event_stats(df_eventnotif, df_eventinfo):
+    alert = df_eventnotif['alert']
+    # Same notifications as in the S-wave graph of the events dashboard
+    counted = enrichment.swave_counted(df_eventnotif['swavearrival'], *enrichment.locations(df_eventnotif))
+    swave = df_eventnotif['swavearrival'].astype(float).where(counted)
+    known = [code for _, code, _ in ALERT_TYPES if code is not None]
+    flags = {name: (alert.eq(code) if code is not None else ~alert.isin(known)) for name, code, _ in ALERT_TYPES}
+    df = df_eventnotif[['eventid', 'updateno', 'delay']].assign(
+        swave_known=swave.notna(), before_s=swave.ge(0), **flags)
+
+    grouped = df.groupby(['eventid', 'updateno'], sort=False)
+    stats = grouped.agg(notifications=('delay', 'size'), delay_median=('delay', 'median'),
+                        swave_known=('swave_known', 'sum'), before_s=('before_s', 'sum'),
+                        **{name: (name, 'mean') for name, _, _ in ALERT_TYPES})
+    stats['delay_p95'] = grouped['delay'].quantile(0.95)
+    for name, _, _ in ALERT_TYPES:
+        stats[name] = stats[name] * 100
+    stats['before_s'] = (stats['before_s'] / stats['swave_known'].where(stats['swave_known'] > 0)) * 100
+    stats = stats.drop(columns='swave_known').reset_index()
+
+    events = df_eventinfo.sort_values('updatetime').drop_duplicates('eventid', keep='last')
+    stats = stats.merge(events[['eventid', 'origintime', 'magnitude']], on='eventid', how='left')
+    stats = stats.sort_values(['origintime', 'updateno'], ascending=[False, True])
+    return stats[COLUMNS].round({'magnitude': 1, 'delay_median': 2, 'delay_p95': 2, 'red': 1, 'orange': 1,
+                                 'green': 1, 'quick': 1, 'before_s': 1})
+
+
+@memoize('report.event_stats', version=data_version)
+def get_event_stats():
+    db_path = load_db_path()
+    conn = connect_db(db_path)
+    df_eventnotif = read_snapshot(db_path, 'eventnotif', EVENTNOTIF_COLUMNS)
+    if df_eventnotif is None:
+        df_eventnotif = read_sql(f"SELECT {', '.join(EVENTNOTIF_COLUMNS)} FROM eventnotif",
+                                 conn, 'report.eventnotif')
+    cancellation.check()
+    df_eventinfo = read_sql("SELECT eventid, updatetime, origintime, magnitude FROM eventinfo", conn, 'report.eventinfo')
+    conn.close()
+    return event_stats(df_eventnotif, df_eventinfo)
+
+
+# Layout, built when the tab is opened: the table holds the statistics of
+# every event and is sorted and filtered in the browser
+def layout():
+    stats = get_event_stats()
+    updatenos = sorted(int(updateno) for updateno in stats['updateno'].unique())
+    trans = translations['en']
+
+    return dbc.Container([
+        i18n.store('report-translations', translations),
+        dbc.Row([
+            dbc.Col(html.H1(trans['report_title'], id='report-title', className="text-center mt-4 mb-4"), width=8),
+            dbc.Col(dcc.Dropdown(
+                id='report-language',
+                options=[{'label': 'English', 'value': 'en'}, {'label': 'Español', 'value': 'es'}],
+                value='en',
+                clearable=False,
+                className="mt-4",
+            ), width=4),
+        ]),
+        dash_table.DataTable(
+            id='report-table',
+            columns=[{'name': trans[f'col_{column}'], 'id': column,
+                      'type': 'text' if column in ('eventid', 'origintime') else 'numeric'} for column in COLUMNS],
+            data=stats.to_dict('records'),
+            sort_action='native',
+            sort_mode='multi',
+            filter_action='native',
+            page_size=20,
+            style_table={'overflowX': 'auto'},
+            style_cell={'fontFamily': 'Arial', 'fontSize': 13, 'padding': '4px'},
+            style_header={'fontWeight': 'bold'},
+        ),
+        dbc.Row([
+            dbc.Col(html.Label(trans['updateno_label'], id='report-updateno-label', className="mt-4"), width=4),
+            dbc.Col(dcc.Dropdown(
+                id='report-updateno',
+                options=[{'label': f'Updateno {updateno}', 'value': updateno} for updateno in updatenos],
+                value=updatenos[0] if updatenos else None,
+                clearable=False,
+                className="mt-4",
+            ), width=4),
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Loading(type="circle", children=[dcc.Graph(id='report-delay-graph')]), width=6),
+            dbc.Col(dcc.Loading(type="circle", children=[dcc.Graph(id='report-swave-graph')]), width=6),
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Loading(type="circle", children=[dcc.Graph(id='report-alert-graph')]), width=12),
+        ]),
+        dbc.Row([
+            dbc.Col(html.Label(trans['coverage_label'], id='report-coverage-label', className="mt-4"), width=4),
+            dbc.Col(dcc.Dropdown(
+                id='report-coverage-source',
+                options=[{'label': 'Silent notifications and event alerts', 'value': 'all'},
+                         {'label': 'Silent notifications', 'value': 'silent'},
+                         {'label': 'Event alerts', 'value': 'event'}],
+                value='all',
+                clearable=False,
+                className="mt-4",
+            ), width=4),
+        ]),
+        dbc.Row([
+            dbc.Col(dcc.Loading(type="circle", children=[dcc.Graph(id='report-coverage-graph')]), width=12),
+        ]),
+        dash_table.DataTable(
+            id='report-coverage-table',
+            columns=[{'name': trans[f'col_{column}'], 'id': column,
+                      'type': 'numeric' if column in ('registered', 'reached', 'coverage') else 'text'}
+                     for column in COVERAGE_COLUMNS],
+            sort_action='native',
+            filter_action='native',
+            page_size=20,
+            style_table={'overflowX': 'auto'},
+            style_cell={'fontFamily': 'Arial', 'fontSize': 13, 'padding': '4px'},
+            style_header={'fontWeight': 'bold'},
+        ),
+    ], fluid=True)
+
+
+def register_callbacks(app):
+    i18n.register(
+        app, 'report-language', 'report-translations',
+        texts=[('report-title', 'children', 'report_title'),
+               ('report-updateno-label', 'children', 'updateno_label'),
+               ('report-coverage-label', 'children', 'coverage_label')],
+        figures=['report-delay-graph', 'report-swave-graph', 'report-alert-graph', 'report-coverage-graph']
+    )
+
+    # The column names follow the language in the browser as well
+    for table_id in ('report-table', 'report-coverage-table'):
+        app.clientside_callback(
+            """function(language, translations, columns) {
+                return columns.map((column) => Object.assign({}, column, {name: translations[language]['col_' + column.id]}));
+            }""",
+            Output(table_id, 'columns'),
+            [Input('report-language', 'value')],
+            [State('report-translations', 'data'),
+             State(table_id, 'columns')],
+            prevent_initial_call=True
+        )
+
+    # Trends of one updateno over the events, in the order of their origin time
+    @app.callback(
+        [Output('report-delay-graph', 'figure'),
+         Output('report-swave-graph', 'figure'),
+         Output('report-alert-graph', 'figure')],
+        [Input('report-updateno', 'value')],
+        [State('report-language', 'value')]
+    )
+    @memoize('report.trends', version=data_version)
+    @compact_outputs
+    def update_report_trends(updateno, language):
+        if updateno is None:
+            return {}, {}, {}
+        trans = translations[language]
+        stats = get_event_stats()
+        cancellation.check()
+        stats = stats[stats['updateno'] == updateno].sort_values('origintime')
+        hover = stats['eventid'] + ' (M' + stats['magnitude'].astype(str) + ')'
+
+        fig_delay = go.Figure()
+        for column, key, line_dash in (('delay_median', 'median', 'solid'), ('delay_p95', 'p95', 'dot')):
+            fig_delay.add_trace(go.Scatter(x=stats['origintime'], y=stats[column], mode='lines+markers',
+                                           name=trans[key], text=hover, line=dict(dash=line_dash)))
+        fig_delay.update_layout(title=trans['delay_trend_title'], xaxis_title=trans['origin_time'],
+                                yaxis_title=trans['delay'], template='plotly_white')
+        i18n.tag_figure(fig_delay, {'layout.title.text': 'delay_trend_title',
+                                    'layout.xaxis.title.text': 'origin_time',
+                                    'layout.yaxis.title.text': 'delay',
+                                    'data.0.name': 'median',
+                                    'data.1.name': 'p95'})
+
+        fig_swave = go.Figure(go.Scatter(x=stats['origintime'], y=stats['before_s'], mode='lines+markers',
+                                         text=hover, line=dict(color='green')))
+        fig_swave.update_layout(title=trans['swave_trend_title'], xaxis_title=trans['origin_time'],
+                                yaxis_title=trans['share'], yaxis_range=[0, 100], template='plotly_white')
+        i18n.tag_figure(fig_swave, {'layout.title.text': 'swave_trend_title',
+                                    'layout.xaxis.title.text': 'origin_time',
+                                    'layout.yaxis.title.text': 'share'})
+
+        fig_alert = go.Figure()
+        labels = {'layout.title.text': 'alert_trend_title', 'layout.yaxis.title.text': 'share'}
+        for index, (name, _, color) in enumerate(ALERT_TYPES):
+            fig_alert.add_trace(go.Bar(x=stats['eventid'], y=stats[name], name=trans[f'col_{name}'],
+                                       marker_color=color))
+            labels[f'data.{index}.name'] = f'col_{name}'
+        fig_alert.update_layout(title=trans['alert_trend_title'], yaxis_title=trans['share'], barmode='stack',
+                                template='plotly_white')
+        i18n.tag_figure(fig_alert, labels)
+
+        return fig_delay, fig_swave, fig_alert
+
+    # Coverage of the registered users (user_coverage.py), cached by the data
+    # version of the tokens DB as well
+    @app.callback(
+        [Output('report-coverage-graph', 'figure'),
+         Output('report-coverage-table', 'data')],
+        [Input('report-coverage-source', 'value')],
+        [State('report-language', 'value')]
+    )
+    @memoize('report.coverage', version=user_coverage.data_version)
+    @compact_outputs
+    def update_report_coverage(source, language):
+        trans = translations[language]
+        daily = user_coverage.daily_coverage(source)
+        cancellation.check()
+        notifications = user_coverage.notification_coverage()
+        if source != 'all':
+            notifications = notifications[notifications['kind'] == source]
+
+        fig_coverage = go.Figure()
+        for platform, df in daily.groupby('platform'):
+            fig_coverage.add_trace(go.Scatter(x=df['day'], y=df['coverage'], mode='lines+markers', name=platform,
+                                              customdata=df[['reached', 'registered']],
+                                              hovertemplate='%{y:.1f}% (%{customdata[0]} / %{customdata[1]})'))
+        fig_coverage.update_layout(title=trans['coverage_title'], xaxis_title=trans['day'],
+                                   yaxis_title=trans['coverage'], yaxis_range=[0, 100], template='plotly_white')
+        i18n.tag_figure(fig_coverage, {'layout.title.text': 'coverage_title',
+                                       'layout.xaxis.title.text': 'day',
+                                       'layout.yaxis.title.text': 'coverage'})
+
+        table = notifications[COVERAGE_COLUMNS].assign(
+            time=notifications['time'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+            coverage=notifications['coverage'].round(1))
+        return fig_coverage, table.to_dict('records')
@@ -15,49 +15,99 @@ GNU Affero General Public License for more details.
 
 Author: Billy Burgoa Rosso (billyburgoa@gmail.com)
 """
+from contextlib import closing
+
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html, Input, Output
-import plotly.express as px
+from dash import dcc, html, Input, Output, State, ctx
 import plotly.graph_objects as go
-import sqlite3
 import pandas as pd
 import numpy as np
-from scipy import stats
-import json
-from os import path
+from result_cache import memoize, file_version
+from snapshots import encode_ids, read_snapshot
+from metrics import read_sql
+from figures import compact_outputs, patch_traces, scatter
+from downsample import POINTS, downsample_figure, register_zoom, resampled, select, shown_points
+import cancellation
+import config
+import db
+import i18n
+import replica
+import spatial
+import summaries
 
-# Read the JSON file and load the database path
+# Database path of the dashboard, see config.py
 def load_db_path():
-    script_dir = path.dirname(path.abspath(__file__))
-    config_path = path.join(script_dir, 'dashboard_silent.json')
-    with open(config_path) as config_file:
-        config = json.load(config_file)
-    return config['database_path']
+    return config.database_path('silent')
+
+# Read-only connection to the dashboard DB, see db.py, or to its local
+# replica (replica.py). "immutable": true in the config marks the database as
+# a frozen copy, which a replica always is.
+def connect_db(db_path):
+    queried = replica.resolve(db_path)
+    return db.connect(queried, immutable=queried != db_path or config.get('silent').get('immutable', False))
+
+# Data version of the dashboard DB, used to key the shared result cache
+def data_version():
+    return file_version(replica.resolve(load_db_path()))
 
-# Set your Mapbox access token
+# Content of the store of a graph: the arguments and the data version of the
+# figure shown, None when a figure was built while the DB changed
+def shown_state(figure, version, *args):
+    if not figure or data_version() != version:
+        return None
+    return {'args': list(args), 'version': version}
+
+# Figure shown in the graph of `shown`, cached by the memoized `build`
+def shown_figure(build, shown, language):
+    hit, value = build.lookup(shown['version'], *shown['args'], language)
+    return value[0] if hit else None
+
+# Set your Mapbox access token (applied when the map is first drawn)
 mapbox_access_token = 'your_mapbox_token_here'  # Replace with your actual token
-px.set_mapbox_access_token(mapbox_access_token)
+
+# Initial zoom of the map, the points outside of its view are loaded when the
+# user pans or zooms out
+MAP_ZOOM = 10
 
 # Fetch initial data for dropdowns
+@memoize('silent.unique_values', version=data_version)
 def fetch_unique_values():
     db_path = load_db_path()  # Load the database path from JSON file
-    with sqlite3.connect(db_path) as conn:
-        senttimes = pd.read_sql_query("SELECT DISTINCT senttime, notifid FROM silentnotif", conn)
-        osversions = pd.read_sql_query("SELECT DISTINCT osversion FROM silentnotif", conn)
+    # The trigger-maintained summary has one row per group, see summaries.py
+    with closing(connect_db(db_path)) as conn:
+        if summaries.installed(conn, 'silentnotif'):
+            senttimes = read_sql("SELECT DISTINCT NULLIF(senttime, '') AS senttime, NULLIF(notifid, '') AS notifid "
+                                 "FROM silentnotif_summary", conn, 'silent.senttimes')
+            osversions = read_sql("SELECT DISTINCT NULLIF(osversion, '') AS osversion FROM silentnotif_summary",
+                                  conn, 'silent.osversions')
+            senttimes['senttime'] = pd.to_datetime(senttimes['senttime'], unit='ms')
+            return senttimes, osversions
+    df_snapshot = read_snapshot(db_path, 'silentnotif', ['senttime', 'notifid', 'osversion'])
+    if df_snapshot is not None:
+        senttimes = df_snapshot[['senttime', 'notifid']].drop_duplicates().reset_index(drop=True)
+        osversions = df_snapshot[['osversion']].drop_duplicates().reset_index(drop=True)
+    else:
+        with closing(connect_db(db_path)) as conn:
+            senttimes = read_sql("SELECT DISTINCT senttime, notifid FROM silentnotif", conn, 'silent.senttimes')
+            osversions = read_sql("SELECT DISTINCT osversion FROM silentnotif", conn, 'silent.osversions')
     senttimes['senttime'] = pd.to_datetime(senttimes['senttime'], unit='ms')
     return senttimes, osversions
 
-# Initial fetch
-senttimes, osversions = fetch_unique_values()
+# Options for dropdowns, the senttimes in descending order
+def dropdown_options():
+    senttimes, osversions = fetch_unique_values()
+    latest_senttime = senttimes['senttime'].max()
 
-# Get the latest senttime
-latest_senttime = senttimes['senttime'].max()
+    osversion_options = [{'label': 'All', 'value': 'All'}] + [{'label': os, 'value': os} for os in osversions['osversion']]
 
-# Options for dropdowns
-osversion_options = [{'label': 'All', 'value': 'All'}] + [{'label': os, 'value': os} for os in osversions['osversion']]
-senttime_options = [{'label': f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {notifid}", 'value': time.timestamp() * 1000}
-                    for time, notifid in zip(senttimes['senttime'], senttimes['notifid'])]
+    # Sort the senttimes in descending order
+    senttimes_sorted = senttimes.sort_values(by='senttime', ascending=False)
+
+    senttime_options = [{'label': f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {notifid}", 'value': time.timestamp() * 1000}
+                        for time, notifid in zip(senttimes_sorted['senttime'], senttimes_sorted['notifid'])]
+
+    return osversion_options, senttime_options, latest_senttime
 
 # Translation dictionary
 translations = {
@@ -103,170 +153,169 @@ translations = {
     }
 }
 
-# Layout
-layout = dbc.Container([
-    html.H1(id="dashboard-title", className="text-center mt-4 mb-4"),
-    
-    dbc.Row([
-        dbc.Col([
-            dcc.Dropdown(
-                id='language-dropdown',
-                options=[
-                    {'label': 'English', 'value': 'en'},
-                    {'label': 'Español', 'value': 'es'}
-                ],
-                value='en',  # Default to English
-                clearable=False,
-                className="mb-4"
-            )
-        ], width=3),
-        dbc.Col([
-            dbc.Button(id="refresh-button", color="primary", className="mb-4", children="Refresh Data")
-        ], width=3)
-    ], justify="end"),
-    
-    # Add the rest of the layout similar to what you had before
-    dbc.Row([
-        dbc.Col([
-            html.H5(id="map-title", className="text-center mb-4"),
-            dbc.Card([
-                dbc.CardHeader(id="map-filters-header"),
-                dbc.CardBody([
-                    dcc.Dropdown(
-                        id='osversion-dropdown-map',
-                        options=osversion_options,
-                        value='All',  # Default to "All"
-                        placeholder="",
-                        className="mb-3"
-                    ),
-                    dcc.Dropdown(
-                        id='senttime-dropdown-map',
-                        options=senttime_options,
-                        value=latest_senttime.timestamp() * 1000,  # Default to the latest senttime
-                        placeholder="",
-                        className="mb-3"
-                    ),
-                    dcc.Loading(
-                        id="loading-map",
-                        type="default",
-                        children=[
-                            dcc.Graph(id='map-graph'),
-                        ]
-                    ),
-                    html.Div(id='debug-output-map')
+# Layout, built when the tab is first opened so that importing this module
+# does not scan the database
+def layout():
+    osversion_options, senttime_options, latest_senttime = dropdown_options()
+
+    return dbc.Container([
+        i18n.store('silent-translations', translations),
+        # Whether each graph shows a full figure that can take a partial update
+        # (for the map, the box of the points it shows)
+        dcc.Store(id='map-graph-shown'),
+        dcc.Store(id='dist-graph-shown'),
+        dcc.Store(id='users-time-graph-shown'),
+        html.H1(id="dashboard-title", className="text-center mt-4 mb-4"),
+    
+        dbc.Row([
+            dbc.Col([
+                dcc.Dropdown(
+                    id='language-dropdown',
+                    options=[
+                        {'label': 'English', 'value': 'en'},
+                        {'label': 'Español', 'value': 'es'}
+                    ],
+                    value='en',  # Default to English
+                    clearable=False,
+                    className="mb-4"
+                )
+            ], width=3),
+            dbc.Col([
+                dbc.Button(id="refresh-button", color="primary", className="mb-4", children="Refresh Data")
+            ], width=3)
+        ], justify="end"),
+    
+        # Add the rest of the layout similar to what you had before
+        dbc.Row([
+            dbc.Col([
+                html.H5(id="map-title", className="text-center mb-4"),
+                dbc.Card([
+                    dbc.CardHeader(id="map-filters-header"),
+                    dbc.CardBody([
+                        dcc.Dropdown(
+                            id='osversion-dropdown-map',
+                            options=osversion_options,
+                            value='All',  # Default to "All"
+                            placeholder="",
+                            className="mb-3"
+                        ),
+                        dcc.Dropdown(
+                            id='senttime-dropdown-map',
+                            options=senttime_options,
+                            value=latest_senttime.timestamp() * 1000,  # Default to the latest senttime
+                            placeholder="",
+                            className="mb-3"
+                        ),
+                        dcc.Loading(
+                            id="loading-map",
+                            type="default",
+                            children=[
+                                dcc.Graph(id='map-graph'),
+                            ]
+                        ),
+                        html.Div(id='debug-output-map')
+                    ])
                 ])
-            ])
-        ], width=6),
-        dbc.Col([
-            html.H5(id="dist-title", className="text-center mb-4"),
-            dbc.Card([
-                dbc.CardHeader(id="dist-filters-header"),
-                dbc.CardBody([
-                    dcc.Dropdown(
-                        id='osversion-dropdown-dist',
-                        options=osversion_options,
-                        value='All',  # Default to "All"
-                        placeholder="",
-                        className="mb-3"
-                    ),
-                    dcc.Dropdown(
-                        id='senttime-dropdown-dist',
-                        options=senttime_options,
-                        value=latest_senttime.timestamp() * 1000,  # Default to the latest senttime
-                        placeholder="",
-                        className="mb-3"
-                    ),
-                    dcc.Loading(
-                        id="loading-dist",
-                        type="default",
-                        children=[
-                            dcc.Graph(id='dist-graph'),
-                        ]
-                    ),
-                    html.Div(id='debug-output-dist')
+            ], width=6),
+            dbc.Col([
+                html.H5(id="dist-title", className="text-center mb-4"),
+                dbc.Card([
+                    dbc.CardHeader(id="dist-filters-header"),
+                    dbc.CardBody([
+                        dcc.Dropdown(
+                            id='osversion-dropdown-dist',
+                            options=osversion_options,
+                            value='All',  # Default to "All"
+                            placeholder="",
+                            className="mb-3"
+                        ),
+                        dcc.Dropdown(
+                            id='senttime-dropdown-dist',
+                            options=senttime_options,
+                            value=latest_senttime.timestamp() * 1000,  # Default to the latest senttime
+                            placeholder="",
+                            className="mb-3"
+                        ),
+                        dcc.Loading(
+                            id="loading-dist",
+                            type="default",
+                            children=[
+                                dcc.Graph(id='dist-graph'),
+                            ]
+                        ),
+                        html.Div(id='debug-output-dist')
+                    ])
                 ])
-            ])
-        ], width=6)
-    ]),
-    
-    dbc.Row([
-        dbc.Col([
-            html.H5(id="delay-vs-time-title", className="text-center mb-4"),
-            dbc.Card([
-                dbc.CardHeader(id="delay-vs-time-header"),
-                dbc.CardBody([
-                    dcc.DatePickerRange(
-                        id='date-picker-range',
-                        start_date=(latest_senttime - pd.DateOffset(months=3)).to_pydatetime(),
-                        end_date=latest_senttime.to_pydatetime(),
-                        display_format='YYYY-MM-DD',
-                        className="mb-3"
-                    ),
-                    dbc.Button(id="show-all-data-button", color="primary", className="mb-3",title="Show all data"),
-                    dcc.Loading(
-                        id="loading-delay-time",
-                        type="default",
-                        children=[
-                            dcc.Graph(id='delay-time-graph'),
-                        ]
-                    ),
-                    html.Div(id='debug-output-delay')
+            ], width=6)
+        ]),
+    
+        dbc.Row([
+            dbc.Col([
+                html.H5(id="delay-vs-time-title", className="text-center mb-4"),
+                dbc.Card([
+                    dbc.CardHeader(id="delay-vs-time-header"),
+                    dbc.CardBody([
+                        dcc.DatePickerRange(
+                            id='date-picker-range',
+                            start_date=(latest_senttime - pd.DateOffset(months=3)).to_pydatetime(),
+                            end_date=latest_senttime.to_pydatetime(),
+                            display_format='YYYY-MM-DD',
+                            className="mb-3"
+                        ),
+                        dbc.Button(id="show-all-data-button", color="primary", className="mb-3",title="Show all data"),
+                        dcc.Loading(
+                            id="loading-delay-time",
+                            type="default",
+                            children=[
+                                dcc.Graph(id='delay-time-graph'),
+                            ]
+                        ),
+                        html.Div(id='debug-output-delay')
+                    ])
                 ])
-            ])
-        ], width=6),
-        dbc.Col([
-            html.H5(id="users-vs-time-title", className="text-center mb-4"),
-            dbc.Card([
-                dbc.CardHeader(id="user-count-filters-header"),
-                dbc.CardBody([
-                    dcc.Dropdown(
-                        id='osversion-dropdown-users',
-                        options=osversion_options,
-                        value='All',  # Default to "All"
-                        placeholder="",
-                        className="mb-3"
-                    ),
-                    dcc.Loading(
-                        id="loading-users-time",
-                        type="default",
-                        children=[
-                            dcc.Graph(id='users-time-graph'),
-                        ]
-                    ),
-                    html.Div(id='debug-output-users')
+            ], width=6),
+            dbc.Col([
+                html.H5(id="users-vs-time-title", className="text-center mb-4"),
+                dbc.Card([
+                    dbc.CardHeader(id="user-count-filters-header"),
+                    dbc.CardBody([
+                        dcc.Dropdown(
+                            id='osversion-dropdown-users',
+                            options=osversion_options,
+                            value='All',  # Default to "All"
+                            placeholder="",
+                            className="mb-3"
+                        ),
+                        dcc.Loading(
+                            id="loading-users-time",
+                            type="default",
+                            children=[
+                                dcc.Graph(id='users-time-graph'),
+                            ]
+                        ),
+                        html.Div(id='debug-output-users')
+                    ])
                 ])
-            ])
-        ], width=6)
-    ])
-], fluid=True)
+            ], width=6)
+        ])
+    ], fluid=True)
 
 def register_callbacks(app):
-    # Callback to update all text based on selected language
-    @app.callback(
-        [Output('dashboard-title', 'children'),
-         Output('map-title', 'children'),
-         Output('map-filters-header', 'children'),
-         Output('dist-title', 'children'),
-         Output('dist-filters-header', 'children'),
-         Output('delay-vs-time-title', 'children'),
-         Output('user-count-filters-header', 'children'),
-         Output('users-vs-time-title', 'children'),
-         Output('show-all-data-button', 'children')],
-        [Input('language-dropdown', 'value')]
+    # All the texts are relabelled in the browser when the language changes
+    i18n.register(
+        app, 'language-dropdown', 'silent-translations',
+        texts=[('dashboard-title', 'children', 'title'),
+               ('map-title', 'children', 'map_title'),
+               ('map-filters-header', 'children', 'map_filters'),
+               ('dist-title', 'children', 'map_title'),
+               ('dist-filters-header', 'children', 'dist_filters'),
+               ('delay-vs-time-title', 'children', 'delay_vs_time_title'),
+               ('user-count-filters-header', 'children', 'user_count_filters'),
+               ('users-vs-time-title', 'children', 'users_vs_time_title'),
+               ('show-all-data-button', 'children', 'show_all_data')],
+        figures=['map-graph', 'dist-graph', 'delay-time-graph', 'users-time-graph'],
+        trees=['debug-output-map', 'debug-output-dist', 'debug-output-delay', 'debug-output-users']
     )
-    def update_language_text(language):
-        trans = translations[language]
-        return [
-            trans['title'],
-            trans['map_title'],
-            trans['map_filters'],
-            trans['map_title'],
-            trans['dist_filters'],
-            trans['delay_vs_time_title'],
-            trans['user_count_filters'],
-            trans['users_vs_time_title'],
-            trans['show_all_data']
-        ]
     
     # Updated callback to refresh data and sort senttime options in descending order
     @app.callback(
@@ -278,118 +327,149 @@ def register_callbacks(app):
         [Input('refresh-button', 'n_clicks')]
     )
     def refresh_data(n_clicks):
-        senttimes, osversions = fetch_unique_values()
-        latest_senttime = senttimes['senttime'].max()
-        
-        osversion_options = [{'label': 'All', 'value': 'All'}] + [{'label': os, 'value': os} for os in osversions['osversion']]
-        
-        # Sort the senttimes in descending order
-        senttimes_sorted = senttimes.sort_values(by='senttime', ascending=False)
-        
-        senttime_options = [{'label': f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {notifid}", 'value': time.timestamp() * 1000}
-                            for time, notifid in zip(senttimes_sorted['senttime'], senttimes_sorted['notifid'])]
+        osversion_options, senttime_options, _ = dropdown_options()
         
         return osversion_options, senttime_options, osversion_options, senttime_options, osversion_options
 
     
-    # Callback to update map based on inputs
-    @app.callback(
-        [Output('map-graph', 'figure'),
-         Output('debug-output-map', 'children')],
-        [Input('osversion-dropdown-map', 'value'),
-         Input('senttime-dropdown-map', 'value'),
-         Input('language-dropdown', 'value')]
-    )
-    def update_map(selected_os_map, selected_senttime_map, language):
+    # Delay cutoff (95th percentile), centre (median of the points under the
+    # cutoff) and number of rows of the map, from the coordinates and delays
+    # of all the notifications of the sent time. They come from the same
+    # source as the points of build_map: the DB when the R-tree is installed,
+    # the snapshot otherwise, so that a figure never mixes two data versions.
+    @memoize('silent.map_view', version=data_version)
+    def map_view(selected_os_map, timestamp_map):
+        db_path = load_db_path()  # Load the database path from JSON file
+        where = {'senttime': timestamp_map}
+        if selected_os_map != 'All':
+            where['osversion'] = selected_os_map
+        with closing(connect_db(db_path)) as conn:
+            df_view = None if spatial.installed(conn, 'silentnotif') else read_snapshot(
+                db_path, 'silentnotif', ['userLat', 'userLon', 'delay'], where)
+            if df_view is None:
+                condition = ' AND '.join(f"{column} = ?" for column in where)
+                df_view = read_sql(f"SELECT userLat, userLon, delay FROM silentnotif WHERE {condition}", conn,
+                                   'silent.map_view', params=tuple(where.values()))
+        if df_view.empty:
+            return None
+        cutoff = df_view['delay'].quantile(0.95)
+        df_view = df_view[df_view['delay'] <= cutoff]
+        located = df_view.dropna(subset=['userLat', 'userLon'])
+        return cutoff, located['userLat'].median(), located['userLon'].median(), len(df_view)
+
+    # Map of the notifications for the selected filters. Only the points in
+    # `box` (the initial view when None) are loaded, through the R-tree of
+    # silentnotif when it is installed, see spatial.py
+    @memoize('silent.map', version=data_version)
+    @compact_outputs
+    def build_map(selected_os_map, selected_senttime_map, language, box=None):
         trans = translations[language]
         if selected_os_map is None or selected_senttime_map is None:
-            return {}, trans['debug_no_data'].format(os=selected_os_map, time=selected_senttime_map)
+            return {}, i18n.text(translations, language, 'debug_no_data', os=selected_os_map, time=selected_senttime_map)
     
         timestamp_map = int(selected_senttime_map)
-        db_path = load_db_path()  # Load the database path from JSON file
-        with sqlite3.connect(db_path) as conn:
-            if selected_os_map == 'All':
-                query = f"""
-                SELECT userid, userLat, userLon, delay 
-                FROM silentnotif 
-                WHERE senttime={timestamp_map}
-                """
+        view = map_view(selected_os_map, timestamp_map)
+        if view is None:
+            return {}, i18n.text(translations, language, 'debug_no_data', os=selected_os_map, time=timestamp_map)
+        cutoff, lat_center, lon_center, rows = view
+        debug_message_map = i18n.text(translations, language, 'debug_rows_retrieved', os=selected_os_map, time=timestamp_map, rows=rows)
+        if box is None:
+            box = spatial.view_box(lat_center, lon_center, MAP_ZOOM)
+
+        columns = ['userid', 'userLat', 'userLon', 'delay']
+        where = {'senttime': timestamp_map}
+        if selected_os_map != 'All':
+            where['osversion'] = selected_os_map
+        db_path = load_db_path()
+        with closing(connect_db(db_path)) as conn:
+            # Without the R-tree the snapshot is read whole and cut in pandas
+            df_map = None if spatial.installed(conn, 'silentnotif') else read_snapshot(db_path, 'silentnotif', columns, where)
+            if df_map is None:
+                condition = ' AND '.join(f"t.{column} = ?" for column in where)
+                df_map = spatial.box_query(conn, 'silentnotif', columns, box, condition, tuple(where.values()),
+                                           'silent.map')
             else:
-                query = f"""
-                SELECT userid, userLat, userLon, delay 
-                FROM silentnotif 
-                WHERE osversion='{selected_os_map}' AND senttime={timestamp_map}
-                """
-            df_map = pd.read_sql_query(query, conn)
-    
-        if not df_map.empty:
-            delay_90th_percentile_map = df_map['delay'].quantile(0.95)
-            df_map = df_map[df_map['delay'] <= delay_90th_percentile_map]
-    
-        debug_message_map = trans['debug_rows_retrieved'].format(os=selected_os_map, time=timestamp_map, rows=len(df_map))
-    
-        if df_map.empty:
-            return {}, trans['debug_no_data'].format(os=selected_os_map, time=timestamp_map)
-    
-        # Remove rows with NaN values in userLat or userLon
-        df_map = df_map.dropna(subset=['userLat', 'userLon'])
-    
-        # Calculate the center based on the median of the points
-        lat_center = df_map['userLat'].median()
-        lon_center = df_map['userLon'].median()
+                df_map = df_map[spatial.in_box(df_map['userLat'], df_map['userLon'], box)]
+        df_map = df_map[df_map['delay'] <= cutoff]
+        cancellation.check()
     
+        import plotly.express as px
+        px.set_mapbox_access_token(mapbox_access_token)
+
         fig_map = px.scatter_mapbox(df_map, lat="userLat", lon="userLon", 
                                     color=np.log10(df_map['delay']),
                                     color_continuous_scale='GnBu',
                                     mapbox_style="carto-darkmatter",
                                     center={"lat": lat_center, "lon": lon_center},
-                                    zoom=10,
+                                    zoom=MAP_ZOOM,
                                     hover_name="userid",
                                     hover_data={"delay": True, "userLat": False, "userLon": False}
                                     )
     
+        # The view of the user is kept until another sent time is selected
+        fig_map.update_layout(uirevision=timestamp_map)
         fig_map.update_coloraxes(colorbar=dict(title=trans['log10_delay']))
+        i18n.tag_figure(fig_map, {'layout.coloraxis.colorbar.title.text': 'log10_delay'})
     
         return fig_map, debug_message_map
     
-    # Callback to update distribution plot
+    # A change of the osversion filter or of the view only replaces the
+    # traces of the graph. The store holds the box of the points shown.
     @app.callback(
-        [Output('dist-graph', 'figure'),
-         Output('debug-output-dist', 'children')],
-        [Input('osversion-dropdown-dist', 'value'),
-         Input('senttime-dropdown-dist', 'value'),
-         Input('language-dropdown', 'value')]
+        [Output('map-graph', 'figure'),
+         Output('debug-output-map', 'children'),
+         Output('map-graph-shown', 'data')],
+        [Input('osversion-dropdown-map', 'value'),
+         Input('senttime-dropdown-map', 'value'),
+         Input('map-graph', 'relayoutData')],
+        [State('language-dropdown', 'value'),
+         State('map-graph-shown', 'data')]
     )
-    def update_distribution(selected_os_dist, selected_senttime_dist, language):
+    def update_map(selected_os_map, selected_senttime_map, relayout_data, language, shown):
+        box = None
+        if shown and ctx.triggered_id == 'map-graph':
+            box = spatial.relayout_box(relayout_data)
+            if box is None:
+                return dash.no_update, dash.no_update, dash.no_update
+        elif shown and ctx.triggered_id == 'osversion-dropdown-map':
+            box = tuple(shown)
+        fig_map, debug_message_map = build_map(selected_os_map, selected_senttime_map, language, box)
+        if not fig_map:
+            return fig_map, debug_message_map, None
+        if box is None:
+            _, lat_center, lon_center, _ = map_view(selected_os_map, int(selected_senttime_map))
+            return fig_map, debug_message_map, spatial.view_box(lat_center, lon_center, MAP_ZOOM)
+        return patch_traces(fig_map), debug_message_map, box
+
+    # Distribution of the delays for the selected filters
+    @memoize('silent.distribution', version=data_version)
+    @compact_outputs
+    def build_distribution(selected_os_dist, selected_senttime_dist, language):
         trans = translations[language]
         if selected_os_dist is None or selected_senttime_dist is None:
-            return {}, trans['debug_no_data'].format(os=selected_os_dist, time=selected_senttime_dist)
+            return {}, i18n.text(translations, language, 'debug_no_data', os=selected_os_dist, time=selected_senttime_dist)
     
         timestamp_dist = int(selected_senttime_dist)
         db_path = load_db_path()  # Load the database path from JSON file
-        with sqlite3.connect(db_path) as conn:
-            if selected_os_dist == 'All':
-                query = f"""
-                SELECT userid, delay 
-                FROM silentnotif 
-                WHERE senttime={timestamp_dist}
-                """
-            else:
-                query = f"""
-                SELECT userid, delay 
-                FROM silentnotif 
-                WHERE osversion='{selected_os_dist}' AND senttime={timestamp_dist}
-                """
-            df_dist = pd.read_sql_query(query, conn)
+        where = {'senttime': timestamp_dist}
+        if selected_os_dist != 'All':
+            where['osversion'] = selected_os_dist
+        df_dist = read_snapshot(db_path, 'silentnotif', ['delay'], where)
+        if df_dist is None:
+            with closing(connect_db(db_path)) as conn:
+                condition = ' AND '.join(f"{column} = ?" for column in where)
+                df_dist = read_sql(f"SELECT delay FROM silentnotif WHERE {condition}", conn, 'silent.distribution',
+                                   params=tuple(where.values()))
+        cancellation.check()
     
         if not df_dist.empty:
             delay_90th_percentile_dist = df_dist['delay'].quantile(0.95)
             df_dist = df_dist[df_dist['delay'] <= delay_90th_percentile_dist]
     
         if len(df_dist) < 10:
-            return {}, trans['debug_no_data'].format(os=selected_os_dist, time=timestamp_dist)
+            return {}, i18n.text(translations, language, 'debug_no_data', os=selected_os_dist, time=timestamp_dist)
     
-        debug_message_dist = trans['debug_rows_retrieved'].format(os=selected_os_dist, time=timestamp_dist, rows=len(df_dist))
+        debug_message_dist = i18n.text(translations, language, 'debug_rows_retrieved', os=selected_os_dist, time=timestamp_dist, rows=len(df_dist))
     
         fig_dist = go.Figure(data=[go.Histogram(x=df_dist['delay'], nbinsx=int((df_dist['delay'].max() - df_dist['delay'].min()) / 0.5))])
         
@@ -401,45 +481,53 @@ def register_callbacks(app):
             bargap=0.2,
             bargroupgap=0.1
         )
+        i18n.tag_figure(fig_dist, {'layout.title.text': 'delay_distribution_title',
+                                   'layout.xaxis.title.text': 'delay_seconds',
+                                   'layout.yaxis.title.text': 'count'})
     
         return fig_dist, debug_message_dist
     
-    # Callback to update delay vs time plot
+    # A change of the osversion filter only replaces the traces of the graph
     @app.callback(
-        [Output('delay-time-graph', 'figure'),
-         Output('debug-output-delay', 'children')],
-        [Input('date-picker-range', 'start_date'),
-         Input('date-picker-range', 'end_date'),
-         Input('show-all-data-button', 'n_clicks'),
-         Input('language-dropdown', 'value')]
+        [Output('dist-graph', 'figure'),
+         Output('debug-output-dist', 'children'),
+         Output('dist-graph-shown', 'data')],
+        [Input('osversion-dropdown-dist', 'value'),
+         Input('senttime-dropdown-dist', 'value')],
+        [State('language-dropdown', 'value'),
+         State('dist-graph-shown', 'data')]
     )
-    def update_delay_time(start_date, end_date, n_clicks, language):
-        trans = translations[language]
-        all_data = False
-        if n_clicks and n_clicks > 0:
-            all_data = True
+    def update_distribution(selected_os_dist, selected_senttime_dist, language, shown):
+        version = data_version()
+        fig_dist, debug_message_dist = build_distribution(selected_os_dist, selected_senttime_dist, language)
+        if shown and fig_dist and ctx.triggered_id == 'osversion-dropdown-dist':
+            fig_dist = patch_traces(fig_dist, shown_figure(build_distribution, shown, language))
+        return fig_dist, debug_message_dist, shown_state(fig_dist, version, selected_os_dist, selected_senttime_dist)
+
+    # Mode and standard deviation of the delays of every sent time with at
+    # least 50 notifications, under the 95th percentile of the sent time
+    @memoize('silent.delay_stats', version=data_version)
+    def delay_time_stats(start_date, end_date, all_data):
         db_path = load_db_path()
-        with sqlite3.connect(db_path) as conn:
-            if all_data:
-                query = f"""
-                SELECT senttime, delay 
-                FROM silentnotif
-                """
-            else:
-                start_timestamp = int(pd.to_datetime(start_date).timestamp() * 1000)
-                end_timestamp = int(pd.to_datetime(end_date).timestamp() * 1000)
-                query = f"""
-                SELECT senttime, delay 
-                FROM silentnotif
-                WHERE senttime BETWEEN {start_timestamp} AND {end_timestamp}
-                """
-            df_delay_time = pd.read_sql_query(query, conn)
-    
-        fig_delay_time = go.Figure()
-    
-        for senttime in df_delay_time['senttime'].unique():
-            df_subset = df_delay_time[df_delay_time['senttime'] == senttime]
-    
+        if all_data:
+            where = None
+        else:
+            where = {'senttime': (int(pd.to_datetime(start_date).timestamp() * 1000),
+                                  int(pd.to_datetime(end_date).timestamp() * 1000))}
+        df_delay_time = read_snapshot(db_path, 'silentnotif', ['senttime', 'delay'], where)
+        if df_delay_time is None:
+            with closing(connect_db(db_path)) as conn:
+                if all_data:
+                    df_delay_time = read_sql("SELECT senttime, delay FROM silentnotif", conn, 'silent.delay_time')
+                else:
+                    df_delay_time = read_sql("SELECT senttime, delay FROM silentnotif WHERE senttime BETWEEN ? AND ?",
+                                             conn, 'silent.delay_time', params=where['senttime'])
+        cancellation.check()
+    
+        from scipy import stats
+
+        rows = []
+        for senttime, df_subset in df_delay_time.groupby('senttime', sort=False):
             if len(df_subset) < 50:
                 continue
     
@@ -454,25 +542,37 @@ def register_callbacks(app):
             except IndexError:
                 mode_delay = df_subset['delay'].mean()
     
-            std_delay = df_subset['delay'].std()
-    
-            time_value = pd.to_datetime(senttime, unit='ms')
-    
-            fig_delay_time.add_trace(go.Scatter(
-                x=[time_value],
-                y=[mode_delay],
-                mode='markers',
-                marker=dict(size=10, color='blue'),
-                showlegend=False
-            ))
-    
-            fig_delay_time.add_trace(go.Scatter(
-                x=[time_value, time_value],
-                y=[mode_delay - std_delay, mode_delay + std_delay],
-                mode='lines',
-                line=dict(color='black', width=1, dash='dot'),  # Make the standard deviation line thinner and dotted
-                showlegend=False
-            ))
+            rows.append((pd.to_datetime(senttime, unit='ms'), mode_delay, df_subset['delay'].std()))
+        return pd.DataFrame(rows, columns=['time', 'mode', 'std']).sort_values('time', ignore_index=True)
+
+    # Delay vs time plot of the sent times in `x_range` (all when None). The
+    # markers are downsampled with min-max buckets, see downsample.py.
+    def delay_time_figure(start_date, end_date, all_data, language, x_range=None):
+        trans = translations[language]
+        df_stats = delay_time_stats(start_date, end_date, all_data)
+        cancellation.check()
+        df_stats = df_stats.iloc[select(df_stats['time'], df_stats['mode'], x_range, method='minmax')]
+        times = df_stats['time'].tolist()
+
+        fig_delay_time = go.Figure()
+        fig_delay_time.add_trace(scatter(
+            len(df_stats),
+            x=df_stats['time'],
+            y=df_stats['mode'],
+            mode='markers',
+            marker=dict(size=10, color='blue'),
+            showlegend=False
+        ))
+        # The standard deviation of every sent time, as one trace of segments
+        # separated by gaps
+        fig_delay_time.add_trace(go.Scatter(
+            x=[value for time_value in times for value in (time_value, time_value, None)],
+            y=[value for low, high in zip(df_stats['mode'] - df_stats['std'], df_stats['mode'] + df_stats['std'])
+               for value in (low, high, None)],
+            mode='lines',
+            line=dict(color='black', width=1, dash='dot'),  # Make the standard deviation line thinner and dotted
+            showlegend=False
+        ))
     
         fig_delay_time.update_layout(
             title=trans['delay_vs_time_title'],
@@ -485,39 +585,64 @@ def register_callbacks(app):
             ),
             showlegend=False
         )
-    
-        return fig_delay_time, trans['delay_vs_time_title']
-    
-    # Callback to update number of users vs time plot
+        i18n.tag_figure(fig_delay_time, {'layout.title.text': 'delay_vs_time_title',
+                                         'layout.xaxis.title.text': 'time',
+                                         'layout.yaxis.title.text': 'delay_seconds'})
+        return fig_delay_time
+
+    # Callback to update delay vs time plot
     @app.callback(
-        [Output('users-time-graph', 'figure'),
-         Output('debug-output-users', 'children')],
-        [Input('osversion-dropdown-users', 'value'),
-         Input('language-dropdown', 'value')]
+        [Output('delay-time-graph', 'figure'),
+         Output('debug-output-delay', 'children')],
+        [Input('date-picker-range', 'start_date'),
+         Input('date-picker-range', 'end_date'),
+         Input('show-all-data-button', 'n_clicks'),
+         State('language-dropdown', 'value')]
     )
-    def update_users_time(selected_os_users, language):
+    @memoize('silent.delay_time', version=data_version)
+    @compact_outputs
+    def update_delay_time(start_date, end_date, n_clicks, language):
+        all_data = bool(n_clicks and n_clicks > 0)
+        return (delay_time_figure(start_date, end_date, all_data, language),
+                i18n.text(translations, language, 'delay_vs_time_title'))
+
+    # A zoom sends the sent times of the new range again, when they were not
+    # all sent already
+    def zoom_delay_time(x_range, start_date, end_date, n_clicks, language):
+        all_data = bool(n_clicks and n_clicks > 0)
+        if len(delay_time_stats(start_date, end_date, all_data)) <= POINTS:
+            return None
+        return delay_time_figure(start_date, end_date, all_data, language, x_range)
+
+    register_zoom(app, 'delay-time-graph', zoom_delay_time,
+                  states=[('date-picker-range', 'start_date'), ('date-picker-range', 'end_date'),
+                          ('show-all-data-button', 'n_clicks'), ('language-dropdown', 'value')])
+    
+    # Number of users vs time for the selected osversion, at full resolution
+    @memoize('silent.full_users_time', version=data_version)
+    def build_full_users_time(selected_os_users, language):
         trans = translations[language]
         db_path = load_db_path()  # Load the database path from JSON file
-        with sqlite3.connect(db_path) as conn:
-            if selected_os_users == 'All':
-                query = f"""
-                SELECT senttime, userid 
-                FROM silentnotif
-                """
-            else:
-                query = f"""
-                SELECT senttime, userid 
-                FROM silentnotif 
-                WHERE osversion='{selected_os_users}'
-                """
-            df_users_time = pd.read_sql_query(query, conn)
+        where = None if selected_os_users == 'All' else {'osversion': selected_os_users}
+        df_users_time = read_snapshot(db_path, 'silentnotif', ['senttime', 'userid'], where, codes=True)
+        if df_users_time is None:
+            with closing(connect_db(db_path)) as conn:
+                if selected_os_users == 'All':
+                    df_users_time = read_sql("SELECT senttime, userid FROM silentnotif", conn, 'silent.users_time')
+                else:
+                    df_users_time = read_sql("SELECT senttime, userid FROM silentnotif WHERE osversion = ?", conn,
+                                             'silent.users_time', params=(selected_os_users,))
+        encode_ids(df_users_time)
+        cancellation.check()
     
         df_users_time['senttime'] = pd.to_datetime(df_users_time['senttime'], unit='ms')
         df_users_count = df_users_time.groupby(df_users_time['senttime'].dt.date)['userid'].nunique().reset_index()
+        cancellation.check()
     
         fig_users_time = go.Figure()
     
-        fig_users_time.add_trace(go.Scatter(
+        fig_users_time.add_trace(scatter(
+            shown_points(len(df_users_count)),
             x=df_users_count['senttime'],
             y=df_users_count['userid'],
             mode='lines+markers',
@@ -536,8 +661,38 @@ def register_callbacks(app):
             ),
             showlegend=False
         )
+        i18n.tag_figure(fig_users_time, {'layout.title.text': 'users_vs_time_title',
+                                         'layout.xaxis.title.text': 'time',
+                                         'layout.yaxis.title.text': 'number_of_users'})
     
-        return fig_users_time, trans['users_vs_time_title']
+        return fig_users_time, i18n.text(translations, language, 'users_vs_time_title')
+
+    # The same, downsampled to the width of the chart, see downsample.py
+    @memoize('silent.users_time', version=data_version)
+    @compact_outputs
+    def build_users_time(selected_os_users, language):
+        fig_users_time, debug_message_users = build_full_users_time(selected_os_users, language)
+        return downsample_figure(fig_users_time), debug_message_users
+
+    register_zoom(app, 'users-time-graph',
+                  resampled(lambda selected_os_users, language: build_full_users_time(selected_os_users, language)[0]),
+                  states=[('osversion-dropdown-users', 'value'), ('language-dropdown', 'value')])
+    
+    # A change of the osversion filter only replaces the traces of the graph
+    @app.callback(
+        [Output('users-time-graph', 'figure'),
+         Output('debug-output-users', 'children'),
+         Output('users-time-graph-shown', 'data')],
+        [Input('osversion-dropdown-users', 'value')],
+        [State('language-dropdown', 'value'),
+         State('users-time-graph-shown', 'data')]
+    )
+    def update_users_time(selected_os_users, language, shown):
+        version = data_version()
+        fig_users_time, debug_message_users = build_users_time(selected_os_users, language)
+        if shown and fig_users_time and ctx.triggered_id == 'osversion-dropdown-users':
+            fig_users_time = patch_traces(fig_users_time, shown_figure(build_users_time, shown, language))
+        return fig_users_time, debug_message_users, shown_state(fig_users_time, version, selected_os_users)
 
 if __name__ == '__main__':
     app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
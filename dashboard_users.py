@@ -15,39 +15,67 @@ GNU Affero General Public License for more details.
 
 Author: Billy Burgoa Rosso (billyburgoa@gmail.com)
 """
-import sqlite3
 import pandas as pd
 from dash import Dash, dcc, html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
-import plotly.express as px
+from dash.dependencies import Input, Output, State
 import json
-from os import path
+from result_cache import memoize, file_version
+from snapshots import encode_ids, read_snapshot
+from metrics import read_sql
+from dash.exceptions import PreventUpdate
+from figures import compact_outputs, patch_traces
+from downsample import downsample_figure, register_zoom, resampled
+import config
+import db
+import i18n
+import parallel
+import replica
 
 
-# Read the JSON file and load the database path
+# Database path of the dashboard, see config.py
 def load_db_path():
-    script_dir = path.dirname(path.abspath(__file__))
-    config_path = path.join(script_dir, 'dashboard_users.json')
-    with open(config_path) as config_file:
-        config = json.load(config_file)
-    return config['database_path']
+    return config.database_path('users')
+
+# Read-only connection to the dashboard DB, see db.py, or to its local
+# replica (replica.py). "immutable": true in the config marks the database as
+# a frozen copy, which a replica always is.
+def connect_db(db_path):
+    queried = replica.resolve(db_path)
+    return db.connect(queried, immutable=queried != db_path or config.get('users').get('immutable', False))
+
+# Data version of the tokens DB, used to key the shared result cache
+def data_version():
+    return file_version(replica.resolve(load_db_path()))
 
 # Load data from the database
 def load_data():
     db_path = load_db_path()  # Load the database path from JSON file
-    conn = sqlite3.connect(db_path)
 
-    # Load data from the fcmTokens table into a pandas DataFrame
-    df_fcm = pd.read_sql_query("SELECT UserID, timestamp, TokenSource FROM fcmTokens", conn)
-    df_fcm['timestamp'] = pd.to_datetime(df_fcm['timestamp'], unit='s')
+    # Use the memory-mapped Arrow snapshots when they are available
+    df_fcm = read_snapshot(db_path, 'fcmTokens', ['UserID', 'timestamp', 'TokenSource'], codes=True)
+    df_apns = read_snapshot(db_path, 'apnsTokens', ['UserID', 'timestamp'], codes=True)
 
-    # Load data from the apnsTokens table into a pandas DataFrame
-    df_apns = pd.read_sql_query("SELECT UserID, timestamp FROM apnsTokens", conn)
-    df_apns['timestamp'] = pd.to_datetime(df_apns['timestamp'], unit='s')
+    if df_fcm is None or df_apns is None:
+        conn = connect_db(db_path)
+
+        # Load data from the fcmTokens table into a pandas DataFrame
+        if df_fcm is None:
+            df_fcm = read_sql("SELECT UserID, timestamp, TokenSource FROM fcmTokens", conn, 'users.fcmTokens')
+
+        # Load data from the apnsTokens table into a pandas DataFrame
+        if df_apns is None:
+            df_apns = read_sql("SELECT UserID, timestamp FROM apnsTokens", conn, 'users.apnsTokens')
+
+        # Close the database connection
+        conn.close()
 
-    # Close the database connection
-    conn.close()
+    # The users are only counted: int32 codes instead of the token strings
+    encode_ids(df_fcm)
+    encode_ids(df_apns)
+
+    df_fcm['timestamp'] = pd.to_datetime(df_fcm['timestamp'], unit='s')
+    df_apns['timestamp'] = pd.to_datetime(df_apns['timestamp'], unit='s')
 
     # Daily aggregation
     df_fcm['day'] = df_fcm['timestamp'].dt.to_period('D').astype(str)
@@ -100,99 +128,89 @@ color_discrete_map = {
     'ios': '#EF553B',      # Red
 }
 
-def register_callbacks(app):
-    @app.callback(
-        [Output('android-users', 'children'),
-         Output('ios-users', 'children'),
-         Output('apns-users', 'children'),
-         Output('user_counts_fig', 'figure'),
-         Output('token_distribution_fig', 'figure'),
-         Output('daily_active_users_fig', 'figure'),
-         Output('user_growth_fig', 'figure'),
-         Output('apns_user_counts_fig', 'figure'),
-         Output('apns_daily_active_users_fig', 'figure'),
-         Output('apns_user_growth_fig', 'figure'),
-         Output('android-users-title', 'children'),
-         Output('ios-users-title', 'children'),
-         Output('apns-users-title', 'children'),
-         Output('refresh-button', 'children'),
-         Output('fcm-tokens-title', 'children'),
-         Output('apns-tokens-title', 'children')],
-        [Input('refresh-button', 'n_clicks'),
-         Input('language-selector', 'value')]
-    )
-    def update_dashboard(n_clicks, lang):
-        # Load the data
-        df_fcm, df_apns, android_users, ios_users_fcm, total_apns_users = load_data()
-    
-        # Sort and correctly calculate cumulative unique users
+# Build every card and figure of the dashboard for a given language, at full
+# resolution. The result is shared by all the workers through the result cache.
+@memoize('users.full_dashboard', version=data_version)
+def build_full_dashboard(lang):
+    import plotly.express as px
+
+    # Load the data
+    df_fcm, df_apns, android_users, ios_users_fcm, total_apns_users = load_data()
+
+    # Cumulative unique users, sorted by time
+    def user_growth():
         df_fcm_sorted = df_fcm.sort_values('timestamp')
         df_fcm_unique = df_fcm_sorted.drop_duplicates(subset=['UserID', 'TokenSource'])
-    
+
         df_fcm_unique['cumulative_users'] = df_fcm_unique.groupby('TokenSource').cumcount() + 1
         df_fcm_final = df_fcm_unique.groupby(['TokenSource', df_fcm_unique['timestamp'].dt.date]).agg({'cumulative_users': 'max'}).reset_index()
-    
-        # Create the user growth chart
-        user_growth_fig = px.line(
+
+        return px.line(
             df_fcm_final,
             x='timestamp', y='cumulative_users', color='TokenSource',
             title=translations[lang]['user_growth'],
             labels={'cumulative_users': 'Cumulative Users', 'timestamp': 'Date'},
             color_discrete_map=color_discrete_map
         )
-    
-        # Other charts...
-        user_counts_fig = px.line(
+
+    # Other charts...
+    def user_counts():
+        return px.line(
             df_fcm.groupby([df_fcm['timestamp'].dt.date, 'TokenSource'])['UserID'].nunique().reset_index(),
             x='timestamp', y='UserID', color='TokenSource',
             title=translations[lang]['user_count_over_time'],
             labels={'UserID': 'Number of Users', 'timestamp': 'Date'},
             color_discrete_map=color_discrete_map
         )
-    
-        token_distribution_fig = px.bar(
+
+    def token_distribution():
+        return px.bar(
             df_fcm.groupby('TokenSource')['UserID'].nunique().reset_index(),
             x='TokenSource', y='UserID', color='TokenSource',
             title=translations[lang]['user_distribution'],
             labels={'UserID': 'Number of Users'},
             color_discrete_map=color_discrete_map
         )
-    
-        daily_active_users_fig = px.bar(
+
+    def daily_active_users():
+        return px.bar(
             df_fcm.groupby(['day', 'TokenSource'])['UserID'].nunique().reset_index(),
             x='day', y='UserID', color='TokenSource',
             title=translations[lang]['daily_active_users'],
             labels={'UserID': 'Number of Users', 'day': 'Day'},
             color_discrete_map=color_discrete_map
         )
-    
-        # Create charts for apnsTokens
-        apns_user_counts_fig = px.line(
+
+    # Create charts for apnsTokens
+    def apns_user_counts():
+        return px.line(
             df_apns.groupby(df_apns['timestamp'].dt.date)['UserID'].nunique().reset_index(),
             x='timestamp', y='UserID',
             title=translations[lang]['apns_user_count'],
             labels={'UserID': 'Number of Users', 'timestamp': 'Date'}
         )
-    
-        apns_daily_active_users_fig = px.bar(
+
+    def apns_daily_active_users():
+        return px.bar(
             df_apns.groupby('day')['UserID'].nunique().reset_index(),
             x='day', y='UserID',
             title=translations[lang]['apns_daily_active_users'],
             labels={'UserID': 'Number of Users', 'day': 'Day'}
         )
-    
-        apns_user_growth_fig = px.line(
+
+    def apns_user_growth():
+        return px.line(
             df_apns.groupby(df_apns['timestamp'].dt.date)['UserID'].nunique().cumsum().reset_index(),
             x='timestamp', y='UserID',
             title=translations[lang]['apns_user_growth'],
             labels={'UserID': 'Cumulative Users', 'timestamp': 'Date'}
         )
-    
-        # Style the figures
-        figures = [user_counts_fig, token_distribution_fig, daily_active_users_fig, user_growth_fig,
-                   apns_user_counts_fig, apns_daily_active_users_fig, apns_user_growth_fig]
-    
-        for fig in figures:
+
+    # Style the figures
+    def styled(build, title):
+        def build_styled():
+            fig = build()
+            i18n.tag_figure(fig, {'layout.title.text': title})
             fig.update_layout(
                 plot_bgcolor='white',
                 paper_bgcolor='white',
@@ -202,15 +220,90 @@ def register_callbacks(app):
             )
             fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgrey')
             fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgrey')
-    
-        return (f"{android_users:,}", f"{ios_users_fcm:,}", f"{total_apns_users:,}",
-                user_counts_fig, token_distribution_fig, daily_active_users_fig, user_growth_fig,
-                apns_user_counts_fig, apns_daily_active_users_fig, apns_user_growth_fig,
-                translations[lang]['android_users'], translations[lang]['ios_users'], translations[lang]['apns_users'],
-                translations[lang]['refresh'], translations[lang]['fcm_tokens'], translations[lang]['apns_tokens'])
+            return fig
+        return build_styled
+
+    # The figures are independent, parallel.py may build them concurrently
+    figures = parallel.build({
+        'users.user_counts': styled(user_counts, 'user_count_over_time'),
+        'users.token_distribution': styled(token_distribution, 'user_distribution'),
+        'users.daily_active_users': styled(daily_active_users, 'daily_active_users'),
+        'users.user_growth': styled(user_growth, 'user_growth'),
+        'users.apns_user_counts': styled(apns_user_counts, 'apns_user_count'),
+        'users.apns_daily_active_users': styled(apns_daily_active_users, 'apns_daily_active_users'),
+        'users.apns_user_growth': styled(apns_user_growth, 'apns_user_growth'),
+    })
+
+    return (f"{android_users:,}", f"{ios_users_fcm:,}", f"{total_apns_users:,}", *figures)
+
+# Outputs of update_dashboard holding a time series (one point per day since
+# the launch), downsampled to the width of the charts, see downsample.py
+TIME_SERIES = {3: 'user_counts_fig', 6: 'user_growth_fig', 7: 'apns_user_counts_fig', 9: 'apns_user_growth_fig'}
+
+@memoize('users.dashboard', version=data_version)
+@compact_outputs
+def build_dashboard(lang):
+    outputs = build_full_dashboard(lang)
+    return tuple(downsample_figure(output) if index in TIME_SERIES else output for index, output in enumerate(outputs))
+
+def register_callbacks(app):
+    # The texts and the figure titles are relabelled in the browser when the
+    # language changes
+    i18n.register(
+        app, 'language-selector', 'users-translations',
+        texts=[('android-users-title', 'children', 'android_users'),
+               ('ios-users-title', 'children', 'ios_users'),
+               ('apns-users-title', 'children', 'apns_users'),
+               ('refresh-button', 'children', 'refresh'),
+               ('fcm-tokens-title', 'children', 'fcm_tokens'),
+               ('apns-tokens-title', 'children', 'apns_tokens')],
+        figures=['user_counts_fig', 'token_distribution_fig', 'daily_active_users_fig', 'user_growth_fig',
+                 'apns_user_counts_fig', 'apns_daily_active_users_fig', 'apns_user_growth_fig']
+    )
+
+    @app.callback(
+        [Output('android-users', 'children'),
+         Output('ios-users', 'children'),
+         Output('apns-users', 'children'),
+         Output('user_counts_fig', 'figure'),
+         Output('token_distribution_fig', 'figure'),
+         Output('daily_active_users_fig', 'figure'),
+         Output('user_growth_fig', 'figure'),
+         Output('apns_user_counts_fig', 'figure'),
+         Output('apns_daily_active_users_fig', 'figure'),
+         Output('apns_user_growth_fig', 'figure'),
+         Output('users-data-version', 'data')],
+        [Input('refresh-button', 'n_clicks')],
+        [State('language-selector', 'value'),
+         State('users-data-version', 'data')]
+    )
+    def update_dashboard(n_clicks, lang, shown_version):
+        # The figures are drawn once, a refresh sends nothing while the tokens
+        # DB is unchanged and only the changes of the traces when it changed:
+        # the figures shown are the ones cached under `shown_version`
+        version = json.loads(json.dumps(data_version()))
+        if shown_version is not None and shown_version == version:
+            raise PreventUpdate
+        outputs = build_dashboard(lang)
+        # Figures built while the DB changed are of an unknown version
+        built_version = version if json.loads(json.dumps(data_version())) == version else None
+        if shown_version is None:
+            return outputs + (built_version,)
+        hit, shown = build_dashboard.lookup(shown_version, lang)
+        shown_figures = shown[3:] if hit else (None,) * len(outputs[3:])
+        return (outputs[:3] + tuple(patch_traces(figure, previous) for figure, previous in zip(outputs[3:], shown_figures))
+                + (built_version,))
+
+    # A zoom on a time series sends its points in the new range again
+    for index, graph_id in TIME_SERIES.items():
+        register_zoom(app, graph_id, resampled(lambda lang, index=index: build_full_dashboard(lang)[index]),
+                      states=[('language-selector', 'value')])
 
 #app.layout = dbc.Container([
 layout = dbc.Container([
+    i18n.store('users-translations', translations),
+    # Data version of the figures shown, see update_dashboard
+    dcc.Store(id='users-data-version'),
     dbc.Row([
         dbc.Col(html.H1("Users Tokens Analytics for FCM and APNs", className="text-center text-primary mb-4"), width=12)
     ]),
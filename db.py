@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Read-only connections to the dashboard databases.
+
+The dashboards never write: connect() opens the databases with a mode=ro URI
+and query_only, so a reader can never take a write lock that would block
+sctokenmanager or the Firestore sync. The pages are read through a memory map
+shared with the other workers, a larger page cache is used and temporary
+b-trees (GROUP BY, ORDER BY, DISTINCT) stay in memory.
+
+A database that is never modified (a frozen copy) can be opened with
+immutable=True: SQLite then skips the locks and the change detection
+altogether. Do not use it on a live database, the readers would not see the
+writes and could read a torn page.
+"""
+import os
+import sqlite3
+from os import path
+from urllib.request import pathname2url
+
+# Bytes of the database read through mmap (0 disables it)
+MMAP_SIZE = int(os.environ.get('APP_VIEW_SQLITE_MMAP_SIZE', 256 * 2**20))
+# Page cache of each connection, in KiB
+CACHE_SIZE_KIB = int(os.environ.get('APP_VIEW_SQLITE_CACHE_KIB', 64 * 1024))
+
+
+def uri(db_path, immutable=False):
+    result = f"file:{pathname2url(path.abspath(db_path))}?mode=ro"
+    if immutable:
+        result += '&immutable=1'
+    return result
+
+
+def connect(db_path, immutable=False, **kwargs):
+    # mode=ro fails on a missing file instead of creating an empty database
+    conn = sqlite3.connect(uri(db_path, immutable), uri=True, **kwargs)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
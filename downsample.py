@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Downsampling of the long time series.
+
+A chart draws a few hundred pixels: the traces with more than
+APP_VIEW_DOWNSAMPLE_POINTS points (1000 by default, 0 disables the stage)
+are reduced to that many points before they are sent. Lines use
+Largest-Triangle-Three-Buckets, which keeps the shape of the curve, and
+markers min-max buckets, which keep the extremes. The figures are built at
+full resolution and cached; register_zoom() sends the points of the new x
+range again, at the same density, when the user zooms or pans a chart.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from figures import compact_figure, patch_traces
+
+POINTS = int(os.environ.get('APP_VIEW_DOWNSAMPLE_POINTS', 1000))
+
+# Per-point attributes of a trace, sampled with x and y
+POINT_ATTRIBUTES = ['text', 'hovertext', 'customdata', 'ids']
+
+
+# x values as floats: numbers as they are, dates in nanoseconds
+def numeric(values):
+    array = np.asarray(values)
+    if array.dtype.kind in 'iufb':
+        return array.astype(float)
+    return pd.to_datetime(array).to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+
+
+# Indices of `threshold` points of (x, y) chosen by Largest-Triangle-Three-
+# Buckets: the first and the last point, then in each bucket the point that
+# forms the largest triangle with the previous choice and the mean of the
+# next bucket
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.floor(np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        mean_x, mean_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - mean_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+# Indices of the smallest and the largest y of threshold / 2 buckets
+def minmax(x, y, threshold):
+    n = len(x)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return np.arange(n)
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    indices = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            indices.extend((start + int(np.argmin(y[start:end])), start + int(np.argmax(y[start:end]))))
+    return np.unique(indices)
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
+
+
+# Indices of the points of (x, y), sorted by x, to draw: the points in
+# `x_range` and one more on each side, so that a line reaches the edges of the
+# chart, reduced to about `points` when there are more
+def select(x, y, x_range=None, points=POINTS, method='lttb'):
+    xs = numeric(x)
+    start, end = 0, len(xs)
+    if x_range is not None:
+        low, high = numeric(list(x_range))
+        start = max(0, int(np.searchsorted(xs, low, 'left')) - 1)
+        end = min(len(xs), int(np.searchsorted(xs, high, 'right')) + 1)
+    window = np.arange(start, end)
+    if not points or len(window) <= points:
+        return window
+    ys = np.asarray(y, dtype=float)[start:end]
+    finite = window[np.isfinite(ys) & np.isfinite(xs[start:end])]
+    return finite[METHODS[method](xs[finite], ys[finite - start], points)]
+
+
+def _take(values, indices):
+    if isinstance(values, (list, tuple, np.ndarray, pd.Series)):
+        return np.asarray(values)[indices]
+    return values
+
+
+# Copy of a trace (plain dict) reduced to the points `indices`
+def take_points(trace, indices):
+    n = len(trace['x'])
+    sampled = dict(trace, x=_take(trace['x'], indices), y=_take(trace['y'], indices))
+    for attribute in POINT_ATTRIBUTES:
+        if attribute in trace and hasattr(trace[attribute], '__len__') and len(trace[attribute]) == n:
+            sampled[attribute] = _take(trace[attribute], indices)
+    marker = trace.get('marker')
+    if isinstance(marker, dict):
+        sampled['marker'] = {key: _take(value, indices) if hasattr(value, '__len__') and not isinstance(value, str)
+                             and len(value) == n else value for key, value in marker.items()}
+    return sampled
+
+
+# Plain dict of `figure` whose scatter traces of more than `points` points
+# are reduced to the points of `x_range` (the whole series when None)
+def downsample_figure(figure, x_range=None, points=POINTS, method='lttb'):
+    if hasattr(figure, 'to_plotly_json'):
+        figure = figure.to_plotly_json()
+    traces = []
+    for trace in figure['data']:
+        x, y = trace.get('x'), trace.get('y')
+        if (points and trace.get('type', 'scatter') in ('scatter', 'scattergl') and x is not None and y is not None
+                and len(x) > points):
+            trace = take_points(trace, select(x, y, x_range, points, method))
+        traces.append(trace)
+    return dict(figure, data=traces)
+
+
+# x range of a chart after a zoom or a pan, from its relayoutData: None
+# after a reset of the axes, False when the x axis did not change
+def relayout_range(relayout_data):
+    if not relayout_data:
+        return False
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    if relayout_data.get('xaxis.autorange'):
+        return None
+    return False
+
+
+# Number of points a trace of `n` points has once downsampled
+def shown_points(n):
+    return min(n, POINTS) if POINTS else n
+
+
+# Send the traces of `graph_id` again when its x axis changes. `build` takes
+# the new x range and the values of `states` and returns the figure of that
+# range, or None when the browser already has every point.
+def register_zoom(app, graph_id, build, states=()):
+    from dash import Input, Output, State, no_update
+
+    def resample(relayout_data, *values):
+        x_range = relayout_range(relayout_data)
+        if x_range is False or not POINTS:
+            return no_update
+        figure = build(x_range, *values)
+        if figure is None:
+            return no_update
+        return patch_traces(compact_figure(figure))
+
+    resample.__name__ = f"resample_{graph_id.replace('-', '_')}"
+    app.callback(
+        Output(graph_id, 'figure', allow_duplicate=True),
+        [Input(graph_id, 'relayoutData')],
+        [State(component_id, prop) for component_id, prop in states],
+        prevent_initial_call=True
+    )(resample)
+
+
+# `build` of register_zoom() for a figure built at full resolution by
+# `full_figure`, whose long traces are downsampled
+def resampled(full_figure, method='lttb'):
+    def build(x_range, *values):
+        figure = full_figure(*values)
+        if hasattr(figure, 'to_plotly_json'):
+            figure = figure.to_plotly_json()
+        if not any(trace.get('x') is not None and len(trace['x']) > POINTS for trace in figure['data']):
+            return None
+        return downsample_figure(figure, x_range, method=method)
+    return build
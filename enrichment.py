@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Enriched event notifications, persisted per (eventid, updateno).
+
+The location of a notification is the one of the user (alertsite = 1) or of
+its point of interest. It is resolved once, with the epicentral and
+hypocentral distances and the sign of the S-wave arrival, and stored in a
+SQLite file of the dashboards (events.db -> events-<hash>.enriched.db, the
+hash of the path of the DB telling apart two DBs of the same name). The file
+goes to APP_VIEW_ENRICH_DIR, by default the directory of the result cache
+(APP_VIEW_CACHE_PATH), which belongs to the dashboards: the directory of the
+DB or of its replica may belong to the writer. The dashboard DBs stay
+read-only.
+
+Each updateno is stored with the epicenter and the signature of the
+notifications it was computed from (their number and the totals of the
+source columns, see signature_query()): it is computed again only when the
+location of the event is updated or when notifications were added, deleted
+or edited. When the file can not be written the rows are enriched in memory.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from os import path
+
+import numpy as np
+import pandas as pd
+
+from metrics import read_sql
+from result_cache import default_cache_path
+
+# Columns of the source notifications and the derived ones
+SOURCE_COLUMNS = ['updateno', 'osversion', 'delay', 'alert', 'swavearrival',
+                  'alertsite', 'userlat', 'userlon', 'userlatpoi', 'userlonpoi']
+ENRICHED_COLUMNS = ['updateno', 'osversion', 'delay', 'alert', 'swavearrival',
+                    'lat', 'lon', 'epi_distance', 'hypo_distance', 'swave_sign']
+
+# S-wave arrivals (s) of the located notifications drawn on the S-wave map
+# of the events dashboard, and of them those counted before/after the
+# S-wave in its distance graph (assets/events.js) and in the report
+SWAVE_MAP_RANGE = (-50, 50)
+SWAVE_RANGE = (-30, 120)
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS eventnotif_enriched (eventid TEXT NOT NULL, updateno INTEGER NOT NULL, "
+    "osversion TEXT, delay REAL, alert INTEGER, swavearrival REAL, lat REAL, lon REAL, epi_distance REAL, "
+    "hypo_distance REAL, swave_sign INTEGER)",
+    "CREATE INDEX IF NOT EXISTS eventnotif_enriched_event ON eventnotif_enriched (eventid, updateno)",
+    "CREATE TABLE IF NOT EXISTS eventnotif_enriched_state (eventid TEXT NOT NULL, updateno INTEGER NOT NULL, "
+    "latitude REAL, longitude REAL, depth REAL, signature TEXT NOT NULL, computed REAL NOT NULL, "
+    "PRIMARY KEY (eventid, updateno)) WITHOUT ROWID",
+]
+
+
+def enrichment_path(db_path):
+    base_dir = os.environ.get('APP_VIEW_ENRICH_DIR') or path.dirname(path.abspath(default_cache_path()))
+    stem = path.splitext(path.basename(db_path))[0]
+    digest = hashlib.sha1(path.abspath(db_path).encode('utf-8')).hexdigest()[:12]
+    return path.join(base_dir, f"{stem}-{digest}.enriched.db")
+
+
+# Query of the signature of the notifications of every updateno of an event
+# (parameter: the eventid), which changes when a row is added, deleted or
+# edited in a source column
+def signature_query(table='eventnotif'):
+    numeric = [column for column in SOURCE_COLUMNS if column not in ('updateno', 'osversion')]
+    totals = ' || \':\' || '.join(f"TOTAL({column})" for column in numeric + ['unicode(osversion)',
+                                                                             'length(osversion)'])
+    return (f"SELECT NULLIF(updateno, '') AS updateno, COUNT(*) || ':' || {totals} AS signature "
+            f"FROM {table} WHERE eventid = ? GROUP BY 1")
+
+
+# Great-circle distances from the epicenter to arrays of points, in km
+def epicentral_distances(epiLat, epiLon, lat, lon):
+    rEpiLat, rEpiLon, rLat, rLon = np.radians(epiLat), np.radians(epiLon), np.radians(lat), np.radians(lon)
+    cosine = np.sin(rEpiLat) * np.sin(rLat) + np.cos(rEpiLat) * np.cos(rLat) * np.cos(rEpiLon - rLon)
+    return np.arccos(np.clip(cosine, -1, 1)) * 6371
+
+
+# Location of the notifications `df`: the user when it was alerted there
+# (alertsite), its point of interest otherwise
+def locations(df):
+    at_user = (df['alertsite'] == 1).to_numpy()
+    lat = np.where(at_user, df['userlat'], df['userlatpoi']).astype(float)
+    lon = np.where(at_user, df['userlon'], df['userlonpoi']).astype(float)
+    return lat, lon
+
+
+# Notifications counted before/after the S-wave, as in the S-wave graph of
+# the events dashboard: located and arriving in both ranges
+def swave_counted(swavearrival, lat, lon):
+    swavearrival = np.asarray(swavearrival, dtype=float)
+    low, high = max(SWAVE_MAP_RANGE[0], SWAVE_RANGE[0]), min(SWAVE_MAP_RANGE[1], SWAVE_RANGE[1])
+    return (swavearrival >= low) & (swavearrival <= high) & ~np.isnan(lat) & ~np.isnan(lon)
+
+
+# Derived columns of the notifications `df` (SOURCE_COLUMNS) for the
+# epicenter (latitude, longitude, depth)
+def enrich(df, epicenter):
+    epiLat, epiLon, depth = epicenter
+    lat, lon = locations(df)
+    epi_distance = epicentral_distances(epiLat, epiLon, lat, lon)
+    hypo_distance = np.sqrt(epi_distance * epi_distance + (0 if pd.isna(depth) else depth) ** 2)
+    return pd.DataFrame({
+        'updateno': df['updateno'].to_numpy(dtype=int),
+        'osversion': df['osversion'].to_numpy(),
+        'delay': df['delay'].to_numpy(dtype=float),
+        'alert': df['alert'].to_numpy(),
+        'swavearrival': df['swavearrival'].to_numpy(dtype=float),
+        'lat': lat,
+        'lon': lon,
+        'epi_distance': epi_distance,
+        'hypo_distance': hypo_distance,
+        'swave_sign': pd.array(np.sign(df['swavearrival'].to_numpy(dtype=float)), dtype='Int8'),
+    })
+
+
+def _connect(enriched_path):
+    os.makedirs(path.dirname(enriched_path), exist_ok=True)
+    conn = sqlite3.connect(enriched_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+def _key(value):
+    return None if value is None or pd.isna(value) else float(value)
+
+
+# Updatenos of `signatures` whose stored rows are missing or were computed
+# for another epicenter or other notifications, and stored updatenos that
+# are no longer in `signatures`
+def _changes(conn, eventid, epicenter, signatures):
+    state = conn.execute("SELECT updateno, latitude, longitude, depth, signature "
+                         "FROM eventnotif_enriched_state WHERE eventid = ?", (eventid,)).fetchall()
+    stored = {updateno: ((latitude, longitude, depth), signature)
+              for updateno, latitude, longitude, depth, signature in state}
+    location = tuple(_key(value) for value in epicenter)
+    current = {int(updateno): str(signature) for updateno, signature in signatures.items()}
+    stale = [updateno for updateno, signature in current.items() if stored.get(updateno) != (location, signature)]
+    gone = [updateno for updateno in stored if updateno not in current]
+    return stale, gone
+
+
+# Replace the rows of the updatenos `stale` by `df_enriched` and drop the
+# updatenos `gone`, in one transaction
+def _store(conn, eventid, epicenter, signatures, stale, df_enriched, gone):
+    location = tuple(_key(value) for value in epicenter)
+    rows = df_enriched.astype(object).where(df_enriched.notna(), None)
+    replaced = stale + gone
+    marks = ', '.join('?' * len(replaced))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ('eventnotif_enriched', 'eventnotif_enriched_state'):
+            conn.execute(f"DELETE FROM {table} WHERE eventid = ? AND updateno IN ({marks})", (eventid, *replaced))
+        conn.executemany(f"INSERT INTO eventnotif_enriched (eventid, {', '.join(ENRICHED_COLUMNS)}) "
+                         f"VALUES (?, {', '.join('?' * len(ENRICHED_COLUMNS))})",
+                         ((eventid, *row) for row in rows.itertuples(index=False)))
+        conn.executemany("INSERT INTO eventnotif_enriched_state VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         ((eventid, updateno, *location, str(signatures[updateno]), time.time())
+                          for updateno in stale))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# Enriched notifications of `eventid` in the DB `db_path`. `signatures` maps
+# every updateno to the signature of its notifications (signature_query())
+# and `load(updatenos)` returns the notifications (SOURCE_COLUMNS) of the
+# updatenos to compute again, as they are in the DB.
+def enriched_notifications(db_path, eventid, epicenter, signatures, load):
+    try:
+        conn = _connect(enrichment_path(db_path))
+    except (OSError, sqlite3.Error):
+        return enrich(load(sorted(int(updateno) for updateno in signatures.index)), epicenter)
+
+    try:
+        stale, gone = _changes(conn, eventid, epicenter, signatures)
+        if stale or gone:
+            df_enriched = enrich(load(stale), epicenter) if stale else pd.DataFrame(columns=ENRICHED_COLUMNS)
+            _store(conn, eventid, epicenter, signatures, stale, df_enriched, gone)
+        df = read_sql(f"SELECT {', '.join(ENRICHED_COLUMNS)} FROM eventnotif_enriched WHERE eventid = ?",
+                      conn, 'events.eventnotif_enriched', params=(eventid,))
+    finally:
+        conn.close()
+    df['swave_sign'] = df['swave_sign'].astype('Int8')
+    return df
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Post-processing of the Plotly figures returned by the callbacks.
+
+compact_figure() rounds the data arrays to the precision that is actually
+displayed (coordinates to ~1 m, delays to the millisecond, timestamps to the
+second) and encodes long numeric arrays as base64 typed arrays, which
+plotly.js >= 2.28 decodes natively. The compact_outputs decorator applies it
+to every figure returned by a callback. scatter() switches large traces to
+WebGL.
+"""
+import base64
+import os
+from functools import wraps
+
+import numpy as np
+
+# Decimals kept for each trace attribute. Anything not listed is left as is.
+PRECISION = {
+    'lat': 5,
+    'lon': 5,
+    'x': 3,
+    'y': 3,
+    'z': 3,
+    'color': 3,
+    'size': 2,
+    'customdata': 3,
+    'text': 2,
+}
+
+# APP_VIEW_COMPACT_FIGURES=0 sends the figures untouched
+ENABLED = os.environ.get('APP_VIEW_COMPACT_FIGURES', '1') != '0'
+
+# Arrays at least this long are sent as typed arrays (0 disables them)
+TYPED_ARRAY_MIN = int(os.environ.get('APP_VIEW_TYPED_ARRAY_MIN', 256))
+
+SHORT_LIST = 16
+
+# Scatter traces with at least this many points are drawn with WebGL, SVG
+# becomes unusable past a few ten thousand points (0 keeps SVG)
+WEBGL_MIN = int(os.environ.get('APP_VIEW_WEBGL_MIN', 5000))
+
+_INT_DTYPES = [('i1', np.int8), ('u1', np.uint8), ('i2', np.int16), ('u2', np.uint16), ('i4', np.int32), ('u4', np.uint32)]
+
+
+# Use orjson for the JSON responses when it is installed. Dash encodes the
+# callback outputs with plotly.io.json, so this covers every callback.
+def configure_json_engine():
+    import plotly.io as pio
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return 'json'
+    pio.json.config.default_engine = 'orjson'
+    return 'orjson'
+
+
+def _typed_array(values):
+    if values.dtype.kind == 'f':
+        return {'dtype': 'f4', 'bdata': base64.b64encode(values.astype('<f4').tobytes()).decode('ascii')}
+    low, high = values.min(), values.max()
+    for code, dtype in _INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return {'dtype': code, 'bdata': base64.b64encode(values.astype(f'<{code}').tobytes()).decode('ascii')}
+    return values.tolist()
+
+
+# Typed array of a numeric column, for data sent outside of a figure (a
+# dcc.Store read by clientside callbacks). Floats are rounded to `decimals`.
+def encode_array(values, decimals=None):
+    values = np.asarray(values)
+    if len(values) == 0:
+        return []
+    if values.dtype.kind == 'f' and decimals is not None:
+        values = values.round(decimals)
+    return _typed_array(values)
+
+
+def _compact_datetimes(values):
+    # Whole days are sent as dates, anything else to the second
+    seconds = values.astype('datetime64[s]')
+    unit = 'D' if np.all(seconds == seconds.astype('datetime64[D]')) else 's'
+    return np.datetime_as_string(values, unit=unit).tolist()
+
+
+def _compact_array(key, values):
+    if isinstance(values, (list, tuple)):
+        # Short lists (single points, error bars) are not worth the conversion
+        if len(values) < SHORT_LIST or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            return values
+        values = np.asarray(values)
+    elif hasattr(values, 'to_numpy'):
+        values = values.to_numpy()
+    if not isinstance(values, np.ndarray) or values.ndim != 1:
+        return values
+
+    if values.dtype.kind == 'M':
+        return _compact_datetimes(values)
+    if values.dtype.kind == 'f':
+        values = values.round(PRECISION[key])
+        # The text attribute is shown as is, it stays a list of numbers
+        if key != 'text' and TYPED_ARRAY_MIN and len(values) >= TYPED_ARRAY_MIN:
+            return _typed_array(values)
+        return values.tolist()
+    if values.dtype.kind in 'iu' and key != 'text' and TYPED_ARRAY_MIN and len(values) >= TYPED_ARRAY_MIN:
+        return _typed_array(values)
+    return values
+
+
+def _compact_node(node):
+    for key, value in node.items():
+        if isinstance(value, dict):
+            _compact_node(value)
+        elif key in PRECISION:
+            node[key] = _compact_array(key, value)
+    return node
+
+
+def compact_figure(figure):
+    if hasattr(figure, 'to_plotly_json'):
+        figure = figure.to_plotly_json()
+    if not isinstance(figure, dict) or 'data' not in figure:
+        return figure
+    for trace in figure['data']:
+        _compact_node(trace)
+    return figure
+
+
+# go.Scatter, or go.Scattergl for large traces. Both take the same attributes
+# for markers and lines.
+def scatter(n_points, **kwargs):
+    import plotly.graph_objs as go
+    if WEBGL_MIN and n_points >= WEBGL_MIN:
+        return go.Scattergl(**kwargs)
+    return go.Scatter(**kwargs)
+
+
+# Figure as plain lists and dicts, so that two of them can be compared
+def _plain(node):
+    if isinstance(node, dict):
+        return {key: _plain(value) for key, value in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [_plain(value) for value in node]
+    if isinstance(node, np.ndarray):
+        return _plain(node.tolist())
+    if isinstance(node, np.generic):
+        return node.item()
+    return node
+
+
+# Patch of the array `old` into `new`: its few changed items and the items
+# appended at its end. False when the array has to be sent again.
+def _patch_array(patch, old, new):
+    if not isinstance(old, list) or not isinstance(new, list) or len(new) < len(old):
+        return False
+    changed = [index for index, (a, b) in enumerate(zip(old, new)) if a != b]
+    if len(changed) > SHORT_LIST:
+        return False
+    for index in changed:
+        patch[index] = new[index]
+    if len(new) > len(old):
+        patch.extend(new[len(old):])
+    return True
+
+
+# Patch of the attributes of a trace (or of its marker, line...) that changed.
+# Typed arrays can not be extended and are sent again when they changed.
+def _patch_node(patch, old, new):
+    for key in old.keys() - new.keys():
+        del patch[key]
+    for key, value in new.items():
+        previous = old.get(key)
+        if previous == value:
+            continue
+        if isinstance(value, dict) and isinstance(previous, dict) and 'bdata' not in value:
+            _patch_node(patch[key], previous, value)
+        elif not _patch_array(patch[key], previous, value):
+            patch[key] = value
+
+
+# Partial update of a figure the browser already shows: only the traces are
+# sent, the layout (axes, colour scales, mapbox view, titles) stays as it is.
+# With the figure `shown` in the browser, only the arrays that changed are
+# sent, and the points appended to a list (a new day of data) are extended.
+def patch_traces(figure, shown=None):
+    from dash import Patch
+    if hasattr(figure, 'to_plotly_json'):
+        figure = figure.to_plotly_json()
+    patch = Patch()
+    if not shown or len(shown.get('data', [])) != len(figure['data']):
+        patch['data'] = figure['data']
+        return patch
+    for index, (old, new) in enumerate(zip(shown['data'], figure['data'])):
+        _patch_node(patch['data'][index], _plain(old), _plain(new))
+    return patch
+
+
+def compact_outputs(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        result = func(*args, **kwargs)
+        if not ENABLED:
+            return result
+        if isinstance(result, (tuple, list)):
+            return type(result)(compact_figure(value) for value in result)
+        return compact_figure(result)
+    return wrapper
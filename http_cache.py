@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Compression and conditional caching of the Dash callback responses.
+
+A _dash-update-component response is keyed by the request body plus the
+data version of the databases: while the data does not change, an identical
+request is answered from the result cache without running the callback. A
+response built from data older than that version (a stale snapshot, see
+result_cache.uncacheable) is sent but not stored. Browsers send no conditional headers with the
+fetch POST of Dash, so there is no ETag / 304: the saving is the callback.
+The data version is computed at most once per APP_VIEW_VERSION_TTL seconds
+(1 by default) per process instead of for every request.
+
+Responses bigger than APP_VIEW_COMPRESS_MIN bytes are compressed with brotli
+(when installed) or gzip, depending on the Accept-Encoding of the browser.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+from metrics import observe_cache
+from result_cache import get_cache, reset_uncacheable, track_uncacheable
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN = int(os.environ.get('APP_VIEW_COMPRESS_MIN', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+UPDATE_PATH = '_dash-update-component'
+VERSION_TTL = float(os.environ.get('APP_VIEW_VERSION_TTL', 1))
+
+
+def _accepted_encoding(accept_encoding):
+    accepted = [part.split(';')[0].strip() for part in accept_encoding.lower().split(',')]
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+# `data_version` whose value is reused during `ttl` seconds: it stats every
+# configured database, and a burst of requests needs it once
+def throttled(data_version, ttl=VERSION_TTL):
+    state = {'time': None, 'version': None}
+    lock = threading.Lock()
+
+    def version():
+        with lock:
+            now = time.monotonic()
+            if state['time'] is None or now - state['time'] >= ttl:
+                state['version'] = data_version()
+                state['time'] = now
+            return state['version']
+    return version
+
+
+# `data_version` returns the version of every database the callbacks read.
+# `outputs` optionally restricts the short-circuit to some output ids.
+def install(app, data_version, outputs=None):
+    from flask import Response, g, request
+
+    server = app.server
+    data_version = throttled(data_version)
+
+    def response_key():
+        body = request.get_data(cache=True)
+        version = repr(data_version()).encode('utf-8')
+        return hashlib.sha256(body + b'\0' + version).hexdigest()
+
+    def cacheable():
+        if request.method != 'POST' or not request.path.endswith(UPDATE_PATH):
+            return False
+        if outputs is None:
+            return True
+        output = (request.get_json(silent=True) or {}).get('output', '')
+        return any(name in output for name in outputs)
+
+    @server.before_request
+    def short_circuit():
+        if not cacheable():
+            return None
+        key = response_key()
+        hit, body = get_cache().get(f"http:{key}")
+        observe_cache('http', hit)
+        if hit:
+            return Response(body, mimetype='application/json')
+        # Only a computed response is stored by store_and_compress, and only
+        # if no callback read stale data
+        g.response_key = key
+        g.response_uncacheable = track_uncacheable()
+        return None
+
+    @server.after_request
+    def store_and_compress(response):
+        key = g.pop('response_key', None)
+        if response.status_code != 200 or response.direct_passthrough:
+            return response
+
+        tracked = g.get('response_uncacheable')
+        if key is not None and not (tracked and tracked[0][0]):
+            get_cache().set(f"http:{key}", response.get_data())
+
+        if request.path.endswith(UPDATE_PATH) and 'Content-Encoding' not in response.headers:
+            encoding = _accepted_encoding(request.headers.get('Accept-Encoding', ''))
+            data = response.get_data()
+            if encoding and len(data) >= COMPRESS_MIN:
+                response.set_data(compress(data, encoding))
+                response.headers['Content-Encoding'] = encoding
+                response.headers['Content-Length'] = str(len(response.get_data()))
+            response.vary.add('Accept-Encoding')
+        return response
+
+    @server.teardown_request
+    def stop_tracking(error=None):
+        tracked = g.pop('response_uncacheable', None)
+        if tracked is not None:
+            reset_uncacheable(tracked[1])
+
+    return app
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Language switching in the browser.
+
+The translations of a dashboard are sent once, in a dcc.Store of its layout.
+The callbacks build their outputs in the current language (a State) and
+record which texts are translated:
+
+- text() returns a Span that remembers its translation key and parameters,
+- tag_figure() stores the translation keys of a figure in layout.meta.
+
+register() adds the clientside callbacks (assets/i18n.js) that relabel the
+static texts, the tagged figures and the Spans when the language changes,
+without any request to the server.
+"""
+import json
+
+from dash import ClientsideFunction, Input, Output, State, dcc, html
+
+
+def store(store_id, translations):
+    return dcc.Store(id=store_id, data=translations)
+
+
+# Text of `key` in `language`, relabelled in the browser when it changes
+def text(translations, language, key, **params):
+    params = {name: str(value) for name, value in params.items()}
+    return html.Span(translations[language][key].format(**params),
+                     **{'data-i18n': key, 'data-params': json.dumps(params)})
+
+
+# `labels` maps attribute paths of the figure ('layout.title.text',
+# 'data.0.name', ...) to a translation key or to a (key, params) pair
+def tag_figure(figure, labels):
+    labels = {name: [label[0], {k: str(v) for k, v in label[1].items()}] if isinstance(label, tuple) else label
+              for name, label in labels.items()}
+    if hasattr(figure, 'update_layout'):
+        figure.update_layout(meta={'i18n': labels})
+    elif isinstance(figure, dict) and 'data' in figure:
+        figure.setdefault('layout', {})['meta'] = {'i18n': labels}
+    return figure
+
+
+# `texts` is a list of (component id, property, translation key), `figures`
+# the ids of the tagged graphs and `trees` the ids of the components whose
+# children contain text() Spans
+def register(app, language_id, store_id, texts=(), figures=(), trees=()):
+    inputs = [Input(language_id, 'value'), State(store_id, 'data')]
+
+    if texts:
+        keys = json.dumps([key for _, _, key in texts])
+        app.clientside_callback(
+            f"function(language, translations) {{ return window.dash_clientside.i18n.texts(language, translations, {keys}); }}",
+            [Output(component_id, prop) for component_id, prop, _ in texts],
+            inputs
+        )
+
+    # The outputs also belong to the server callbacks, the relabelling only
+    # runs on a language change
+    for figure_id in figures:
+        app.clientside_callback(
+            ClientsideFunction(namespace='i18n', function_name='figure'),
+            Output(figure_id, 'figure', allow_duplicate=True),
+            inputs + [State(figure_id, 'figure')],
+            prevent_initial_call=True
+        )
+
+    for tree_id in trees:
+        app.clientside_callback(
+            ClientsideFunction(namespace='i18n', function_name='tree'),
+            Output(tree_id, 'children', allow_duplicate=True),
+            inputs + [State(tree_id, 'children')],
+            prevent_initial_call=True
+        )
@@ -1,15 +1,41 @@
+import argparse
+import os
+
 import dash
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output
 from urllib.parse import urlparse, parse_qs
 
+import cancellation
+import metrics
+import http_cache
+from figures import configure_json_engine
+
 # Import the layouts and functions of the dashboards
 from dashboard_users import layout as layout1, register_callbacks as register_callbacks1
 from dashboard_silent import layout as layout2, register_callbacks as register_callbacks2
 from dashboard_events import layout as layout3, register_callbacks as register_callbacks3
+from dashboard_report import layout as layout4, register_callbacks as register_callbacks4
+import dashboard_users, dashboard_silent, dashboard_events
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
+server = app.server  # WSGI entry point, see wsgi.py
+
+# Time every callback registered below and serve them on /metrics
+metrics.install(app)
+# Encode the callback responses with orjson when it is installed
+configure_json_engine()
+
+# Version of the data behind every callback: identical requests are answered
+# from the cache while it does not change, see http_cache.py
+def data_version():
+    return (dashboard_users.data_version(), dashboard_silent.data_version(), dashboard_events.data_version())
+
+# Registered after the metrics so that they record the compressed size
+http_cache.install(app, data_version)
+# Callbacks made stale by a newer input of the same session stop early
+cancellation.install(app)
 
 app.layout = dbc.Container([
     dcc.Location(id='url', refresh=False),
@@ -18,6 +44,7 @@ app.layout = dbc.Container([
         dcc.Tab(label='Users', value='tab-1'),
         dcc.Tab(label='Silent Notif.', value='tab-2'),
         dcc.Tab(label='Events', value='tab-3'),
+        dcc.Tab(label='Report', value='tab-4'),
     ]),
     html.Div(id='tabs-content')
 ])
@@ -42,18 +69,26 @@ def render_content(tab, stored_eventid):
     if tab == 'tab-1':
         return layout1
     elif tab == 'tab-2':
-        return layout2
+        return layout2()
     elif tab == 'tab-3':
         if stored_eventid:
             return html.Div([layout3, html.Div(f"Event ID: {stored_eventid}")])
         return layout3
+    elif tab == 'tab-4':
+        return layout4()
 
 # Register the callbacks for each dashboard
 register_callbacks1(app)
 register_callbacks2(app)
 register_callbacks3(app)
+register_callbacks4(app)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the three dashboards")
+    parser.add_argument('--config', help="combined configuration file of the dashboards, see config.py")
+    args = parser.parse_args()
+    if args.config:
+        os.environ['APP_VIEW_CONFIG'] = os.path.abspath(args.config)
     app.run_server(debug=False, port=8055,
                    host='0.0.0.0',
                    dev_tools_ui=False,
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Instrumentation of the dashboards, exposed in Prometheus text format.
+
+install(app) must be called before the dashboards register their callbacks:
+every callback is then timed, the size of each _dash-update-component
+response is recorded and a /metrics route is added to the Flask server.
+The DB loaders report through read_sql() and observe_query(), the result
+cache through observe_cache() and observe_coalesced() and the figure
+builders through observe_figure(). register_gauge() adds a value computed
+when /metrics is scraped.
+
+With several workers set APP_VIEW_METRICS_DIR: each process dumps its
+metrics there and /metrics sums the files of all the workers.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from os import path
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROWS_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+BYTES_BUCKETS = (1_024, 10_240, 102_400, 512_000, 1_048_576, 5_242_880, 20_971_520)
+
+# /metrics only answers local requests unless this is set
+METRICS_PUBLIC = os.environ.get('APP_VIEW_METRICS_PUBLIC', '') not in ('', '0')
+# Log callbacks slower than this many milliseconds (0 disables it)
+SLOW_CALLBACK_MS = float(os.environ.get('APP_VIEW_SLOW_CALLBACK_MS', 0))
+DUMP_INTERVAL = 1.0  # seconds between two dumps of the process metrics
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}  # labels -> [bucket counts..., count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.setdefault(key, [0] * len(self.buckets) + [0, 0.0])
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.series = {}  # labels -> value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.series[key] = self.series.get(key, 0) + amount
+
+
+# Value read from `collect` when /metrics is scraped, for states shared by
+# the workers (files on disk) rather than observed by each process
+class Gauge:
+    def __init__(self, name, documentation, collect):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect  # returns {labels tuple: value}
+
+
+_lock = threading.Lock()
+
+callback_latency = Histogram('dashboard_callback_duration_seconds', "Duration of the Dash callbacks", LATENCY_BUCKETS)
+callback_errors = Counter('dashboard_callback_errors_total', "Dash callbacks that raised an exception")
+callback_cancelled = Counter('dashboard_callback_cancelled_total',
+                             "Dash callbacks abandoned for a newer request of the same session")
+payload_bytes = Histogram('dashboard_callback_payload_bytes', "Size of the callback responses", BYTES_BUCKETS)
+query_latency = Histogram('dashboard_query_duration_seconds', "Duration of the DB queries", LATENCY_BUCKETS)
+query_rows = Histogram('dashboard_query_rows', "Rows returned by the DB queries", ROWS_BUCKETS)
+cache_requests = Counter('dashboard_cache_requests_total', "Result cache lookups")
+coalesced = Counter('dashboard_coalesced_total', "Computations saved by waiting on an identical one in flight")
+figure_latency = Histogram('dashboard_figure_duration_seconds', "Time to build each figure", LATENCY_BUCKETS)
+
+REGISTRY = [callback_latency, callback_errors, callback_cancelled, payload_bytes, query_latency, query_rows, cache_requests,
+            coalesced, figure_latency]
+GAUGES = []
+
+_last_dump = 0.0
+_dump_timer = None
+
+
+def _metrics_dir():
+    return os.environ.get('APP_VIEW_METRICS_DIR')
+
+
+def _snapshot():
+    return {metric.name: [[list(k), v if not isinstance(v, list) else list(v)] for k, v in metric.series.items()]
+            for metric in REGISTRY}
+
+
+def _deferred_dump():
+    global _dump_timer
+    with _lock:
+        _dump_timer = None
+        try:
+            _maybe_dump(force=True)
+        except OSError:
+            pass
+
+
+# Write the metrics of this process, at most once per DUMP_INTERVAL. A skipped
+# dump is scheduled for later so that an idle worker still publishes its last
+# observations.
+def _maybe_dump(force=False):
+    global _last_dump, _dump_timer
+    metrics_dir = _metrics_dir()
+    now = time.time()
+    if not metrics_dir:
+        return
+    if not force and now - _last_dump < DUMP_INTERVAL:
+        if _dump_timer is None:
+            _dump_timer = threading.Timer(DUMP_INTERVAL, _deferred_dump)
+            _dump_timer.daemon = True
+            _dump_timer.start()
+        return
+    _last_dump = now
+    os.makedirs(metrics_dir, exist_ok=True)
+    out_path = path.join(metrics_dir, f"metrics-{os.getpid()}.json")
+    with open(out_path + '.tmp', 'w') as out_file:
+        json.dump(_snapshot(), out_file)
+    os.replace(out_path + '.tmp', out_path)
+
+
+def _record(func, *args, **kwargs):
+    with _lock:
+        func(*args, **kwargs)
+        try:
+            _maybe_dump()
+        except OSError:
+            pass
+
+
+def register_gauge(name, documentation, collect):
+    GAUGES.append(Gauge(name, documentation, collect))
+
+
+def observe_query(name, seconds, rows, source='sqlite'):
+    _record(query_latency.observe, seconds, query=name, source=source)
+    _record(query_rows.observe, rows, query=name, source=source)
+
+
+def observe_cache(namespace, hit):
+    _record(cache_requests.inc, namespace=namespace, result='hit' if hit else 'miss')
+
+
+# `scope` is 'thread' when the computation ran in the same worker, 'process'
+# when another worker ran it
+def observe_coalesced(namespace, scope):
+    _record(coalesced.inc, namespace=namespace, scope=scope)
+
+
+def observe_figure(name, seconds):
+    _record(figure_latency.observe, seconds, figure=name)
+
+
+# pd.read_sql_query with timing and row count
+def read_sql(query, conn, name, **kwargs):
+    import pandas as pd
+    start = time.perf_counter()
+    df = pd.read_sql_query(query, conn, **kwargs)
+    observe_query(name, time.perf_counter() - start, len(df))
+    return df
+
+
+def instrument_callback(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            # PreventUpdate and friends are part of the normal flow
+            if type(e).__name__ == 'Cancelled':
+                _record(callback_cancelled.inc, callback=func.__name__)
+            elif type(e).__name__ not in ('PreventUpdate',):
+                _record(callback_errors.inc, callback=func.__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _record(callback_latency.observe, elapsed, callback=func.__name__)
+            if SLOW_CALLBACK_MS and elapsed * 1000 > SLOW_CALLBACK_MS:
+                logger.warning("slow callback %s: %.0f ms", func.__name__, elapsed * 1000)
+    return wrapper
+
+
+def _merge(target, source):
+    for name, series in source.items():
+        merged = target.setdefault(name, {})
+        for key, value in series:
+            key = tuple(tuple(k) for k in key)
+            if isinstance(value, list):
+                current = merged.get(key)
+                merged[key] = value if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+
+
+def _collect():
+    metrics_dir = _metrics_dir()
+    with _lock:
+        if not metrics_dir:
+            collected = {}
+            _merge(collected, _snapshot())
+            return collected
+        try:
+            _maybe_dump(force=True)
+        except OSError:
+            pass
+    collected = {}
+    for file_name in sorted(os.listdir(metrics_dir)):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(path.join(metrics_dir, file_name)) as in_file:
+                _merge(collected, json.load(in_file))
+        except (OSError, ValueError):
+            continue
+    return collected
+
+
+def _format_labels(key, extra=()):
+    labels = list(key) + list(extra)
+    if not labels:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render():
+    collected = _collect()
+    lines = []
+    for metric in REGISTRY:
+        series = collected.get(metric.name, {})
+        if isinstance(metric, Histogram):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} histogram")
+            for key, values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(metric.buckets, values):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric.name}_bucket{_format_labels(key, [('le', '+Inf')])} {values[-2]}")
+                lines.append(f"{metric.name}_count{_format_labels(key)} {values[-2]}")
+                lines.append(f"{metric.name}_sum{_format_labels(key)} {values[-1]}")
+        else:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{metric.name}{_format_labels(key)} {value}")
+    for gauge in GAUGES:
+        try:
+            series = gauge.collect()
+        except Exception:
+            logger.exception("gauge %s failed", gauge.name)
+            continue
+        lines.append(f"# HELP {gauge.name} {gauge.documentation}")
+        lines.append(f"# TYPE {gauge.name} gauge")
+        for key, value in sorted(series.items()):
+            lines.append(f"{gauge.name}{_format_labels(key)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+# Remove the files left by a previous run (called once, before forking workers)
+def reset_metrics_dir():
+    metrics_dir = _metrics_dir()
+    if metrics_dir and path.isdir(metrics_dir):
+        for file_name in os.listdir(metrics_dir):
+            if file_name.startswith('metrics-'):
+                os.remove(path.join(metrics_dir, file_name))
+
+
+def install(app, route='/metrics'):
+    from flask import Response, request
+
+    original_callback = app.callback
+
+    # Every callback registered from now on is timed
+    @wraps(original_callback)
+    def callback(*args, **kwargs):
+        register = original_callback(*args, **kwargs)
+
+        def decorator(func):
+            register(instrument_callback(func))
+            return func
+        return decorator
+
+    app.callback = callback
+
+    server = app.server
+
+    @server.after_request
+    def record_payload(response):
+        if request.path.endswith('_dash-update-component') and response.status_code == 200:
+            body = request.get_json(silent=True) or {}
+            _record(payload_bytes.observe, response.calculate_content_length() or 0,
+                    output=str(body.get('output', ''))[:200])
+        return response
+
+    @server.route(route)
+    def metrics_endpoint():
+        if not METRICS_PUBLIC and request.remote_addr not in ('127.0.0.1', '::1'):
+            return Response("Forbidden\n", status=403, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    return app
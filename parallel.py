@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Construction of the figures of a multi-output callback.
+
+build() runs independent figure builders one after the other by default.
+With APP_VIEW_FIGURE_WORKERS set above 1 they run on a thread pool of that
+many threads shared by the process. Only the parts of the builders that
+release the GIL overlap then: the group-bys, sorts and array operations of
+pandas and numpy. Building the Plotly figures and validating their traces
+holds it, and no speedup was measured (on one CPU the Users dashboard took
+1.31 s one after the other and 1.38 s with four threads), so the pool is
+opt-in: compare both settings with benchmarks/run_benchmarks.py on the
+host first. The time of every builder is recorded in the
+dashboard_figure_duration_seconds histogram of /metrics.
+
+A builder that calls build() itself runs the inner builders in its own
+thread: a worker never waits for the pool it belongs to. The builders run in
+a copy of the context of the caller, so that they see its cancellation
+token (cancellation.py).
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+WORKERS = int(os.environ.get('APP_VIEW_FIGURE_WORKERS', 1))
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+# Created on first use, so that every forked worker has its own threads
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='figures')
+        return _pool
+
+
+def _timed(name, func):
+    start = time.perf_counter()
+    try:
+        return func()
+    finally:
+        metrics.observe_figure(name, time.perf_counter() - start)
+
+
+def _in_worker(name, func):
+    _local.worker = True
+    return _timed(name, func)
+
+
+# `builders` maps the name of each figure to a function without arguments.
+# Returns their results in the same order.
+def build(builders):
+    items = list(builders.items())
+    if WORKERS <= 1 or len(items) < 2 or getattr(_local, 'worker', False):
+        return [_timed(name, func) for name, func in items]
+    pool = _get_pool()
+    futures = [pool.submit(contextvars.copy_context().run, _in_worker, name, func) for name, func in items]
+    return [future.result() for future in futures]
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+The server-side callbacks of the dashboards as plain functions, for the
+code that calls them outside of a Dash app: the cache warmer (warmer.py)
+and the benchmarks.
+"""
+
+
+# Stand-in for the Dash app: collects the callback functions by name
+class CallbackRecorder:
+    def __init__(self):
+        self.callbacks = {}
+
+    def callback(self, *args, **kwargs):
+        def decorator(func):
+            self.callbacks[func.__name__] = func
+            return func
+        return decorator
+
+    def clientside_callback(self, *args, **kwargs):
+        pass
+
+
+# Callbacks registered by the register_callbacks() of the dashboard modules
+def record(*modules):
+    recorder = CallbackRecorder()
+    for module in modules:
+        module.register_callbacks(recorder)
+    return recorder.callbacks
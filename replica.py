@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Local read replicas of the dashboard databases.
+
+The long scans of the dashboards hold read locks on the databases that
+sctokenmanager and the Firestore sync write to. The replica manager copies
+every configured database (config.py) to a local file with the online backup
+API, APP_VIEW_REPLICA_PAGES pages at a time with a pause of
+APP_VIEW_REPLICA_SLEEP seconds between two steps, so that the writers get the
+database back between the steps. A database that did not change since its
+last copy is skipped.
+
+The copy is written aside and renamed over the replica: a replica never
+changes in place, so the dashboards open it with immutable=1 and a reader
+keeps the copy it started with. Run the manager next to the dashboards:
+
+    APP_VIEW_REPLICA_DIR=/var/tmp/app_view python replica.py --interval 30
+
+When APP_VIEW_REPLICA_DIR is set the dashboards query the replicas (the
+source databases until the first copy exists) and /metrics exports the
+replication lag as dashboard_replica_lag_seconds.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import time
+from os import path
+
+import config
+import db
+import metrics
+from result_cache import file_version
+
+# Pages copied per step of the backup, and pause between two steps
+PAGES = int(os.environ.get('APP_VIEW_REPLICA_PAGES', 1024))
+SLEEP = float(os.environ.get('APP_VIEW_REPLICA_SLEEP', 0.01))
+
+
+def replica_dir():
+    return os.environ.get('APP_VIEW_REPLICA_DIR')
+
+
+def replica_path(db_path):
+    stem = path.splitext(path.basename(db_path))[0]
+    return path.join(replica_dir(), f"{stem}.replica.db")
+
+
+def _state_path(replica):
+    return replica + '.json'
+
+
+# file_version() as stored in the JSON state (lists instead of tuples)
+def _source_version(db_path):
+    return [list(v) if v is not None else None for v in file_version(db_path)]
+
+
+# Source version and time of the last copy, None before the first one
+def read_state(db_path):
+    try:
+        with open(_state_path(replica_path(db_path))) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+
+# Database the dashboards should query for `db_path`
+def resolve(db_path):
+    if not replica_dir():
+        return db_path
+    replica = replica_path(db_path)
+    return replica if path.exists(replica) else db_path
+
+
+# Copy `db_path` to its replica. Returns False when the replica is up to date.
+def replicate(db_path, pages=PAGES, sleep=SLEEP, force=False):
+    replica = replica_path(db_path)
+    version = _source_version(db_path)
+    state = read_state(db_path)
+    if not force and state is not None and state['source_version'] == version:
+        return False
+
+    os.makedirs(path.dirname(replica), exist_ok=True)
+    started = time.time()
+    tmp_path = f"{replica}.{os.getpid()}.tmp"
+    source = db.connect(db_path)
+    target = sqlite3.connect(tmp_path)
+    try:
+        # The backup restarts by itself when a writer changes the source
+        # between two steps
+        source.backup(target, pages=pages, sleep=sleep)
+        # A copy of a WAL database is still in WAL mode, which immutable=1
+        # readers can not open without its -shm file
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_path, replica)
+
+    state = {'source': path.abspath(db_path), 'source_version': version,
+             'started': started, 'finished': time.time()}
+    with open(_state_path(replica) + '.tmp', 'w') as state_file:
+        json.dump(state, state_file)
+    os.replace(_state_path(replica) + '.tmp', _state_path(replica))
+    return True
+
+
+# Seconds since the replica was copied from a source that changed since: 0
+# while the source did not change, None without a replica
+def lag(db_path):
+    state = read_state(db_path)
+    if state is None:
+        return None
+    if state['source_version'] == _source_version(db_path):
+        return 0.0
+    return time.time() - state['started']
+
+
+def _configured_databases():
+    db_paths = []
+    for dashboard in config.DASHBOARD_FILES:
+        try:
+            db_path = config.database_path(dashboard)
+        except FileNotFoundError:
+            continue
+        if db_path not in db_paths:
+            db_paths.append(db_path)
+    return db_paths
+
+
+def replicate_all():
+    for db_path in _configured_databases():
+        start = time.time()
+        if replicate(db_path):
+            print(f"{db_path} -> {replica_path(db_path)} ({time.time() - start:.2f}s)", flush=True)
+
+
+def _collect_lag():
+    if not replica_dir():
+        return {}
+    series = {}
+    for db_path in _configured_databases():
+        value = lag(db_path)
+        if value is not None:
+            series[(('database', path.basename(db_path)),)] = round(value, 3)
+    return series
+
+
+metrics.register_gauge('dashboard_replica_lag_seconds',
+                       "Seconds since the copy of a changed database started, 0 when the replica is up to date",
+                       _collect_lag)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Copy the dashboard databases to local replicas")
+    parser.add_argument('--interval', type=float, default=0,
+                        help="seconds between two passes, 0 copies the databases once")
+    args = parser.parse_args()
+    if not replica_dir():
+        raise SystemExit("APP_VIEW_REPLICA_DIR must be set")
+    while True:
+        replicate_all()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
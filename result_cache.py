@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Cross-process result cache shared by all the dashboard workers.
+
+Results are pickled into a small SQLite database (WAL mode), so any worker
+started from wsgi.py reads what another worker already computed. Every key
+includes a data version built from the stat of the source databases, which
+means that a new row written by sctokenmanager or the ingestion process
+invalidates the cached figures without any explicit purge.
+
+Misses are single-flight: while a result is being computed, the identical
+calls (same namespace, arguments and data version) of the other threads wait
+for it instead of running the same queries. The other workers wait as well,
+through a lease row in the cache database, and read the result once it is
+stored. /metrics counts the saved computations in dashboard_coalesced_total.
+
+A computation that read data older than its data version (a stale snapshot,
+see snapshots.py) calls uncacheable(): its result is returned but not
+stored, and neither is the result of the memoized calls around it.
+"""
+import contextvars
+import copy
+import hashlib
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from functools import wraps
+from os import path
+
+from metrics import observe_cache, observe_coalesced
+
+DEFAULT_TTL = 3600          # seconds a result is kept even if the data did not change
+DEFAULT_MAX_ENTRIES = 2000  # rows kept in the cache table before the oldest are evicted
+PURGE_EVERY = 50            # purge expired rows every N writes
+# Seconds a worker waits for the result of another worker before it
+# computes it itself
+FLIGHT_TIMEOUT = float(os.environ.get('APP_VIEW_FLIGHT_TIMEOUT', 120))
+FLIGHT_POLL = 0.02          # seconds between two checks for that result
+# APP_VIEW_SINGLE_FLIGHT=0 lets every call compute its own result
+SINGLE_FLIGHT = os.environ.get('APP_VIEW_SINGLE_FLIGHT', '1') not in ('', '0')
+
+
+# Flag of the computation in progress, a list so that the threads it starts
+# in a copy of its context (parallel.py) set the same flag
+_uncacheable = contextvars.ContextVar('app_view_uncacheable', default=None)
+
+
+# Keep the result of the memoized computation in progress out of the cache
+def uncacheable():
+    flag = _uncacheable.get()
+    if flag is not None:
+        flag[0] = True
+
+
+# Flag the rest of the current context, for a computation that memoize does
+# not wrap (a response of http_cache.py). Returns the flag, true once
+# uncacheable() was called, and the token of reset_uncacheable().
+def track_uncacheable():
+    flag = [False]
+    return flag, _uncacheable.set(flag)
+
+
+def reset_uncacheable(token):
+    _uncacheable.reset(token)
+
+
+# Location of the cache database. It can be overridden with APP_VIEW_CACHE_PATH
+def default_cache_path():
+    return os.environ.get('APP_VIEW_CACHE_PATH',
+                          path.join(tempfile.gettempdir(), 'app_view_cache.db'))
+
+
+# Version token of one or more SQLite files. The -wal file is included since
+# with WAL the main file only changes at checkpoint time.
+def file_version(*db_paths):
+    version = []
+    for db_path in db_paths:
+        for candidate in (db_path, db_path + '-wal'):
+            try:
+                st = os.stat(candidate)
+                version.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                version.append(None)
+    return tuple(version)
+
+
+# Plotly figures are stored as plain dicts: unpickling a go.Figure validates
+# every property again, which costs almost as much as building it
+def _to_plain(value):
+    if hasattr(value, 'to_plotly_json'):
+        return value.to_plotly_json()
+    if isinstance(value, tuple):
+        return tuple(_to_plain(v) for v in value)
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value]
+    return value
+
+
+# A computation in progress in this process, shared by the identical calls
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.uncacheable = False
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class ResultCache:
+    def __init__(self, db_path, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, coalesce=SINGLE_FLIGHT):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.coalesce = coalesce
+        self._local = threading.local()
+        self._writes = 0
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    # One connection per thread and per process (workers are forked)
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+        conn.execute("CREATE TABLE IF NOT EXISTS flights (key TEXT PRIMARY KEY, pid INTEGER NOT NULL, "
+                     "started REAL NOT NULL)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(namespace, args=(), kwargs=None, version=None):
+        raw = repr((namespace, args, sorted((kwargs or {}).items()), version))
+        return f"{namespace}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    # Returns (True, value) on a hit and (False, None) on a miss
+    def get(self, key):
+        try:
+            row = self._connect().execute(
+                "SELECT value, created FROM results WHERE key=?", (key,)).fetchone()
+        except sqlite3.Error:
+            return False, None
+        if row is None or time.time() - row[1] > self.ttl:
+            return False, None
+        try:
+            return True, pickle.loads(row[0])
+        except Exception:
+            return False, None
+
+    def set(self, key, value):
+        try:
+            blob = pickle.dumps(_to_plain(value), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Not every callback result is picklable, those are simply not shared
+            return
+        try:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)",
+                         (key, sqlite3.Binary(blob), time.time()))
+            self._writes += 1
+            if self._writes % PURGE_EVERY == 0:
+                self.purge()
+        except sqlite3.Error:
+            pass
+
+    def purge(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+        conn.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM results")
+        self._connect().execute("DELETE FROM flights")
+
+    # Take the lease of `key` for this worker. False when another live worker
+    # holds it. Without the cache database every worker computes.
+    def _claim(self, key):
+        try:
+            conn = self._connect()
+            conn.execute("DELETE FROM flights WHERE key = ? AND started < ?", (key, time.time() - FLIGHT_TIMEOUT))
+            row = conn.execute("SELECT pid FROM flights WHERE key = ?", (key,)).fetchone()
+            if row is not None and not _alive(row[0]):
+                conn.execute("DELETE FROM flights WHERE key = ? AND pid = ?", (key, row[0]))
+            return conn.execute("INSERT OR IGNORE INTO flights (key, pid, started) VALUES (?, ?, ?)",
+                                (key, os.getpid(), time.time())).rowcount == 1
+        except sqlite3.Error:
+            return True
+
+    def _release(self, key):
+        try:
+            self._connect().execute("DELETE FROM flights WHERE key = ? AND pid = ?", (key, os.getpid()))
+        except sqlite3.Error:
+            pass
+
+    # Wait for the worker holding the lease of `key` to store its result.
+    # (False, None) when it gave up without storing it (an exception or a
+    # result that can not be pickled), died or took too long.
+    def _wait(self, key):
+        deadline = time.time() + FLIGHT_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(FLIGHT_POLL)
+            hit, value = self.get(key)
+            if hit:
+                return hit, value
+            try:
+                row = self._connect().execute("SELECT pid FROM flights WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                break
+            if row is None or not _alive(row[0]):
+                break
+        return False, None
+
+    # Compute and store the result of `key` once for all the workers
+    def _compute_once(self, namespace, key, compute):
+        if not self._claim(key):
+            hit, value = self._wait(key)
+            if hit:
+                observe_coalesced(namespace, 'process')
+                return value
+            self._claim(key)
+        try:
+            return self._compute(key, compute)
+        finally:
+            self._release(key)
+
+    # Run `compute` and store its result unless it called uncacheable(), in
+    # which case the enclosing computation is not stored either
+    def _compute(self, key, compute):
+        flag = [False]
+        token = _uncacheable.set(flag)
+        try:
+            value = compute()
+        finally:
+            _uncacheable.reset(token)
+        if flag[0]:
+            uncacheable()
+        else:
+            self.set(key, value)
+        return value
+
+    # Result of `compute` for a missing `key`. The threads that ask for the
+    # same key meanwhile wait for it; they then get it from the cache like
+    # on a hit, or a copy when it was not stored, so that no two callers
+    # share a mutable result. A result that was uncacheable for the first
+    # caller is uncacheable for them too.
+    def single_flight(self, namespace, key, compute):
+        if not self.coalesce:
+            return self._compute(key, compute)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            observe_coalesced(namespace, 'thread')
+            if flight.error is not None:
+                # An error tied to the request of the first caller (a
+                # cancellation, see cancellation.py) is not theirs
+                if not getattr(flight.error, 'shared', True):
+                    return self.single_flight(namespace, key, compute)
+                raise flight.error
+            if flight.uncacheable:
+                uncacheable()
+            hit, value = self.get(key)
+            return value if hit else copy.deepcopy(flight.value)
+
+        flag = [False]
+        token = _uncacheable.set(flag)
+        try:
+            flight.value = self._compute_once(namespace, key, compute)
+            return flight.value
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            _uncacheable.reset(token)
+            flight.uncacheable = flag[0]
+            if flag[0]:
+                uncacheable()
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    # Decorator: `version` is a callable returning the current data version
+    def memoize(self, namespace, version=None):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                key = self.make_key(namespace, args, kwargs, version() if version else None)
+                hit, value = self.get(key)
+                observe_cache(namespace, hit)
+                if hit:
+                    return value
+                return self.single_flight(namespace, key, lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(default_cache_path())
+    return _cache
+
+
+# Module level decorator bound lazily to the shared cache, so importing a
+# dashboard does not open the cache database
+def memoize(namespace, version=None):
+    def decorator(func):
+        cached = {}
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if 'func' not in cached:
+                cached['func'] = get_cache().memoize(namespace, version)(func)
+            return cached['func'](*args, **kwargs)
+
+        # Cached result of a call under the data version `data_version`,
+        # (False, None) when it is not in the cache
+        def lookup(data_version, *args, **kwargs):
+            return get_cache().get(ResultCache.make_key(namespace, args, kwargs, from_json(data_version)))
+
+        wrapper.lookup = lookup
+        return wrapper
+    return decorator
+
+
+# A data version that went through JSON (a dcc.Store), with its tuples back
+def from_json(version):
+    if isinstance(version, list):
+        return tuple(from_json(value) for value in version)
+    return version
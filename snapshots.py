@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Columnar snapshots (Arrow IPC / Feather v2) of the SQLite tables.
+
+A single writer process dumps fcmTokens, apnsTokens, silentnotif and
+eventnotif into uncompressed Arrow files next to the databases:
+
+    python snapshots.py --interval 300
+
+The dashboards memory-map those files, so every worker shares the same pages
+of the OS page cache and a cold start does not parse any SQL row. When
+pyarrow is not installed, or a snapshot is missing or too old, the loaders
+fall back to the SQLite query.
+
+The user identifiers are long token strings that are only compared with
+each other. The snapshots store them dictionary-encoded, and encode_ids()
+turns them into int32 codes in the frames of the loaders, from a snapshot
+or from SQL, for the distinct counts, the duplicates and the group-bys.
+"""
+import argparse
+import json
+import os
+import time
+from contextlib import closing
+from os import path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+import config
+import db
+from metrics import observe_query
+from result_cache import file_version, uncacheable
+
+# Tables dumped by the writer, per dashboard (see config.py)
+SNAPSHOT_TABLES = {
+    'users': ['fcmTokens', 'apnsTokens'],
+    'silent': ['silentnotif'],
+    'events': ['eventnotif'],
+}
+
+# Columns of user identifiers, dictionary-encoded
+USER_ID_COLUMNS = ('UserID', 'userid')
+
+# A snapshot whose source DB changed is still used during this many seconds.
+# Such a read is not from the current data version, so the memoized result
+# built from it is not cached (result_cache.uncacheable).
+DEFAULT_MAX_AGE = int(os.environ.get('APP_VIEW_SNAPSHOT_MAX_AGE', 600))
+
+
+# Snapshots go next to the DB (tokens.db -> tokens.snapshots/) unless
+# APP_VIEW_SNAPSHOT_DIR is set
+def snapshot_dir(db_path):
+    base_dir = os.environ.get('APP_VIEW_SNAPSHOT_DIR')
+    stem = path.splitext(path.basename(db_path))[0]
+    if base_dir:
+        return path.join(base_dir, stem)
+    return path.join(path.dirname(path.abspath(db_path)), f"{stem}.snapshots")
+
+
+def snapshot_path(db_path, table):
+    return path.join(snapshot_dir(db_path), f"{table}.arrow")
+
+
+# Dump one table. The file is written aside and renamed, so readers that
+# already mapped the previous snapshot keep a consistent view.
+def write_snapshot(db_path, table):
+    if pa is None:
+        raise RuntimeError("pyarrow is required to write snapshots")
+    version = file_version(db_path)
+    with closing(db.connect(db_path)) as conn:
+        df = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+
+    arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+    for column in USER_ID_COLUMNS:
+        if column in arrow_table.column_names:
+            index = arrow_table.column_names.index(column)
+            arrow_table = arrow_table.set_column(index, column, arrow_table[column].dictionary_encode())
+    arrow_table = arrow_table.replace_schema_metadata({
+        'source_version': json.dumps(version),
+        'created': str(time.time()),
+    })
+
+    out_path = snapshot_path(db_path, table)
+    os.makedirs(path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    # No compression: compressed buffers can not be memory-mapped zero-copy
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    os.replace(tmp_path, out_path)
+    return out_path, arrow_table.num_rows
+
+
+def _apply_filters(arrow_table, where):
+    mask = None
+    for column, value in where.items():
+        if isinstance(value, tuple):
+            low, high = value
+            condition = pc.and_(pc.greater_equal(arrow_table[column], low),
+                                pc.less_equal(arrow_table[column], high))
+        else:
+            condition = pc.equal(arrow_table[column], value)
+        mask = condition if mask is None else pc.and_(mask, condition)
+    return arrow_table if mask is None else arrow_table.filter(mask)
+
+
+# A dictionary column becomes a Categorical of the whole dictionary: a
+# filter that kept fewer rows than there are identifiers gets plain strings
+def _decode_small(arrow_table):
+    for index, field in enumerate(arrow_table.schema):
+        column = arrow_table.column(index)
+        if (pa.types.is_dictionary(field.type) and column.num_chunks
+                and arrow_table.num_rows < len(column.chunk(0).dictionary)):
+            arrow_table = arrow_table.set_column(index, field.name, column.cast(field.type.value_type))
+    return arrow_table
+
+
+# The dictionary columns replaced by their int32 indices, which are the codes
+# of the identifiers in the whole snapshot
+def _dictionary_codes(arrow_table):
+    for index, field in enumerate(arrow_table.schema):
+        if pa.types.is_dictionary(field.type):
+            codes = pa.chunked_array([chunk.indices for chunk in arrow_table.column(index).chunks],
+                                     type=field.type.index_type)
+            arrow_table = arrow_table.set_column(index, field.name, codes)
+    return arrow_table
+
+
+# Memory-map a snapshot. Returns None if it can not be used, so the caller
+# runs its SQL query instead. With `codes` the user identifiers come as
+# int32 codes, see encode_ids().
+def read_snapshot(db_path, table, columns=None, where=None, max_age=DEFAULT_MAX_AGE, codes=False):
+    if pa is None:
+        return None
+    start = time.perf_counter()
+    snap_path = snapshot_path(db_path, table)
+    try:
+        source = pa.memory_map(snap_path, 'r')
+        arrow_table = pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+    metadata = arrow_table.schema.metadata or {}
+    fresh = json.loads(metadata.get(b'source_version', b'null')) == json.loads(json.dumps(file_version(db_path)))
+    if not fresh and time.time() - float(metadata.get(b'created', 0)) > max_age:
+        return None
+    if columns is not None and any(c not in arrow_table.column_names for c in columns):
+        return None
+
+    if where:
+        arrow_table = _apply_filters(arrow_table, where)
+    if columns is not None:
+        arrow_table = arrow_table.select(columns)
+    arrow_table = _dictionary_codes(arrow_table) if codes else _decode_small(arrow_table)
+    df = arrow_table.to_pandas(split_blocks=True)
+    if not fresh:
+        uncacheable()
+    observe_query(table, time.perf_counter() - start, len(df), source='arrow')
+    return df
+
+
+# Replace the user identifiers of `df` by int32 codes, numbered in the order
+# of their first row. A code only means something within `df`. A missing
+# identifier stays missing. Codes read from a snapshot are kept as they are.
+def encode_ids(df, columns=USER_ID_COLUMNS):
+    for column in columns:
+        if column in df and not pd.api.types.is_integer_dtype(df[column]):
+            codes = pd.factorize(df[column])[0].astype(np.int32)
+            missing = codes < 0
+            df[column] = pd.arrays.IntegerArray(codes, missing) if missing.any() else codes
+    return df
+
+
+def _configured_databases():
+    for dashboard, tables in SNAPSHOT_TABLES.items():
+        try:
+            yield config.database_path(dashboard), tables
+        except FileNotFoundError:
+            continue
+
+
+def write_all():
+    for db_path, tables in _configured_databases():
+        for table in tables:
+            start = time.time()
+            out_path, rows = write_snapshot(db_path, table)
+            print(f"{table}: {rows} rows -> {out_path} ({time.time() - start:.2f}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write Arrow snapshots of the dashboard tables")
+    parser.add_argument('--interval', type=int, default=0,
+                        help="seconds between snapshots, 0 writes them once")
+    args = parser.parse_args()
+    while True:
+        write_all()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
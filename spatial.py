@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+R-tree indexes of the coordinates of the notifications and reports.
+
+The installer is optional, like the one of summaries.py: it adds one R-tree
+virtual table per table with coordinates, keyed by the rowid of the rows and
+filled from the existing rows, and the triggers that keep it current:
+
+    python spatial.py install     # or uninstall, --db to name the DB
+
+A rowid of a table without INTEGER PRIMARY KEY may change on VACUUM: install
+the indexes again after one. Rows without coordinates are not indexed.
+
+box_query() and radius_query() filter a table on a bounding box or on a
+distance around a point in SQL, through the R-tree when it is installed and
+with a plain range condition otherwise. The R-tree stores 32-bit floats, so
+the exact condition is always checked as well.
+"""
+import argparse
+import math
+import sqlite3
+
+import numpy as np
+
+import config
+from metrics import read_sql
+
+# R-tree of each table: its name and the expressions of the latitude and the
+# longitude of a row ({row} is NEW, OLD or the table). The location of an
+# event notification is the one of the user or of its point of interest.
+INDEXES = {
+    'silentnotif': ('silentnotif_rtree', '{row}.userLat', '{row}.userLon'),
+    'eventnotif': ('eventnotif_rtree',
+                   'CASE WHEN {row}.alertsite = 1 THEN {row}.userlat ELSE {row}.userlatpoi END',
+                   'CASE WHEN {row}.alertsite = 1 THEN {row}.userlon ELSE {row}.userlonpoi END'),
+    'intensityreports': ('intensityreports_rtree', '{row}.lat', '{row}.lon'),
+}
+
+EARTH_RADIUS = 6371
+
+
+def location(table, row):
+    _, lat, lon = INDEXES[table]
+    return lat.format(row=row), lon.format(row=row)
+
+
+def _add_row(table, row):
+    rtree = INDEXES[table][0]
+    lat, lon = location(table, row)
+    return (f"INSERT INTO {rtree} SELECT {row}.rowid, {lat}, {lat}, {lon}, {lon} "
+            f"WHERE {lat} IS NOT NULL AND {lon} IS NOT NULL;")
+
+
+def _statements(table, columns):
+    rtree = INDEXES[table][0]
+    lat, lon = location(table, table)
+    watched = ', '.join(column for column in columns if column.lower() in
+                        ('userlat', 'userlon', 'userlatpoi', 'userlonpoi', 'alertsite', 'lat', 'lon'))
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {rtree} USING rtree(id, minLat, maxLat, minLon, maxLon)",
+        f"DELETE FROM {rtree}",
+        f"INSERT INTO {rtree} SELECT rowid, {lat}, {lat}, {lon}, {lon} FROM {table} "
+        f"WHERE {lat} IS NOT NULL AND {lon} IS NOT NULL",
+        f"CREATE TRIGGER IF NOT EXISTS {rtree}_insert AFTER INSERT ON {table} BEGIN "
+        f"{_add_row(table, 'NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {rtree}_delete AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {rtree} WHERE id = OLD.rowid; END",
+        f"CREATE TRIGGER IF NOT EXISTS {rtree}_update AFTER UPDATE OF {watched} ON {table} BEGIN "
+        f"DELETE FROM {rtree} WHERE id = OLD.rowid; {_add_row(table, 'NEW')} END",
+    ]
+
+
+# Create (or rebuild) the R-trees of the tables present in the DB. The DB is
+# locked during the backfill so that no row is missed or indexed twice.
+def install(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        installed_tables = []
+        for table in INDEXES:
+            if table in existing:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                for statement in _statements(table, columns):
+                    conn.execute(statement)
+                installed_tables.append(table)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return installed_tables
+
+
+def uninstall(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for rtree, _, _ in INDEXES.values():
+            for suffix in ('insert', 'delete', 'update'):
+                conn.execute(f"DROP TRIGGER IF EXISTS {rtree}_{suffix}")
+            conn.execute(f"DROP TABLE IF EXISTS {rtree}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+# Whether the R-tree of `table` is installed in the DB of `conn`
+def installed(conn, table):
+    rtree = INDEXES[table][0]
+    found = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?)",
+                         (rtree, f'{rtree}_insert')).fetchone()[0]
+    return found == 2
+
+
+# Bounding box (min_lat, max_lat, min_lon, max_lon) of the points within
+# `radius` km of (lat, lon)
+def radius_box(lat, lon, radius):
+    dlat = math.degrees(radius / EARTH_RADIUS)
+    coslat = math.cos(math.radians(lat))
+    dlon = 180 if coslat < 1e-6 else min(180, math.degrees(radius / (EARTH_RADIUS * coslat)))
+    return max(-90, lat - dlat), min(90, lat + dlat), lon - dlon, lon + dlon
+
+
+# Bounding box of a mapbox view of `width` x `height` pixels centred on
+# (lat, lon), in web mercator with 512 pixel tiles
+def view_box(lat, lon, zoom, width=1600, height=1000):
+    degrees_per_pixel = 360 / (512 * 2 ** zoom)
+    y = math.log(math.tan(math.pi / 4 + math.radians(max(-85, min(85, lat))) / 2))
+    dy = math.radians(degrees_per_pixel * height / 2)
+    lat_min = math.degrees(2 * math.atan(math.exp(y - dy)) - math.pi / 2)
+    lat_max = math.degrees(2 * math.atan(math.exp(y + dy)) - math.pi / 2)
+    dlon = min(180, degrees_per_pixel * width / 2)
+    return lat_min, lat_max, lon - dlon, lon + dlon
+
+
+# Bounding box of the view of a map after a pan or a zoom, from the
+# relayoutData of the graph. None when the view did not change.
+def relayout_box(relayout_data):
+    if not relayout_data:
+        return None
+    corners = (relayout_data.get('mapbox._derived') or {}).get('coordinates')
+    if corners:
+        lons = [corner[0] for corner in corners]
+        lats = [corner[1] for corner in corners]
+        return min(lats), max(lats), min(lons), max(lons)
+    center, zoom = relayout_data.get('mapbox.center'), relayout_data.get('mapbox.zoom')
+    if center and zoom is not None:
+        return view_box(center['lat'], center['lon'], zoom)
+    return None
+
+
+# Longitude ranges of [min_lon, max_lon], split at the antimeridian
+def _lon_ranges(min_lon, max_lon):
+    if max_lon - min_lon >= 360:
+        return [(-180, 180)]
+    min_lon = (min_lon + 180) % 360 - 180
+    max_lon = (max_lon + 180) % 360 - 180
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180), (-180, max_lon)]
+
+
+# Mask of the points (Series of latitudes and longitudes) in `box`
+def in_box(lat, lon, box):
+    min_lat, max_lat, min_lon, max_lon = box
+    mask = lon.between(*_lon_ranges(min_lon, max_lon)[0])
+    for lon_range in _lon_ranges(min_lon, max_lon)[1:]:
+        mask |= lon.between(*lon_range)
+    return mask & lat.between(min_lat, max_lat)
+
+
+# SQL of the `columns` of the rows of `table` (aliased t) in `box`, with the
+# extra condition `where` on t, and its parameters. The location of the rows
+# is selected as location_lat and location_lon.
+def box_sql(conn, table, columns, box, where='1', params=()):
+    min_lat, max_lat, min_lon, max_lon = box
+    lat, lon = location(table, 't')
+    select = ', '.join([f"t.{column}" for column in columns] + [f"{lat} AS location_lat", f"{lon} AS location_lon"])
+    ranges = _lon_ranges(min_lon, max_lon)
+    exact = ' OR '.join(f"({lon} BETWEEN ? AND ?)" for _ in ranges)
+    exact_params = [value for lon_range in ranges for value in lon_range]
+    if installed(conn, table):
+        rtree = INDEXES[table][0]
+        indexed = ' OR '.join("(r.maxLon >= ? AND r.minLon <= ?)" for _ in ranges)
+        query = (f"SELECT {select} FROM {rtree} AS r JOIN {table} AS t ON t.rowid = r.id "
+                 f"WHERE r.maxLat >= ? AND r.minLat <= ? AND ({indexed}) "
+                 f"AND {lat} BETWEEN ? AND ? AND ({exact}) AND ({where})")
+        return query, (min_lat, max_lat, *exact_params, min_lat, max_lat, *exact_params, *params)
+    query = f"SELECT {select} FROM {table} AS t WHERE {lat} BETWEEN ? AND ? AND ({exact}) AND ({where})"
+    return query, (min_lat, max_lat, *exact_params, *params)
+
+
+# Rows of `table` whose location is in `box`
+def box_query(conn, table, columns, box, where='1', params=(), name=None):
+    query, query_params = box_sql(conn, table, columns, box, where, params)
+    return read_sql(query, conn, name or f'{table}.box', params=query_params)
+
+
+# Rows of `table` within `radius` km of (lat, lon)
+def radius_query(conn, table, columns, lat, lon, radius, where='1', params=(), name=None):
+    df = box_query(conn, table, columns, radius_box(lat, lon, radius), where, params, name or f'{table}.radius')
+    rLat, rLon = np.radians(lat), np.radians(lon)
+    pLat = np.radians(df['location_lat'].to_numpy(dtype=float))
+    pLon = np.radians(df['location_lon'].to_numpy(dtype=float))
+    cosine = np.sin(rLat) * np.sin(pLat) + np.cos(rLat) * np.cos(pLat) * np.cos(rLon - pLon)
+    return df[np.arccos(np.clip(cosine, -1, 1)) * EARTH_RADIUS <= radius]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Install the R-tree indexes of the coordinates")
+    parser.add_argument('action', choices=['install', 'uninstall'])
+    parser.add_argument('--db', nargs='*', help="databases to change, by default the DBs of the silent and events "
+                                                "dashboards")
+    args = parser.parse_args()
+    db_paths = args.db or sorted({config.database_path('silent'), config.database_path('events')})
+    for db_path in db_paths:
+        if args.action == 'install':
+            print(f"{db_path}: R-trees of {', '.join(install(db_path)) or 'no table'}")
+        else:
+            uninstall(db_path)
+            print(f"{db_path}: R-trees removed")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Summary tables kept current by SQLite triggers.
+
+The installer is optional: it adds to the dashboard DB one summary table per
+notification table, with the number of rows and the count and sum of the
+delays per group, filled from the existing rows, and the triggers that update
+it on every INSERT, UPDATE and DELETE. The writers need no change, each write
+also updates one row of the summary in the same transaction:
+
+    python summaries.py install     # or uninstall, --db to name the DB
+
+A NULL in a group column is stored as '' (SQLite never merges NULL keys).
+The dashboards use the summaries when they are installed, see installed().
+"""
+import argparse
+import sqlite3
+
+import config
+
+# Summary of each table: its name, the group columns and the summed column
+SUMMARIES = {
+    'silentnotif': ('silentnotif_summary', ['senttime', 'notifid', 'osversion'], 'delay'),
+    'eventnotif': ('eventnotif_summary', ['eventid', 'updateno', 'osversion'], 'delay'),
+    'intensityreports': ('intensityreports_summary', ['eventid', 'intensity'], None),
+}
+
+
+def _add_row(table, sign, row):
+    summary, keys, value = SUMMARIES[table]
+    columns = keys + ['rows'] + ([f'{value}_count', f'{value}_sum'] if value else [])
+    values = [f"IFNULL({row}.{key}, '')" for key in keys] + [f"{sign}1"]
+    if value:
+        values += [f"{sign}({row}.{value} IS NOT NULL)", f"{sign}IFNULL({row}.{value}, 0)"]
+    updates = ', '.join(f"{column} = {column} + excluded.{column}" for column in columns[len(keys):])
+    statement = (f"INSERT INTO {summary} ({', '.join(columns)}) VALUES ({', '.join(values)}) "
+                 f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates};")
+    if sign == '-':
+        match = ' AND '.join(f"{key} = IFNULL({row}.{key}, '')" for key in keys)
+        statement += f" DELETE FROM {summary} WHERE {match} AND rows <= 0;"
+    return statement
+
+
+def _statements(table):
+    summary, keys, value = SUMMARIES[table]
+    aggregates = ['rows INTEGER NOT NULL'] + ([f'{value}_count INTEGER NOT NULL', f'{value}_sum REAL NOT NULL']
+                                              if value else [])
+    select = [f"IFNULL({key}, '')" for key in keys] + ['COUNT(*)'] + ([f'COUNT({value})', f'IFNULL(SUM({value}), 0)']
+                                                                       if value else [])
+    watched = ', '.join(keys + ([value] if value else []))
+    return [
+        f"CREATE TABLE IF NOT EXISTS {summary} ({', '.join(keys)}, {', '.join(aggregates)}, "
+        f"PRIMARY KEY ({', '.join(keys)})) WITHOUT ROWID",
+        f"DELETE FROM {summary}",
+        f"INSERT INTO {summary} SELECT {', '.join(select)} FROM {table} "
+        f"GROUP BY {', '.join(str(i + 1) for i in range(len(keys)))}",
+        f"CREATE TRIGGER IF NOT EXISTS {summary}_insert AFTER INSERT ON {table} BEGIN "
+        f"{_add_row(table, '', 'NEW')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {summary}_delete AFTER DELETE ON {table} BEGIN "
+        f"{_add_row(table, '-', 'OLD')} END",
+        f"CREATE TRIGGER IF NOT EXISTS {summary}_update AFTER UPDATE OF {watched} ON {table} BEGIN "
+        f"{_add_row(table, '-', 'OLD')} {_add_row(table, '', 'NEW')} END",
+    ]
+
+
+def _existing_tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+# Create (or rebuild) the summaries of the tables present in the DB. The DB is
+# locked during the backfill so that no row is missed or counted twice.
+def install(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = _existing_tables(conn)
+        installed_tables = []
+        for table in SUMMARIES:
+            if table in existing:
+                for statement in _statements(table):
+                    conn.execute(statement)
+                installed_tables.append(table)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return installed_tables
+
+
+def uninstall(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for summary, _, _ in SUMMARIES.values():
+            for suffix in ('insert', 'delete', 'update'):
+                conn.execute(f"DROP TRIGGER IF EXISTS {summary}_{suffix}")
+            conn.execute(f"DROP TABLE IF EXISTS {summary}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+# Whether the summary of `table` is installed in the DB of `conn`: the
+# summary table and its insert trigger both exist
+def installed(conn, table):
+    summary = SUMMARIES[table][0]
+    found = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?)",
+                         (summary, f'{summary}_insert')).fetchone()[0]
+    return found == 2
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Install the trigger-maintained summary tables")
+    parser.add_argument('action', choices=['install', 'uninstall'])
+    parser.add_argument('--db', nargs='*', help="databases to change, by default the DBs of the silent and events "
+                                                "dashboards")
+    args = parser.parse_args()
+    db_paths = args.db or sorted({config.database_path('silent'), config.database_path('events')})
+    for db_path in db_paths:
+        if args.action == 'install':
+            print(f"{db_path}: summaries of {', '.join(install(db_path)) or 'no table'}")
+        else:
+            uninstall(db_path)
+            print(f"{db_path}: summaries removed")
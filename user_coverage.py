@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Coverage of the registered users by the notifications.
+
+The registered users are in the tokens DB of the users dashboard (fcmTokens
+per TokenSource, and apnsTokens), the notifications they received in the
+dashboard DB (silentnotif and eventnotif). connect() opens the dashboard DB
+and ATTACHes the tokens DB, so that both sides are joined in SQL and only
+the counts reach pandas. A user is registered on a platform from its first
+token there, and is counted as reached only from that moment.
+
+    daily_coverage()         per day and platform: users registered by then
+                             and the share of them that received a
+                             notification that day
+    notification_coverage()  per silent notification (senttime) and per
+                             event: users registered at that time and the
+                             share of them that received it
+
+Both are cached by the data version of the two DBs. The optional indexes
+make the joins and the grouping by user index scans:
+
+    python user_coverage.py install     # or uninstall
+"""
+import argparse
+import sqlite3
+
+import pandas as pd
+
+import config
+import db
+import replica
+from metrics import read_sql
+from result_cache import file_version, memoize
+
+# Indexes of the joins on the user: table -> (index, columns)
+INDEXES = {
+    'fcmTokens': ('fcmTokens_coverage', 'UserID, TokenSource, timestamp'),
+    'apnsTokens': ('apnsTokens_coverage', 'UserID, timestamp'),
+    'silentnotif': ('silentnotif_coverage', 'userid, senttime'),
+    'eventnotif': ('eventnotif_coverage', 'userid, eventid'),
+}
+
+# First token of every user per platform: the FCM TokenSource or 'apns'
+PLATFORM_USERS = """
+platform_users AS (
+    SELECT UserID AS userid, TokenSource AS platform, MIN(timestamp) AS registered
+    FROM tokens.fcmTokens WHERE UserID IS NOT NULL GROUP BY UserID, TokenSource
+    UNION ALL
+    SELECT UserID, 'apns', MIN(timestamp) FROM tokens.apnsTokens WHERE UserID IS NOT NULL GROUP BY UserID
+),
+events_info AS (
+    SELECT eventid, CAST(strftime('%s', MIN(origintime)) AS INTEGER) AS time FROM {events}.eventinfo GROUP BY eventid
+)"""
+
+# Users that received a notification per day, of each source
+RECEIVED = {
+    'silent': "SELECT date(senttime / 1000, 'unixepoch') AS day, userid, senttime / 1000 AS time FROM silentnotif",
+    'event': "SELECT date(i.time, 'unixepoch') AS day, e.userid, i.time FROM {events}.eventnotif AS e "
+             "JOIN events_info AS i ON i.eventid = e.eventid",
+}
+
+DAILY_QUERY = """
+WITH {platform_users},
+received AS (
+    SELECT day, userid, MIN(time) AS time FROM ({received}) WHERE userid IS NOT NULL GROUP BY day, userid
+),
+new_users AS (
+    SELECT date(registered, 'unixepoch') AS day, platform, COUNT(*) AS new FROM platform_users GROUP BY 1, 2
+),
+reached AS (
+    SELECT r.day, p.platform, COUNT(*) AS reached
+    FROM received AS r JOIN platform_users AS p ON p.userid = r.userid AND p.registered <= r.time
+    GROUP BY r.day, p.platform
+),
+days AS (SELECT day, platform FROM new_users UNION SELECT day, platform FROM reached)
+SELECT day, platform, registered, reached, 100.0 * reached / registered AS coverage FROM (
+    SELECT d.day, d.platform, COALESCE(r.reached, 0) AS reached,
+           SUM(COALESCE(n.new, 0)) OVER (PARTITION BY d.platform ORDER BY d.day) AS registered
+    FROM days AS d
+    LEFT JOIN new_users AS n ON n.day = d.day AND n.platform = d.platform
+    LEFT JOIN reached AS r ON r.day = d.day AND r.platform = d.platform
+)
+WHERE reached > 0
+ORDER BY day, platform
+"""
+
+NOTIFICATION_QUERY = """
+WITH {platform_users},
+notifications AS (
+    SELECT 'silent' AS kind, CAST(senttime AS TEXT) AS id, MIN(notifid) AS name, senttime / 1000 AS time
+    FROM silentnotif GROUP BY senttime
+    UNION ALL
+    SELECT 'event', eventid, eventid, time FROM events_info
+),
+platforms AS (SELECT DISTINCT platform FROM platform_users),
+timeline AS (
+    SELECT platform, registered AS time, 1 AS new, NULL AS kind, NULL AS id FROM platform_users
+    UNION ALL
+    SELECT p.platform, n.time, 0, n.kind, n.id FROM notifications AS n, platforms AS p
+),
+registered AS (
+    SELECT kind, id, platform, registered FROM (
+        SELECT kind, id, platform,
+               SUM(new) OVER (PARTITION BY platform ORDER BY time, new DESC ROWS UNBOUNDED PRECEDING) AS registered
+        FROM timeline
+    ) WHERE kind IS NOT NULL
+),
+reached AS (
+    SELECT 'silent' AS kind, CAST(s.senttime AS TEXT) AS id, p.platform, COUNT(DISTINCT s.userid) AS reached
+    FROM silentnotif AS s JOIN platform_users AS p ON p.userid = s.userid AND p.registered <= s.senttime / 1000
+    GROUP BY s.senttime, p.platform
+    UNION ALL
+    SELECT 'event', e.eventid, p.platform, COUNT(DISTINCT e.userid)
+    FROM {events}.eventnotif AS e JOIN events_info AS i ON i.eventid = e.eventid
+    JOIN platform_users AS p ON p.userid = e.userid AND p.registered <= i.time
+    GROUP BY e.eventid, p.platform
+)
+SELECT n.kind, n.id, n.name, n.time, g.platform, g.registered, COALESCE(r.reached, 0) AS reached,
+       100.0 * COALESCE(r.reached, 0) / NULLIF(g.registered, 0) AS coverage
+FROM notifications AS n
+JOIN registered AS g ON g.kind = n.kind AND g.id = n.id
+LEFT JOIN reached AS r ON r.kind = n.kind AND r.id = n.id AND r.platform = g.platform
+ORDER BY n.time DESC, g.platform
+"""
+
+
+# Path queried for the DB of `dashboard` (its replica when there is one)
+# and whether it can be opened as immutable, as in the dashboards
+def _queried(dashboard):
+    db_path = config.database_path(dashboard)
+    queried = replica.resolve(db_path)
+    return queried, queried != db_path or config.get(dashboard).get('immutable', False)
+
+
+def data_version():
+    return file_version(*(_queried(dashboard)[0] for dashboard in ('users', 'silent', 'events')))
+
+
+# Read-only connection to the silent notifications DB with the tokens DB
+# attached as `tokens`, and the events DB as `events` when it is another
+# file. Returns the connection and the schema of eventnotif.
+def connect():
+    silent_path, silent_immutable = _queried('silent')
+    conn = db.connect(silent_path, immutable=silent_immutable)
+    tokens_path, tokens_immutable = _queried('users')
+    conn.execute("ATTACH DATABASE ? AS tokens", (db.uri(tokens_path, tokens_immutable),))
+    events_path, events_immutable = _queried('events')
+    if events_path == silent_path:
+        return conn, 'main'
+    conn.execute("ATTACH DATABASE ? AS events", (db.uri(events_path, events_immutable),))
+    return conn, 'events'
+
+
+def _query(template, events, **parts):
+    return template.format(platform_users=PLATFORM_USERS.format(events=events), events=events, **parts)
+
+
+# Coverage per day and platform by the notifications of `source`: 'silent',
+# 'event' or 'all'
+@memoize('coverage.daily', version=data_version)
+def daily_coverage(source='all'):
+    conn, events = connect()
+    sources = list(RECEIVED) if source == 'all' else [source]
+    received = ' UNION ALL '.join(RECEIVED[name].format(events=events) for name in sources)
+    df = read_sql(_query(DAILY_QUERY, events, received=received), conn, 'coverage.daily')
+    conn.close()
+    df['day'] = pd.to_datetime(df['day'])
+    return df
+
+
+@memoize('coverage.notifications', version=data_version)
+def notification_coverage():
+    conn, events = connect()
+    df = read_sql(_query(NOTIFICATION_QUERY, events), conn, 'coverage.notifications')
+    conn.close()
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    return df
+
+
+# Create the indexes of the tables present in the DB. Unlike the queries,
+# this needs write access.
+def install(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        indexed = []
+        for table, (index, columns) in INDEXES.items():
+            if table in existing:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})")
+                indexed.append(table)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return indexed
+
+
+def uninstall(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for index, _ in INDEXES.values():
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Install the indexes of the coverage queries")
+    parser.add_argument('action', choices=['install', 'uninstall'])
+    parser.add_argument('--db', nargs='*', help="databases to change, by default the DBs of the users, silent and "
+                                                "events dashboards")
+    args = parser.parse_args()
+    db_paths = args.db or sorted({config.database_path(dashboard) for dashboard in ('users', 'silent', 'events')})
+    for db_path in db_paths:
+        if args.action == 'install':
+            print(f"{db_path}: coverage indexes of {', '.join(install(db_path)) or 'no table'}")
+        else:
+            uninstall(db_path)
+            print(f"{db_path}: coverage indexes removed")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Cache warmer of the Events dashboard.
+
+Right after an earthquake many operators open the new eventid through the
+?eventid= link of main.py at the same moment. The warmer watches eventinfo
+and, for every event that is new or whose row was updated, runs the
+callbacks of the Events dashboard in the background: the summary cards, the
+updateno dropdowns, the intensity figures in every language and the data of
+the browser figures with its enriched notifications (enrichment.py). Their
+results land in the shared result cache (result_cache.py), where the workers
+of the dashboards find them.
+
+The cached results are keyed by the data version of the DB, which changes
+with every notification that arrives. An event therefore stays hot for
+APP_VIEW_WARM_WINDOW seconds (3600 by default) after its last update and is
+warmed again whenever the data version changes in that time.
+
+    python warmer.py --interval 5      # --snapshots also rewrites eventnotif.arrow
+"""
+import argparse
+import os
+import time
+
+import dashboard_events
+from metrics import read_sql
+from recorder import record
+
+WINDOW = float(os.environ.get('APP_VIEW_WARM_WINDOW', 3600))
+
+
+def load_callbacks():
+    return record(dashboard_events)
+
+
+# Last updatetime of every event
+def latest_updates():
+    conn = dashboard_events.connect_db(dashboard_events.load_db_path())
+    df = read_sql("SELECT eventid, MAX(updatetime) AS updatetime FROM eventinfo GROUP BY eventid",
+                  conn, 'warmer.eventinfo')
+    conn.close()
+    return df.set_index('eventid')['updatetime']
+
+
+# Server-side callbacks of the Events dashboard for `eventid` and their
+# arguments, in the order in which a page opened on ?eventid= triggers them
+def calls(eventid):
+    yield 'update_event_data', (eventid,)
+    yield 'update_dropdown_1', (eventid,)
+    yield 'update_dropdown_2', (eventid,)
+    for language in dashboard_events.translations:
+        yield 'update_resume_cards', (eventid, language)
+        yield 'update_dashboard_1', (eventid, language)
+
+
+# Run the callbacks of `eventid`. Returns the ones that failed: an event
+# whose rows are still being written is tried again on the next change.
+def warm(callbacks, eventid):
+    failed = []
+    for name, args in calls(eventid):
+        try:
+            callbacks[name](*args)
+        except Exception as error:
+            failed.append(f"{name}{args}: {error!r}")
+    return failed
+
+
+class Warmer:
+    # `recent` events, the last updated ones, are warmed on the first pass
+    def __init__(self, window=WINDOW, recent=1, snapshots=False):
+        self.window = window
+        self.recent = recent
+        self.snapshots = snapshots
+        self.callbacks = load_callbacks()
+        self.version = None
+        self.updates = None
+        self.hot = {}  # eventid -> time its update was seen
+
+    # Events that are new or were updated since the previous pass
+    def _changed(self, updates):
+        if self.updates is None:
+            return list(updates.sort_values(ascending=False).index[:self.recent])
+        return [eventid for eventid, updatetime in updates.items() if self.updates.get(eventid) != updatetime]
+
+    # One pass: nothing to do while the data version is the same, otherwise
+    # warm the hot events, the last updated first. Returns the warmed events.
+    def poll(self):
+        version = dashboard_events.data_version()
+        if version == self.version:
+            return []
+        self.version = version
+        updates = latest_updates()
+        now = time.time()
+        for eventid in self._changed(updates):
+            self.hot[eventid] = now
+        self.updates = updates.to_dict()
+        self.hot = {eventid: seen for eventid, seen in self.hot.items() if now - seen <= self.window}
+        if not self.hot:
+            return []
+
+        if self.snapshots:
+            import snapshots
+            snapshots.write_snapshot(dashboard_events.load_db_path(), 'eventnotif')
+        warmed = []
+        for eventid in sorted(self.hot, key=self.hot.get, reverse=True):
+            start = time.time()
+            failed = warm(self.callbacks, eventid)
+            for failure in failed:
+                print(f"{eventid}: {failure}", flush=True)
+            print(f"{eventid}: warmed ({time.time() - start:.2f}s)", flush=True)
+            warmed.append(eventid)
+        return warmed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Warm the result cache for new or updated events")
+    parser.add_argument('--interval', type=float, default=5,
+                        help="seconds between two checks of the data, 0 warms the recent events once")
+    parser.add_argument('--recent', type=int, default=1, help="last updated events warmed at start")
+    parser.add_argument('--window', type=float, default=WINDOW,
+                        help="seconds an event is warmed again after its last update")
+    parser.add_argument('--snapshots', action='store_true',
+                        help="write the Arrow snapshot of eventnotif before warming (snapshots.py)")
+    parser.add_argument('--config', help="combined configuration file of the dashboards, see config.py")
+    args = parser.parse_args()
+    if args.config:
+        os.environ['APP_VIEW_CONFIG'] = os.path.abspath(args.config)
+    warmer = Warmer(args.window, args.recent, args.snapshots)
+    while True:
+        warmer.poll()
+        if not args.interval:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Copyright (C) by ETHZ/SED
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published
+by the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+Production entry point of the three dashboards.
+
+It exposes the Flask `server` of main.py so that any WSGI server can run it
+with several workers, for instance:
+
+    gunicorn --workers 4 --threads 2 --bind 0.0.0.0:8055 wsgi:server
+
+Running `python wsgi.py` does the same with gunicorn embedded. The workers
+share the figures they compute through the result cache (result_cache.py).
+"""
+import argparse
+import os
+import tempfile
+from os import path
+
+# The workers publish their metrics in a shared folder, see metrics.py
+os.environ.setdefault('APP_VIEW_METRICS_DIR', path.join(tempfile.gettempdir(), 'app_view_metrics'))
+
+import metrics  # noqa: E402
+from main import app  # noqa: E402
+
+server = app.server
+
+
+def run(bind, workers, threads, timeout):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("gunicorn is required to run several workers: pip install gunicorn")
+
+    class DashboardApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', bind)
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('timeout', timeout)
+            self.cfg.set('on_starting', lambda arbiter: metrics.reset_metrics_dir())
+
+        def load(self):
+            return server
+
+    DashboardApplication().run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the dashboards with several workers")
+    parser.add_argument('--bind', default=os.environ.get('APP_VIEW_BIND', '0.0.0.0:8055'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('APP_VIEW_WORKERS', 4)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('APP_VIEW_THREADS', 2)))
+    parser.add_argument('--timeout', type=int, default=120)
+    parser.add_argument('--config', help="combined configuration file of the dashboards, see config.py")
+    args = parser.parse_args()
+    if args.config:
+        # Inherited by the forked workers
+        os.environ['APP_VIEW_CONFIG'] = path.abspath(args.config)
+    run(args.bind, args.workers, args.threads, args.timeout)